@@ -24,6 +24,9 @@ def gcode_2_fcode(params=None, input=None, output=None):
     parser.add_argument('--fmd', dest='filament_detect', type=str,
                         default=None, choices=['Y', 'N'],
                         help='Set filament detect, only for extruder type')
+    parser.add_argument('-j', dest='processes', type=int, default=1,
+                        help='Number of processes reading input gcode file, '
+                             '0 for cpu count, default is 1')
     parser.add_argument(dest='output', type=str, nargs="?",
                         help='Ouput fcode file')
 
@@ -54,7 +57,10 @@ def gcode_2_fcode(params=None, input=None, output=None):
             input = sys.stdin
 
         conv = GcodeToFcode(ext_metadata=ext_metadata)
-        conv.process(input, output)
+        if options.input and options.processes != 1:
+            conv.process_file(options.input, output, options.processes or None)
+        else:
+            conv.process(input, output)
 
     finally:
         input.close()
@@ -1,6 +1,6 @@
 # !/usr/bin/env python3
 
-from zipfile import crc32
+from zlib import crc32
 import struct
 import sys
 from threading import Thread
@@ -10,6 +10,9 @@ from fluxclient.hw_profile import HW_PROFILE
 
 FILE_BROKEN = "FILE_BROKEN"
 FCODE_FAIL = "FCODE_FAIL"
+CHECK_CHUNK = 1024 * 1024  # bytes fed to crc32 at once when validating
+MAX_METADATA_SIZE = 1024 * 1024  # larger metadata is taken as broken by validate_fcode, it's a few KB normally
+FLOAT_METADATA = ('MAX_X', 'MAX_Y', 'MAX_Z', 'MAX_R', 'TIME_COST', 'TRAVEL_DIST')  # converted to float by validate_fcode
 uint_unpacker = lambda x: struct.Struct("<I").unpack(x)[0]  # 4 bytes uint
 uchar_unpacker = lambda x: struct.Struct("<B").unpack(x)[0]  # 1 byte uchar, use for command
 float_unpacker = lambda x: struct.Struct("<f").unpack(x)[0]  # 4 bytes float
@@ -33,6 +36,119 @@ def num_to_XYZE(command):
     return tmp
 
 
+def parse_metadata(meta_buf):
+    """
+    parse metadata block of fcode
+    dict [return]: metadata, a dict object like this {"AUTHOR": "Yen", "HEAD_TYPE": "EXTRUDER"}
+    """
+    metadata = {}
+    for item in meta_buf.split(b"\x00"):
+        itme = item.split(b"=", 1)
+        if len(itme) == 2:
+            metadata[itme[0].decode()] = itme[1].decode()
+    return metadata
+
+
+def check_bounds(md):
+    """
+    check whether metadata MAX_X, MAX_Y, MAX_R, MAX_Z are inside the machine
+    return 'ok' or 'out_of_bound'
+    """
+    if float(md.get('MAX_X', 0)) > HW_PROFILE['model-1']['radius']:
+        return 'out_of_bound'
+    elif float(md.get('MAX_Y', 0)) > HW_PROFILE['model-1']['radius']:
+        return 'out_of_bound'
+    elif float(md.get('MAX_R', 0)) > HW_PROFILE['model-1']['radius']:
+        return 'out_of_bound'
+    elif float(md.get('MAX_Z', 0)) > HW_PROFILE['model-1']['height'] or float(md.get('MAX_Z', 0)) < 0:
+        return 'out_of_bound'
+    else:
+        return 'ok'
+
+
+def validate_fcode(source, check_crc=True, chunk_size=CHECK_CHUNK):
+    """
+    validate fcode from a file without loading it into memory
+    source[in]: path to .fcode, or a binary stream(socket file that can't seek works too)
+    check_crc[in]: check crc of script, if False and source can seek the script is skipped without reading
+    return (result, metadata)
+      result: 'ok', 'broken' or 'out_of_bound'(same as FcodeToGcode.upload_content)
+      metadata: dict of metadata, with MAX_X, MAX_Y, MAX_Z, MAX_R, TIME_COST, TRAVEL_DIST in float
+                None if broken before metadata is read
+    header, script crc, metadata crc, preview length are checked, metadata bounds are checked
+    before reading the script if source can seek
+    sizes in the file are checked against its length(if source can seek) and MAX_METADATA_SIZE before reading,
+    memory used doesn't depend on the file
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return validate_fcode(f, check_crc, chunk_size)
+
+    def read(size):
+        buf = source.read(size)
+        if len(buf) != size:
+            raise EOFError()
+        return buf
+
+    def read_crc(size):
+        crc = 0
+        while size > 0:
+            buf = read(min(size, chunk_size))
+            crc = crc32(buf, crc)
+            size -= len(buf)
+        return crc
+
+    seekable = getattr(source, 'seekable', lambda: False)()
+    metadata = None
+    try:
+        if read(8) != b"FCx0001\n":
+            return 'broken', None
+        script_size = uint_unpacker(read(4))
+
+        if seekable:  # read metadata first, bounds can be rejected without reading the script
+            length = source.seek(0, 2)
+            if length < 24 + script_size:  # header, script, crc, metadata size and crc
+                return 'broken', None
+            source.seek(16 + script_size)
+        elif check_crc:
+            script_crc = read_crc(script_size)
+            script_ok = script_crc == uint_unpacker(read(4))
+        else:
+            read_crc(script_size + 4)  # can only read through it
+
+        meta_size = uint_unpacker(read(4))
+        if meta_size > MAX_METADATA_SIZE or (seekable and length < 24 + script_size + meta_size):
+            return 'broken', None
+        meta_buf = read(meta_size)
+        if crc32(meta_buf) != uint_unpacker(read(4)):
+            return 'broken', None
+        metadata = parse_metadata(meta_buf)
+        for key in FLOAT_METADATA:
+            if key in metadata:
+                metadata[key] = float(metadata[key])
+
+        image_size = uint_unpacker(read(4))
+        if seekable:
+            if length < 28 + script_size + meta_size + image_size:
+                return 'broken', metadata
+        else:
+            read_crc(image_size)
+
+        result = check_bounds(metadata)
+        if result != 'ok':
+            return result, metadata
+
+        if check_crc:
+            if seekable:
+                source.seek(12)
+                script_ok = read_crc(script_size) == uint_unpacker(read(4))
+            if not script_ok:
+                return 'broken', metadata
+        return 'ok', metadata
+    except (EOFError, ValueError, UnicodeDecodeError, MemoryError, OverflowError):
+        return 'broken', metadata
+
+
 class FcodeToGcode(FcodeBase):
     def __init__(self, buf=''):
         super(FcodeToGcode, self).__init__()
@@ -56,22 +172,12 @@ class FcodeToGcode(FcodeBase):
             tmp_data = self.data
             self.data = buf
             if self.full_check():
-                md = self.get_metadata()
-                if float(md.get('MAX_X', 0)) > HW_PROFILE['model-1']['radius']:
-                    return 'out_of_bound'
-                elif float(md.get('MAX_Y', 0)) > HW_PROFILE['model-1']['radius']:
-                    return 'out_of_bound'
-                elif float(md.get('MAX_R', 0)) > HW_PROFILE['model-1']['radius']:
-                    return 'out_of_bound'
-                elif float(md.get('MAX_Z', 0)) > HW_PROFILE['model-1']['height'] or float(md.get('MAX_Z', 0)) < 0:
-                    return 'out_of_bound'
-                else:
-                    return 'ok'
+                return check_bounds(self.get_metadata())
             else:
                 self.data = tmp_data
                 return 'broken'
         elif type(buf) == str:
-            with open(sys.argv[1], 'rb') as f:
+            with open(buf, 'rb') as f:
                 return self.upload_content(f.read())
 
     def full_check(self):
@@ -82,11 +188,12 @@ class FcodeToGcode(FcodeBase):
         try:
             assert self.data[:8] == b"FCx0001\n"
             self.script_size = uint_unpacker(self.data[8:12])
-            assert crc32(self.data[12:12 + self.script_size]) == uint_unpacker(self.data[12 + self.script_size:16 + self.script_size])
+            data = memoryview(self.data)  # crc32 without copying the script
+            assert crc32(data[12:12 + self.script_size]) == uint_unpacker(self.data[12 + self.script_size:16 + self.script_size])
             index = 16 + self.script_size
             self.meta_size = uint_unpacker(self.data[index:index + 4])
             index += 4
-            assert crc32(self.data[index:index + self.meta_size]) == uint_unpacker(self.data[index + self.meta_size:index + self.meta_size + 4])
+            assert crc32(data[index:index + self.meta_size]) == uint_unpacker(self.data[index + self.meta_size:index + self.meta_size + 4])
             index = index + self.meta_size + 4
             self.image_size = uint_unpacker(self.data[index:index + 4])
             index += 4
@@ -122,12 +229,7 @@ class FcodeToGcode(FcodeBase):
         if self.data:
             if self.metadata is None:
                 meta_buf = self.data[20 + self.script_size:20 + self.script_size + self.meta_size]
-                metadata = {}
-                for item in meta_buf.split(b"\x00"):
-                    itme = item.split(b"=", 1)
-                    if len(itme) == 2:
-                        metadata[itme[0].decode()] = itme[1].decode()
-                self.metadata = metadata
+                self.metadata = parse_metadata(meta_buf)
         return self.metadata
 
     def f_to_g(self, outstream, include_meta=False):
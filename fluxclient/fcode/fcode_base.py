@@ -3,10 +3,16 @@
 import sys
 from re import findall
 from json import dumps
+from array import array
+
+import numpy as np
 
 from fluxclient.hw_profile import HW_PROFILE
 from fluxclient.utils._utils import Tools
 
+PREVIEW_MAGIC = b'FPV1'  # binary preview format, see PathStore.to_binary
+PREVIEW_QUANTIZED = 1  # flag, vertices are int16
+
 # define point type
 POINT_TYPE = {'new layer': -1,
               'infill': 0,
@@ -21,6 +27,207 @@ POINT_TYPE = {'new layer': -1,
               }
 
 
+class PathStore(object):
+    """
+    compact toolpath for visualizing, replacing the list of layers of [x, y, z, type]
+    points(float32 x, y, z) and types(uint8, see POINT_TYPE) are kept in growable arrays,
+    layer i is point offsets[i] to offsets[i + 1](offsets[-1] is the end of the last layer)
+
+    numpy arrays from xyz_array(), types_array(), layer() are views sharing memory with the store,
+    the store can't grow while any of them is alive
+    """
+    def __init__(self, point=None, line_type=None):
+        self.xyz = array('f')
+        self.types = array('B')
+        self.offsets = [0, 0]
+        self.stop = None  # end of the last layer, None: end of arrays(the store is still growing)
+        if point is not None:
+            self.append(point, line_type)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getstate__(self):
+        # only pickle the part in use
+        offsets = self.get_offsets()
+        begin, end = offsets[0], offsets[-1]
+        return {'xyz': self.xyz[begin * 3:end * 3], 'types': self.types[begin:end],
+                'offsets': [i - begin for i in offsets], 'stop': None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def get_offsets(self):
+        """
+        offsets of layers, including the end of last layer
+        """
+        if self.stop is None:
+            self.offsets[-1] = len(self.types)
+        else:
+            self.offsets[-1] = self.stop
+        return self.offsets
+
+    def append(self, point, line_type):
+        """
+        append a point to the last layer
+        point[in]: [x, y, z, ...]
+        """
+        self.xyz.extend(point[:3])
+        self.types.append(line_type)
+
+    def new_layer(self, line_type):
+        """
+        start a new layer from the last point, with line_type
+        """
+        self.offsets[-1] = len(self.types)
+        self.offsets.append(0)
+        self.xyz.extend(self.xyz[-3:])
+        self.types.append(line_type)
+
+    def last_point(self):
+        """
+        [x, y, z] of the last point
+        """
+        return self.xyz[-3:].tolist()
+
+    def xyz_array(self):
+        return np.frombuffer(self.xyz, np.float32).reshape(-1, 3)
+
+    def types_array(self):
+        return np.frombuffer(self.types, np.uint8)
+
+    def offsets_array(self):
+        return np.array(self.get_offsets(), np.int64)
+
+    def layer(self, index):
+        """
+        return (xyz, types) of a layer, numpy views of float32 (n, 3) and uint8 (n,)
+        """
+        offsets = self.get_offsets()
+        index = range(len(self))[index]
+        begin, end = offsets[index], offsets[index + 1]
+        return self.xyz_array()[begin:end], self.types_array()[begin:end]
+
+    def to_list(self):
+        """
+        the old list form: [[[x, y, z, type], ...], ...]
+        """
+        offsets = self.get_offsets()
+        xyz = self.xyz.tolist()
+        types = self.types.tolist()
+        return [[xyz[i * 3:i * 3 + 3] + [types[i]] for i in range(begin, end)]
+                for begin, end in zip(offsets[:-1], offsets[1:])]
+
+    def to_js(self):
+        """
+        path in javascript string, same as Tools().path_to_js(self.to_list())
+        """
+        return Tools().path_array_to_js(self.xyz_array(), self.types_array(), self.offsets_array()).decode()
+
+    def to_binary(self, quantize=True, tolerance=0.):
+        """
+        path in compact binary form for previewing, little endian:
+          magic 'FPV1', uint32 flags, uint32 point count(n), uint32 layer count(m)
+          float32 scale[3], float32 origin[3]
+          vertices: int16 (n, 3) if flags & PREVIEW_QUANTIZED(x = (q + 32768) * scale + origin), else float32 (n, 3)
+          types: uint8 (n,), then padding to 4 bytes
+          layer index: uint32 (m + 1,), first point of each layer and the end of last layer
+        quantize[in]: store vertices in int16
+        tolerance[in]: level of detail in mm, if > 0 points closer than it along the path are dropped
+                       (first and last point of each layer and points where type changes are kept)
+        """
+        xyz = self.xyz_array()
+        types = self.types_array()
+        offsets = self.offsets_array()
+        begin, end = offsets[0], offsets[-1]
+        xyz, types, offsets = xyz[begin:end], types[begin:end], offsets - begin
+
+        if tolerance > 0 and len(types):
+            keep = np.zeros(len(types), bool)
+            keep[offsets[:-1][offsets[:-1] < len(types)]] = True
+            keep[offsets[1:] - 1] = True
+            keep[:-1] |= types[:-1] != types[1:]  # segment type is at its end point
+            step = np.zeros(len(types))
+            step[1:] = np.sqrt((np.diff(xyz, axis=0).astype(np.float64) ** 2).sum(axis=1))
+            bucket = np.floor(np.cumsum(step) / tolerance)
+            keep[1:] |= bucket[1:] != bucket[:-1]
+            offsets = np.cumsum(np.append(0, keep))[offsets]
+            xyz, types = xyz[keep], types[keep]
+
+        if quantize and len(types):
+            origin = xyz.min(axis=0)
+            scale = np.maximum(xyz.max(axis=0) - origin, 1e-6) / 65535
+            vertices = (np.round((xyz - origin) / scale) - 32768).astype('<i2')
+            flags = PREVIEW_QUANTIZED
+        else:
+            origin = scale = np.zeros(3)
+            vertices = xyz.astype('<f4')
+            flags = 0
+
+        n, m = len(types), len(offsets) - 1
+        return b''.join([PREVIEW_MAGIC, np.array([flags, n, m], '<u4').tobytes(),
+                         np.append(scale, origin).astype('<f4').tobytes(),
+                         vertices.tobytes(), types.tobytes(), b'\x00' * (-n % 4),
+                         offsets.astype('<u4').tobytes()])
+
+    @classmethod
+    def from_binary(cls, buf):
+        """
+        read a path from the binary form made by to_binary
+        """
+        if buf[:4] != PREVIEW_MAGIC:
+            raise RuntimeError('not a binary preview')
+        flags, n, m = np.frombuffer(buf, '<u4', 3, 4).tolist()
+        scale, origin = np.frombuffer(buf, '<f4', 6, 16).reshape(2, 3)
+        index = 40
+        if flags & PREVIEW_QUANTIZED:
+            xyz = (np.frombuffer(buf, '<i2', n * 3, index).reshape(-1, 3) + 32768.) * scale + origin
+            index += n * 6
+        else:
+            xyz = np.frombuffer(buf, '<f4', n * 3, index)
+            index += n * 12
+        types = np.frombuffer(buf, np.uint8, n, index)
+        index += n + (-n % 4)
+        path = cls()
+        path.xyz = array('f', xyz.astype(np.float32).tobytes())
+        path.types = array('B', types.tobytes())
+        path.offsets = np.frombuffer(buf, '<u4', m + 1, index).tolist()
+        path.stop = path.offsets[-1]
+        return path
+
+    def trim_ends(self):
+        """
+        trim the moving(non-extruding) part in path's both end
+        return a new PathStore sharing the arrays with this one
+        """
+        offsets = self.get_offsets()[:]
+        types = self.types
+        while len(offsets) > 1:  # first layer
+            if offsets[1] - offsets[0] >= 2:
+                # type of an edge is at its end point
+                if types[offsets[0] + 1] == POINT_TYPE['move']:
+                    offsets[0] += 1
+                else:
+                    break
+            else:
+                offsets.pop(0)
+        while len(offsets) > 1:  # last layer
+            if offsets[-1] - offsets[-2] >= 2:
+                if types[offsets[-1] - 1] == POINT_TYPE['move']:
+                    offsets[-1] -= 1
+                else:
+                    break
+            else:
+                offsets.pop()
+
+        path = PathStore()
+        path.xyz = self.xyz
+        path.types = self.types
+        path.offsets = offsets if len(offsets) > 1 else [0, 0]
+        path.stop = path.offsets[-1]
+        return path
+
+
 class FcodeBase(object):
     """
     class dealing with gcode <-> fcode... etc
@@ -30,7 +237,7 @@ class FcodeBase(object):
         super(FcodeBase, self).__init__()
         self.filament_this_layer = [0., 0., 0.]
         self.current_pos = [0.0, 0.0, HW_PROFILE['model-1']['height'], 0.0, 0.0, 0.0]  # X, Y, Z, E1, E2, E3 -> recording the position of each axis
-        self.path = [[[0.0, 0.0, HW_PROFILE['model-1']['height'], POINT_TYPE['move']]]]  # recording the path extruder go through
+        self.path = PathStore([0.0, 0.0, HW_PROFILE['model-1']['height']], POINT_TYPE['move'])  # recording the path extruder go through
         self.empty_layer = []
         self.counter_between_layers = 0
         self.record_z = 0.0
@@ -40,17 +247,25 @@ class FcodeBase(object):
 
     def sub_convert_path(self):
         # self.path_js = FcodeBase.path_to_js(self.path)
-        self.path_js = Tools().path_to_js(self.path).decode()
+        self.path_js = self.path.to_js()
 
-    def get_path(self, path_type='js'):
+    def get_path(self, path_type='js', tolerance=0.):
+        """
+        path_type[in]: 'js' for javascript string, 'binary' for compact binary form(see PathStore.to_binary),
+                       'store' for the PathStore itself, anything else for list of layers of [x, y, z, type]
+        tolerance[in]: level of detail of binary form, in mm
+        """
         if path_type == 'js':
             self.T.join()
             return self.path_js
+        elif path_type == 'binary':
+            return self.path.to_binary(tolerance=tolerance)
+        elif not self.path:
+            return None
+        elif path_type == 'store':
+            return self.path
         else:
-            if self.path:
-                return self.path
-            else:
-                return None
+            return self.path.to_list()
 
     def process_path(self, comment, move_flag, extrude_flag):
         """
@@ -76,7 +291,7 @@ class FcodeBase(object):
                         tmp = findall('[0-9]+', comment)[-1]
                         self.counter_between_layers = 0
                         self.layer_now = int(tmp)
-                        self.path.append([self.path[-1][-1][:3] + [line_type]])
+                        self.path.new_layer(line_type)
                         self.filament_this_layer = self.filament[:]
                 elif 'perimeter' in comment:
                     line_type = POINT_TYPE['perimeter']
@@ -90,10 +305,10 @@ class FcodeBase(object):
                     else:
                         line_type = POINT_TYPE['move']
 
-                self.path[-1].append(self.current_pos[:3] + [line_type])
+                self.path.append(self.current_pos, line_type)
 
                 if len(comment) == 0 and not already_split and self.current_pos[2] - self.record_z > 0.3:  # 0.3 is the max layer height in fluxstudio
-                    self.path.append([self.path[-1][-1][:3] + [line_type]])
+                    self.path.new_layer(line_type)
                     self.record_z = self.current_pos[2]
                     self.layer_now = len(self.path)
 
@@ -111,7 +326,7 @@ class FcodeBase(object):
                 self.counter_between_layers = 0
                 # self.layer_now = int(tmp)
                 self.layer_now = len(self.path)
-                self.path.append([self.path[-1][-1][:3] + [self.now_type]])
+                self.path.new_layer(self.now_type)
                 self.filament_this_layer = self.filament[:]
 
             if move_flag:
@@ -123,7 +338,7 @@ class FcodeBase(object):
                 elif not extrude_flag:
                     line_type = POINT_TYPE['move']
 
-                self.path[-1].append(self.current_pos[:3] + [line_type])
+                self.path.append(self.current_pos, line_type)
 
     @classmethod
     def path_to_js(cls, path):
@@ -142,6 +357,8 @@ class FcodeBase(object):
         """
         trim the moving(non-extruding) part in path's both end
         """
+        if isinstance(path, PathStore):
+            return path.trim_ends()
         for layer in [0, -1]:
             while True:
                 if len(path[layer]) >= 2:
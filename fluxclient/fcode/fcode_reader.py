@@ -0,0 +1,229 @@
+# !/usr/bin/env python3
+
+from mmap import mmap, ACCESS_READ
+from zlib import crc32
+import struct
+
+import numpy as np
+
+from fluxclient.fcode.f_to_g import FILE_BROKEN, FCODE_FAIL, CHECK_CHUNK, parse_metadata
+
+HEADER = b"FCx0001\n"
+
+# moves as numpy record, axis is nan if not given in the command
+MOVE_DTYPE = np.dtype([('index', '<u4'),  # index of the command in script
+                       ('F', '<f4'), ('X', '<f4'), ('Y', '<f4'), ('Z', '<f4'),
+                       ('E1', '<f4'), ('E2', '<f4'), ('E3', '<f4')])
+AXES = MOVE_DTYPE.names[1:]
+
+
+def _command_size(command):
+    """
+    size in bytes of a command(including the command byte itself)
+    0 for raw command that ends with '\\n', -1 for unknown command
+    """
+    if command in (1, 2, 3, 5):
+        return 1
+    elif command in (6, 7):
+        return 0
+    elif command == 4 or 16 <= command <= 39 or 48 <= command <= 63:
+        return 5
+    elif 64 <= command <= 127:  # set position
+        return 1 + 4 * bin(command & 63).count('1')
+    elif command >= 128:  # moving
+        return 1 + 4 * bin(command & 127).count('1')
+    return -1
+
+COMMAND_SIZE = [_command_size(c) for c in range(256)]
+
+# AXIS_OFFSET[command, i]: offset of axis i [F, X, Y, Z, E1, E2, E3] from a moving command's beginning, -1 if not given
+AXIS_OFFSET = np.full((256, 7), -1, np.int64)
+for _c in range(128, 256):
+    _offset = 1
+    for _i in range(7):
+        if _c & (1 << (6 - _i)):
+            AXIS_OFFSET[_c, _i] = _offset
+            _offset += 4
+
+
+class FcodeReader(object):
+    """
+    read a .fcode file through mmap, without loading it into memory
+    metadata and preview are read without touching the script,
+    script is indexed in one pass when needed(offset of every command and where each layer starts),
+    moves can then be read layer by layer as numpy record arrays(MOVE_DTYPE)
+
+    reader = FcodeReader('a.fcode')
+    reader.get_metadata()
+    for moves in reader.iter_layers():
+        moves['X'], moves['Y']
+    """
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        try:
+            self.data = mmap(self.f.fileno(), 0, access=ACCESS_READ)
+        except ValueError:  # empty file
+            self.f.close()
+            raise RuntimeError(FILE_BROKEN)
+        self.metadata = None
+        self.offsets = None  # offset of each command in file
+        self.commands = None  # each command byte
+        self.layers = None  # index(in self.offsets) of the first command of each layer
+        try:
+            if self.data[:8] != HEADER:
+                raise RuntimeError(FILE_BROKEN)
+            self.script_size = self.read_uint(8)
+            self.meta_size = self.read_uint(16 + self.script_size)
+            self.image_size = self.read_uint(24 + self.script_size + self.meta_size)
+            if 28 + self.script_size + self.meta_size + self.image_size > len(self.data):
+                raise RuntimeError(FILE_BROKEN)
+        except (RuntimeError, struct.error):
+            self.close()
+            raise RuntimeError(FILE_BROKEN)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.offsets = self.commands = self.layers = None
+        self.data.close()
+        self.f.close()
+
+    def read_uint(self, index):
+        return struct.unpack_from('<I', self.data, index)[0]
+
+    def check(self):
+        """
+        check crc of script and metadata, script is read CHECK_CHUNK bytes at a time
+        bool [return]: whether it's valid fcode
+        """
+        view = memoryview(self.data)
+        try:
+            crc = 0
+            for index in range(12, 12 + self.script_size, CHECK_CHUNK):
+                crc = crc32(view[index:min(index + CHECK_CHUNK, 12 + self.script_size)], crc)
+            if crc != self.read_uint(12 + self.script_size):
+                return False
+            index = 20 + self.script_size
+            return crc32(view[index:index + self.meta_size]) == self.read_uint(index + self.meta_size)
+        finally:
+            view.release()
+
+    def get_metadata(self):
+        """
+        get the metadata
+        dict [return]: metadata, a dict object like this {"AUTHOR": "Yen", "HEAD_TYPE": "EXTRUDER"}
+        """
+        if self.metadata is None:
+            self.metadata = parse_metadata(self.data[20 + self.script_size:20 + self.script_size + self.meta_size])
+        return self.metadata
+
+    def get_img(self):
+        """
+        get the .png preview image(should be 640 * 640) in fcode, in bytes
+        """
+        index = 28 + self.script_size + self.meta_size
+        return self.data[index:index + self.image_size]
+
+    def build_index(self):
+        """
+        find the offset of every command and where each layer starts, in one pass
+        a new layer starts at the command setting a Z higher than any Z extruded on so far,
+        so z-hops while traveling doesn't count
+        raise RuntimeError(FCODE_FAIL) if there's unknown command
+        """
+        if self.offsets is not None:
+            return
+        data = self.data
+        size = COMMAND_SIZE
+        offsets = []
+        append = offsets.append
+        index = 12
+        end = 12 + self.script_size
+        while index < end:
+            append(index)
+            s = size[data[index]]
+            if s > 0:
+                index += s
+            elif s == 0:  # raw command, ends with '\n'
+                index = data.find(b'\n', index + 1, end) + 1
+                if index == 0:
+                    raise RuntimeError(FCODE_FAIL)
+            else:
+                raise RuntimeError(FCODE_FAIL)
+        if index != end:
+            raise RuntimeError(FCODE_FAIL)
+
+        self.offsets = np.array(offsets, np.int64)
+        self.commands = np.frombuffer(data, np.uint8, count=end)[self.offsets]
+
+        moves = np.flatnonzero(self.commands >= 128)
+        values = self.read_values(moves)
+        # Z in relative mode(after G91) is not a height, ignore it
+        mode = np.flatnonzero((self.commands == 2) | (self.commands == 3))
+        last_mode = mode[np.maximum(np.searchsorted(mode, moves) - 1, 0)] if len(mode) else moves
+        relative = (last_mode < moves) & (self.commands[last_mode] == 3)
+        z_given = ~np.isnan(values[:, 3]) & ~relative
+        # index of the move setting current Z, and current Z itself
+        z_from = np.maximum.accumulate(np.where(z_given, np.arange(len(moves)), -1)) if len(moves) else moves
+        z = np.where(z_from >= 0, values[z_from, 3], -np.inf)
+        extrude = (~np.isnan(values[:, 4:])).any(axis=1) & (~np.isnan(values[:, 1:3])).any(axis=1)
+        printed = z[extrude]
+        new_layer = printed[1:] > np.maximum.accumulate(printed)[:-1]
+        starts = z_from[extrude][1:][new_layer]
+        self.layers = np.concatenate(([0], moves[starts])).astype(np.int64)
+
+    def read_values(self, index):
+        """
+        read axis values of moving commands
+        index[in]: index of the commands(in self.offsets)
+        return float32 array (n, 7) in [F, X, Y, Z, E1, E2, E3] order, nan if not given
+        """
+        offset = AXIS_OFFSET[self.commands[index]]
+        given = offset >= 0
+        position = (self.offsets[index][:, None] + offset)[given]
+        buf = np.frombuffer(self.data, np.uint8, count=12 + self.script_size)
+        values = np.full(offset.shape, np.nan, np.float32)
+        values[given] = buf[position[:, None] + np.arange(4)].view('<f4')[:, 0]
+        return values
+
+    def layer_count(self):
+        self.build_index()
+        return len(self.layers)
+
+    def layer_range(self, layer):
+        """
+        return [begin, end) index of commands in layer
+        """
+        self.build_index()
+        begin = self.layers[layer]
+        end = self.layers[layer + 1] if layer + 1 < len(self.layers) else len(self.offsets)
+        return int(begin), int(end)
+
+    def get_moves(self, layer=None):
+        """
+        get moving commands as a numpy record array(MOVE_DTYPE)
+        layer[in]: layer number, None for whole script
+        """
+        self.build_index()
+        if layer is None:
+            begin, end = 0, len(self.offsets)
+        else:
+            begin, end = self.layer_range(layer)
+        index = begin + np.flatnonzero(self.commands[begin:end] >= 128)
+        moves = np.empty(len(index), MOVE_DTYPE)
+        moves['index'] = index
+        values = self.read_values(index)
+        for i, axis in enumerate(AXES):
+            moves[axis] = values[:, i]
+        return moves
+
+    def iter_layers(self, start=0):
+        """
+        iterate moves layer by layer, from layer start
+        """
+        for layer in range(start, self.layer_count()):
+            yield self.get_moves(layer)
@@ -4,17 +4,48 @@ import logging
 import struct
 import sys
 from zlib import crc32
-from math import sqrt, sin, cos, pi, atan2
+from math import sqrt, sin, cos, pi, atan2, acos, ceil
 import time
+import re
 from re import findall
+import os
+from io import BytesIO, TextIOWrapper
+from mmap import mmap, ACCESS_READ
+from multiprocessing import Pool, cpu_count
+from itertools import islice
+from collections import deque
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile
 from getpass import getuser
 from threading import Thread
 
+import numpy as np
+
 from fluxclient.fcode.fcode_base import FcodeBase, POINT_TYPE
 from fluxclient.hw_profile import HW_PROFILE
 
 logger = logging.getLogger(__name__)
 
+packer = lambda x: struct.pack('<B', x)  # easy alias for struct.pack('<B', x)
+packer_f = lambda x: struct.pack('<f', x)  # easy alias for struct.pack('<f', x)
+
+BLOCK_LINES = 65536  # lines read at once by process
+CHUNK_SIZE = 4 * 1024 * 1024  # bytes of gcode tokenized at once by a worker in process_file
+LAYER_MARKS = (b'to next layer', b';LAYER:')  # layer change comments of slic3r and cura, see FcodeBase.process_path
+SPOOL_SIZE = 8 * 1024 * 1024  # fcode for a stream can't seek is kept in memory up to this size, then on disk
+ARC_TOLERANCE = 0.01  # default chord error of G2/G3, in mm
+ARC_MAX_SEGMENTS = 1000  # max G1 segments of one G2/G3
+SETTING_COMMENTS = 137  # number of comments at the end of gcode kept in metadata SETTING
+MIN_VECTOR_MOVES = 24  # shorter runs of moves are converted line by line, numpy costs more for them
+
+# token kind of a gcode line
+OTHER = 0
+MOVE = 1
+
+# a G0/G1 line made of nothing but [FXYZE] words, that is exactly what findall in process_line would split
+# (repeated words: the last one wins, just like XYZEF)
+MOVE_RE = re.compile(r'\s*G[01](?:\s*(?:F(?P<F>{0})|X(?P<X>{0})|Y(?P<Y>{0})|Z(?P<Z>{0})|E(?P<E>{0})))*\s*'.format(r'[+-]?[0-9]+[.]?[0-9]*'))
+
 
 class GcodeToFcode(FcodeBase):
     """transform from gcode to fcode
@@ -47,6 +78,7 @@ class GcodeToFcode(FcodeBase):
         self.md.update(ext_metadata)
 
         self.record_path = True  # to speed up, set this flag to False
+        self.arc_tolerance = ARC_TOLERANCE  # max distance between G2/G3 arc and the G1 segments it split into, in mm
         self.layer_now = 0  # record the current layer toolhead is
 
         self.config = None  # config dict(given from fluxstudio)
@@ -117,7 +149,6 @@ class GcodeToFcode(FcodeBase):
         return command, number
 
     def G2_G3(self, input_list):
-        sample_n = 100
         if input_list[0] == 'G2':
             clock = True
         else:
@@ -135,33 +166,37 @@ class GcodeToFcode(FcodeBase):
 
         p_1 = self.current_pos[:3]
 
-        E_index = None
-        for i in range(4, len(d)):
-            if d[i] is not None:
-                E_index = i
-        E_split = [None] * 3
-        E_final = [None] * 3
         p_2 = p_1[:]
         if self.absolute:
             # p_2 = d[1:4]
             for k in range(1, 4):
                 if d[k]:
                     p_2[k - 1] = d[k]
-            if E_index:
-                E_split[E_index - 4] = (d[E_index] - self.current_pos[E_index - 1]) / sample_n
-                E_final = d[4:]
         else:
             for k in range(1, 4):
                 if d[k]:
                     p_2[k - 1] = self.current_pos[k - 1] + d[k]
             # p_2 = [self.current_pos[i] + d[i + 1] for i in range(3)]
-            if E_index:
-                E_split[E_index - 4] = d[E_index] / sample_n
-                E_final[E_index - 4] = d[E_index] + self.current_pos[E_index - 1]
 
         p_c = [p_1[i] + c_delta[i] for i in range(3)]
 
-        sub_g1 = arc(p_1, p_2, p_c, clock, sample_n)
+        sub_g1 = arc(p_1, p_2, p_c, clock, tolerance=self.arc_tolerance).tolist()
+        sample_n = len(sub_g1) - 1
+
+        E_index = None
+        for i in range(4, len(d)):
+            if d[i] is not None:
+                E_index = i
+        E_split = [None] * 3
+        E_final = [None] * 3
+        if self.absolute:
+            if E_index:
+                E_split[E_index - 4] = (d[E_index] - self.current_pos[E_index - 1]) / sample_n
+                E_final = d[4:]
+        else:
+            if E_index:
+                E_split[E_index - 4] = d[E_index] / sample_n
+                E_final[E_index - 4] = d[E_index] + self.current_pos[E_index - 1]
         for i in range(3, 7):
             command |= (1 << i)  # F, X, Y, Z
 
@@ -249,12 +284,45 @@ class GcodeToFcode(FcodeBase):
         stream.write(buf)
         self.crc = crc32(buf, self.crc)
 
-    def process(self, input_stream, output_stream):
+    def process(self, input_stream, output_stream, block_lines=BLOCK_LINES):
         """
         Process a input_stream consist of gcode strings and write the fcode into output_stream
+        input_stream is read in blocks of block_lines lines,
+        G0/G1 in a block are tokenized together and converted with array operations,
+        every other command goes through process_line
+        output_stream can be a file or a socket file(see process_blocks)
+        """
+        return self.process_blocks(read_blocks(input_stream, block_lines), output_stream)
+
+    def process_file(self, filename, output_stream, processes=None, chunk_size=CHUNK_SIZE):
+        """
+        Same as process, but read gcode from file filename with a process pool:
+        the file is split at layer changes into chunks of about chunk_size bytes,
+        chunks are read and tokenized by worker processes in parallel,
+        while this process converts them in order(modal state like G90/G91, G92, T, current position
+        is carried from one chunk to the next, so output is the same as process)
+        processes[in]: number of worker processes, default is cpu count
         """
-        packer = lambda x: struct.pack('<B', x)  # easy alias for struct.pack('<B', x)
-        packer_f = lambda x: struct.pack('<f', x)  # easy alias for struct.pack('<f', x)
+        if processes is None:
+            processes = cpu_count()
+        if processes <= 1 or os.path.getsize(filename) <= chunk_size:
+            with open(filename, 'r') as f:
+                return self.process(f, output_stream)
+        return self.process_blocks(read_blocks_parallel(filename, processes, chunk_size), output_stream)
+
+    def process_blocks(self, blocks, output_stream):
+        """
+        Convert blocks of (lines, tokenize_gcode(lines)) and write the fcode into output_stream
+        output_stream can be a file or a socket file, if it can't seek the fcode is spooled first
+        since the script length in header is only known in the end
+        """
+        if not getattr(output_stream, 'seekable', lambda: False)():
+            with SpooledTemporaryFile(SPOOL_SIZE) as spool:
+                ret = self.process_blocks(blocks, spool)
+                if ret is None:
+                    spool.seek(0)
+                    copyfileobj(spool, output_stream)
+                return ret
 
         try:
             output_stream.write(self.header())
@@ -262,239 +330,520 @@ class GcodeToFcode(FcodeBase):
 
             self.script_length = 0  # lengh of script block in fcode
 
-            comment_list = []  # recorad a list of comments wrritten in gcode
+            comment_list = deque(maxlen=SETTING_COMMENTS)  # recorad the last comments wrritten in gcode
 
-            for line in input_stream:
-                if line.startswith(':'):  # visible comment, starts with a ':'
-                    line = ''
-                    comment = line[1:]
-                    comment_list.append(comment)
-                if ';' in line:  # in line comment
-                    line, comment = line.split(';', 1)
-                    comment_list.append(comment)
-                else:
-                    comment = ''
-
-                # split "G1 X2 Y1" into ["G1", "X2", "Y1"]
-                line = findall('[A-Z][+-]?[0-9]+[.]?[0-9]*', line)
-
-                if line:
-                    # move command, put it at first since it's the most likely command
-                    if line[0] == 'G1' or line[0] == 'G0':
-                        subcommand, data = self.XYZEF(line)
-                        # data: [F, X, Y, Z, E1, E2, E3]
-                        if self.absolute:  # dealing with previous G92 command, add the offset back
-                            for i in range(1, 7):
-                                if data[i] is not None:
-                                    data[i] += self.G92_delta[i - 1]
-
-                        # fix on slic3r bug slowing down in raft but not in real printing
-                        if self.config is not None and self.layer_now == int(self.config['raft_layers']) and self.config['flux_first_layer'] == '1':
-                            data[0] = float(self.config['first_layer_speed']) * 60
-                            subcommand |= (1 << 6)
-
-                        # this will change the data base on serveral settings
-                        data = self.analyze_metadata(data, comment)
-                        command = 128 | subcommand
-                        self.writer(packer(command), output_stream)
-
-                        for i in data:
-                            if i is not None:
-                                self.writer(packer_f(i), output_stream)
-
-                    elif line[0] == 'G2' or line[0] == 'G3':
-                        subcommand, sub_g1 = self.G2_G3(line)
-
-                        command = 128 | subcommand
-                        tmp_absolute = self.absolute  # record this flag
-
-                        self.absolute = True
-                        self.writer(packer(2), output_stream)  # set to absolute
-
-                        for data in sub_g1:
-                            # print('d', data)
-                            data = self.analyze_metadata(data, comment)
-                            self.writer(packer(command), output_stream)
-
-                            for i in data:
-                                if i is not None:
-                                    self.writer(packer_f(i), output_stream)
-
-                        if not tmp_absolute:
-                            self.absolute = tmp_absolute
-                            self.writer(packer(3), output_stream)
-
-                    elif line[0] == 'X2':  # laser toolhead command
-                        command = 32  # only one laser so far
-                        self.writer(packer(command), output_stream)
-
-                        if line[1].startswith('O'):
-                            strength = float(line[1].lstrip('O')) / 255.
-                        else:  # bad gcode!!
-                            strength = 0
-                        self.writer(packer_f(strength), output_stream)
-
-                        if 'HEAD_TYPE' not in self.md:
-                            self.md['HEAD_TYPE'] = 'LASER'
-
-                    elif line[0] == 'G28':  # home
-                        self.writer(packer(1), output_stream)
-                        for i in range(2):
-                            self.current_pos[i] = 0
-                        self.current_pos[2] = HW_PROFILE['model-1']['height']
-
-                    elif line[0] == 'G90':  # set to absolute
-                        self.writer(packer(2), output_stream)
-                        self.absolute = True
-                    elif line[0] == 'G91':  # set to relative
-                        self.absolute = False
-                        self.writer(packer(3), output_stream)
-
-                    elif line[0] == 'M82':  # set extruder to absolute
-                        self.extrude_absolute = True
-                    elif line[0] == 'M83':  # set extruder to relative
-                        self.extrude_absolute = False
-
-                    elif line[0] == 'G92':  # set position
-                    # this command will not write into fcode
-                    # but use self.G92_delta to record the position
-                        sub_command, data = self.XYZEF(line)
-                        if all(i is None for i in data):  # A G92 without coordinates will reset all axes to zero.
-                            for i in range(1, 7):
-                                data[i] = 0.0
-                        else:
-                            for i in range(1, len(data)):
-                                if data[i] is not None:
-                                    self.G92_delta[i - 1] = self.current_pos[i - 1] - data[i]
-
-                    elif line[0] == 'G4':  # dwell
-                        self.writer(packer(4), output_stream)
-                        # P:ms or S:sec
-                        for sub_line in line[1:]:
-                            if sub_line.startswith('P'):
-                                ms = float(line[1][1:])
-                            elif sub_line.startswith('S'):
-                                ms = float(line[1][1:]) * 1000
-                        if ms < 0:
-                            ms = 0
-                        self.writer(packer_f(ms), output_stream)
-                        self.time_need += ms / 1000
-
-                    elif line[0] == 'M104' or line[0] == 'M109':  # set extruder temperature
-                        command = 16
-                        if line[0] == 'M109':
-                            command |= (1 << 3)
-                        for i in line:
-                            if i.startswith('S'):
-                                temp = float(i[1:])
-                            elif i.startswith('T'):
-                                self.tool = int(i[1:])
-                                if self.tool > 7 or self.tool < 0:
-                                    raise ValueError('too many extruder! %d' % self.tool)
-                        command |= self.tool
-                        self.writer(packer(command), output_stream)
-                        self.writer(packer_f(temp), output_stream)
-
-                    # set for inch or mm
-                    elif line[0] == 'G20':  # inch
-                        self.unit = 25.4
-                    elif line[0] == 'G21':  # mm
-                        self.unit = 1
-
-                    # change tool
-                    elif line[0] == 'T0':
-                        self.tool = 0
-                    elif line[0] == 'T1':
-                        self.tool = 1
-
-                    elif line[0] == 'M107' or line[0] == 'M106':  # fan control
-                        command = 48
-                        command |= 0  # TODO: change this part, consder muti-fan control protocol
-                        self.writer(packer(command), output_stream)
-                        if line[0] == 'M107':  # close the fan
-                            self.writer(packer_f(0.0), output_stream)
-                        elif line[0] == 'M106':
-                            if len(line) != 1:
-                                self.writer(packer_f(float(line[1][1:]) / 255.), output_stream)
-                            else:
-                                self.writer(packer_f(1.), output_stream)
-
-                    elif line[0] in ['M84', 'M140']:  # loosen the motor
-                        pass  # should only appear when printing done, not define in fcode yet
-
-                    elif line[0] == 'M25':  # pause by gcode
-                        command = 5
-                        self.writer(packer(command), output_stream)
+            block = BytesIO()  # fcode of current block, written to output_stream at once
+            for lines, tokens in blocks:
+                self.process_block(lines, tokens, block, comment_list)
+                output_stream.write(block.getvalue())
+                block.seek(0)
+                block.truncate()
 
-                    else:
-                        if line[0] in ['M400']:  # TODO: define a white list
-                            pass
-                        else:
-                            logger.info('Undefine gcode: {}'.format(line))
+            self.finish(output_stream, comment_list)
+
+        except Exception as e:
+            import traceback
+            logger.info('G_to_F fail')
+            traceback.print_exc(file=sys.stdout)
+            return 'broken'
+
+    def process_block(self, lines, tokens, output_stream, comment_list):
+        """
+        Convert a block of gcode lines, tokens is the result of tokenize_gcode(lines)
+        """
+        kinds, values, comments = tokens
+        done = 0  # lines before it are converted
+        for start, end in zip(*long_move_runs(kinds)):
+            for line in lines[done:start]:
+                self.process_line(line, output_stream, comment_list)
+            if self.process_moves(values[start:end], comments[start:end], output_stream):
+                comment_list.extend(c for c in comments[start:end] if c is not None)
+            else:
+                for line in lines[start:end]:
+                    self.process_line(line, output_stream, comment_list)
+            done = end
+        for line in lines[done:]:
+            self.process_line(line, output_stream, comment_list)
+
+    def process_moves(self, values, comments, output_stream):
+        """
+        Vectorized G0/G1 conversion for a run of moves, equal to calling process_line on each of them
+        values: float array (n, 5), [F, X, Y, Z, E] as written in gcode, nan if not given
+        comments: comment of each line, None if not given
+        return False without doing anything if the run need the line by line path
+        """
+        if self.tool > 2:
+            return False  # let process_line report the bad tool
+        if self.config is not None and (self.config['flux_refill_empty'] == '1' or self.config['flux_first_layer'] == '1'):
+            return False  # these settings rewrite moves depending on previous one
+
+        n = len(values)
+        if (values[:, 0] == 0).any():
+            return False  # F0, let process_line fail on it
+        data = np.full((n, 7), np.nan)  # [F, X, Y, Z, E1, E2, E3]
+        data[:, 0] = values[:, 0]
+        data[:, 1:4] = values[:, 1:4] * self.unit
+        data[:, 4 + self.tool] = values[:, 4] * self.unit
+        if self.absolute:  # dealing with previous G92 command, add the offset back
+            data[:, 1:] += self.G92_delta
+        given = ~np.isnan(data)
+        valid = given.copy()  # same as given, but E only counts when > 0
+        valid[:, 4:] &= data[:, 4:] > 0
+
+        # analyze_metadata
+        speed = fill_forward(data[:, :1], [self.current_speed])[:, 0]
+        if self.absolute:
+            pos = fill_forward(np.where(valid[:, 1:], data[:, 1:], np.nan), self.current_pos)
+            delta = np.where(valid[:, 1:], data[:, 1:] - np.vstack((self.current_pos, pos[:-1])), 0.)
+        else:
+            delta = np.where(valid[:, 1:], data[:, 1:], 0.)
+            pos = np.cumsum(np.vstack((self.current_pos, delta)), axis=0)[1:]
+
+        sq = delta[:, :3] ** 2
+        tmp_path = np.sqrt(sq[:, 0] + sq[:, 1] + sq[:, 2])
+
+        self.max_range[:3] = np.maximum(np.where(given[:, 1:4], np.abs(pos[:, :3]), 0.).max(axis=0), self.max_range[:3]).tolist()
+        pos_r = (pos[:, 0] ** 2 + pos[:, 1] ** 2).max()
+        if pos_r > self.max_range[3]:  # compute MAX_R, sqrt() later
+            self.max_range[3] = float(pos_r)
+
+        filament = np.cumsum(np.vstack((self.filament, delta[:, 3:])), axis=0)[1:]
+        distance = np.cumsum(np.append(self.distance, tmp_path))
+        time_need = np.cumsum(np.append(self.time_need, tmp_path / speed * 60))  # from minute to sec
+
+        # pack every command of this run at once
+        command = 128 | (given * (1 << np.arange(6, -1, -1))).sum(axis=1)
+        size = 1 + 4 * given.sum(axis=1)
+        start = np.cumsum(size) - size
+        floats = data[given].astype('<f4')
+        if np.isinf(floats).any():
+            raise OverflowError('float too large to pack with format f')
+        buf = np.empty(start[-1] + size[-1], np.uint8)
+        buf[start] = command
+        slot = np.cumsum(given, axis=1)[given] - 1  # index of each float in its command
+        index = np.repeat(start, size // 4) + 1 + 4 * slot
+        buf[index[:, None] + np.arange(4)] = floats.view(np.uint8).reshape(-1, 4)
+
+        if self.record_path:
+            move = given[:, 1:4].any(axis=1).tolist()
+            extrude = valid[:, 4:].any(axis=1).tolist()
+            pos_l = pos.tolist()
+            filament_l = filament.tolist()
+            for i in range(n):
+                self.current_pos[:] = pos_l[i]
+                self.filament = filament_l[i]
+                self.process_path(comments[i] or '', move[i], extrude[i])
+
+        self.current_speed = float(speed[-1])
+        self.current_pos = pos[-1].tolist()
+        self.filament = filament[-1].tolist()
+        self.distance = float(distance[-1])
+        self.time_need = float(time_need[-1])
+
+        self.writer(buf.tobytes(), output_stream)
+        return True
+
+    def process_line(self, line, output_stream, comment_list):
+        """
+        Process one line of gcode and write the fcode into output_stream
+        """
+        if line.startswith(':'):  # visible comment, starts with a ':'
+            line = ''
+            comment = line[1:]
+            comment_list.append(comment)
+        if ';' in line:  # in line comment
+            line, comment = line.split(';', 1)
+            comment_list.append(comment)
+        else:
+            comment = ''
+
+        # split "G1 X2 Y1" into ["G1", "X2", "Y1"]
+        line = findall('[A-Z][+-]?[0-9]+[.]?[0-9]*', line)
+
+        if line:
+            # move command, put it at first since it's the most likely command
+            if line[0] == 'G1' or line[0] == 'G0':
+                subcommand, data = self.XYZEF(line)
+                # data: [F, X, Y, Z, E1, E2, E3]
+                if self.absolute:  # dealing with previous G92 command, add the offset back
+                    for i in range(1, 7):
+                        if data[i] is not None:
+                            data[i] += self.G92_delta[i - 1]
+
+                # fix on slic3r bug slowing down in raft but not in real printing
+                if self.config is not None and self.layer_now == int(self.config['raft_layers']) and self.config['flux_first_layer'] == '1':
+                    data[0] = float(self.config['first_layer_speed']) * 60
+                    subcommand |= (1 << 6)
+
+                # this will change the data base on serveral settings
+                data = self.analyze_metadata(data, comment)
+                command = 128 | subcommand
+                self.writer(packer(command), output_stream)
+
+                for i in data:
+                    if i is not None:
+                        self.writer(packer_f(i), output_stream)
+
+            elif line[0] == 'G2' or line[0] == 'G3':
+                subcommand, sub_g1 = self.G2_G3(line)
+
+                command = 128 | subcommand
+                tmp_absolute = self.absolute  # record this flag
+
+                self.absolute = True
+                self.writer(packer(2), output_stream)  # set to absolute
+
+                for data in sub_g1:
+                    # print('d', data)
+                    data = self.analyze_metadata(data, comment)
+                    self.writer(packer(command), output_stream)
+
+                    for i in data:
+                        if i is not None:
+                            self.writer(packer_f(i), output_stream)
+
+                if not tmp_absolute:
+                    self.absolute = tmp_absolute
+                    self.writer(packer(3), output_stream)
+
+            elif line[0] == 'X2':  # laser toolhead command
+                command = 32  # only one laser so far
+                self.writer(packer(command), output_stream)
+
+                if line[1].startswith('O'):
+                    strength = float(line[1].lstrip('O')) / 255.
+                else:  # bad gcode!!
+                    strength = 0
+                self.writer(packer_f(strength), output_stream)
+
+                if 'HEAD_TYPE' not in self.md:
+                    self.md['HEAD_TYPE'] = 'LASER'
+
+            elif line[0] == 'G28':  # home
+                self.writer(packer(1), output_stream)
+                for i in range(2):
+                    self.current_pos[i] = 0
+                self.current_pos[2] = HW_PROFILE['model-1']['height']
+
+            elif line[0] == 'G90':  # set to absolute
+                self.writer(packer(2), output_stream)
+                self.absolute = True
+            elif line[0] == 'G91':  # set to relative
+                self.absolute = False
+                self.writer(packer(3), output_stream)
+
+            elif line[0] == 'M82':  # set extruder to absolute
+                self.extrude_absolute = True
+            elif line[0] == 'M83':  # set extruder to relative
+                self.extrude_absolute = False
+
+            elif line[0] == 'G92':  # set position
+            # this command will not write into fcode
+            # but use self.G92_delta to record the position
+                sub_command, data = self.XYZEF(line)
+                if all(i is None for i in data):  # A G92 without coordinates will reset all axes to zero.
+                    for i in range(1, 7):
+                        data[i] = 0.0
                 else:
-                    if self.engine == 'cura':
-                        if 'FILL' in comment:
-                            self.now_type = POINT_TYPE['infill']
-                        elif 'SUPPORT' in comment:
-                            self.now_type = POINT_TYPE['support']
-                        elif 'LAYER:' in comment:
-                            self.now_type = POINT_TYPE['new layer']
-                        elif 'WALL-OUTER' in comment:
-                            self.now_type = POINT_TYPE['perimeter']
-                        elif 'WALL-INNER' in comment:
-                            self.now_type = POINT_TYPE['inner-wall']
-                        elif 'RAFT' in comment:
-                            self.now_type = POINT_TYPE['raft']
-                        elif 'SKIRT' in comment:
-                            self.now_type = POINT_TYPE['skirt']
-                        elif 'SKIN' in comment:
-                            self.now_type = POINT_TYPE['skin']
-
-            self.T = Thread(target=self.sub_convert_path)
-            self.T.start()
-            # write back crc and lengh info
-            output_stream.write(struct.pack('<I', self.crc))
-            output_stream.seek(len(self.header()), 0)
-            output_stream.write(struct.pack('<I', self.script_length))
-            output_stream.seek(0, 2)  # go back to file end
-
-            if len(self.empty_layer) > 0 and self.empty_layer[0] == 0:  # clean up first empty layer
-                self.empty_layer.pop(0)
-
-            # warning: fileformat didn't consider multi-extruder, use first extruder instead
-            if self.filament[0] and 'HEAD_TYPE' not in self.md:
-                self.md['HEAD_TYPE'] = 'EXTRUDER'
-
-            if self.md['HEAD_TYPE'] == 'EXTRUDER':
-                self.md['FILAMENT_USED'] = ','.join(map(str, self.filament))
-                # self.md['CORRECTION'] = 'A'
-                self.md['SETTING'] = str(comment_list[-137:])
+                    for i in range(1, len(data)):
+                        if data[i] is not None:
+                            self.G92_delta[i - 1] = self.current_pos[i - 1] - data[i]
+
+            elif line[0] == 'G4':  # dwell
+                self.writer(packer(4), output_stream)
+                # P:ms or S:sec
+                for sub_line in line[1:]:
+                    if sub_line.startswith('P'):
+                        ms = float(line[1][1:])
+                    elif sub_line.startswith('S'):
+                        ms = float(line[1][1:]) * 1000
+                if ms < 0:
+                    ms = 0
+                self.writer(packer_f(ms), output_stream)
+                self.time_need += ms / 1000
+
+            elif line[0] == 'M104' or line[0] == 'M109':  # set extruder temperature
+                command = 16
+                if line[0] == 'M109':
+                    command |= (1 << 3)
+                for i in line:
+                    if i.startswith('S'):
+                        temp = float(i[1:])
+                    elif i.startswith('T'):
+                        self.tool = int(i[1:])
+                        if self.tool > 7 or self.tool < 0:
+                            raise ValueError('too many extruder! %d' % self.tool)
+                command |= self.tool
+                self.writer(packer(command), output_stream)
+                self.writer(packer_f(temp), output_stream)
+
+            # set for inch or mm
+            elif line[0] == 'G20':  # inch
+                self.unit = 25.4
+            elif line[0] == 'G21':  # mm
+                self.unit = 1
+
+            # change tool
+            elif line[0] == 'T0':
+                self.tool = 0
+            elif line[0] == 'T1':
+                self.tool = 1
+
+            elif line[0] == 'M107' or line[0] == 'M106':  # fan control
+                command = 48
+                command |= 0  # TODO: change this part, consder muti-fan control protocol
+                self.writer(packer(command), output_stream)
+                if line[0] == 'M107':  # close the fan
+                    self.writer(packer_f(0.0), output_stream)
+                elif line[0] == 'M106':
+                    if len(line) != 1:
+                        self.writer(packer_f(float(line[1][1:]) / 255.), output_stream)
+                    else:
+                        self.writer(packer_f(1.), output_stream)
+
+            elif line[0] in ['M84', 'M140']:  # loosen the motor
+                pass  # should only appear when printing done, not define in fcode yet
+
+            elif line[0] == 'M25':  # pause by gcode
+                command = 5
+                self.writer(packer(command), output_stream)
+
             else:
-                self.md['CORRECTION'] = 'N'
+                if line[0] in ['M400']:  # TODO: define a white list
+                    pass
+                else:
+                    logger.info('Undefine gcode: {}'.format(line))
+        else:
+            if self.engine == 'cura':
+                if 'FILL' in comment:
+                    self.now_type = POINT_TYPE['infill']
+                elif 'SUPPORT' in comment:
+                    self.now_type = POINT_TYPE['support']
+                elif 'LAYER:' in comment:
+                    self.now_type = POINT_TYPE['new layer']
+                elif 'WALL-OUTER' in comment:
+                    self.now_type = POINT_TYPE['perimeter']
+                elif 'WALL-INNER' in comment:
+                    self.now_type = POINT_TYPE['inner-wall']
+                elif 'RAFT' in comment:
+                    self.now_type = POINT_TYPE['raft']
+                elif 'SKIRT' in comment:
+                    self.now_type = POINT_TYPE['skirt']
+                elif 'SKIN' in comment:
+                    self.now_type = POINT_TYPE['skin']
+
+    def finish(self, output_stream, comment_list):
+        """
+        Write back crc and script length, then compute and write the metadata
+        """
+        self.T = Thread(target=self.sub_convert_path)
+        self.T.start()
+        # write back crc and lengh info
+        output_stream.write(struct.pack('<I', self.crc))
+        output_stream.seek(len(self.header()), 0)
+        output_stream.write(struct.pack('<I', self.script_length))
+        output_stream.seek(0, 2)  # go back to file end
+
+        if len(self.empty_layer) > 0 and self.empty_layer[0] == 0:  # clean up first empty layer
+            self.empty_layer.pop(0)
+
+        # warning: fileformat didn't consider multi-extruder, use first extruder instead
+        if self.filament[0] and 'HEAD_TYPE' not in self.md:
+            self.md['HEAD_TYPE'] = 'EXTRUDER'
+
+        if self.md['HEAD_TYPE'] == 'EXTRUDER':
+            self.md['FILAMENT_USED'] = ','.join(map(str, self.filament))
+            # self.md['CORRECTION'] = 'A'
+            self.md['SETTING'] = str(list(comment_list)[-SETTING_COMMENTS:])
+        else:
+            self.md['CORRECTION'] = 'N'
 
-            self.md['TRAVEL_DIST'] = str(self.distance)
+        self.md['TRAVEL_DIST'] = str(self.distance)
 
-            self.max_range[3] = sqrt(self.max_range[3])
-            for v, k in enumerate(['X', 'Y', 'Z', 'R']):
-                self.md['MAX_' + k] = str(self.max_range[v])
+        self.max_range[3] = sqrt(self.max_range[3])
+        for v, k in enumerate(['X', 'Y', 'Z', 'R']):
+            self.md['MAX_' + k] = str(self.max_range[v])
 
-            self.md['TIME_COST'] = str(self.time_need)
-            self.md['CREATED_AT'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.localtime(time.time()))
-            self.md['AUTHOR'] = getuser()  # TODO: use fluxstudio user name?
+        self.md['TIME_COST'] = str(self.time_need)
+        self.md['CREATED_AT'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.localtime(time.time()))
+        self.md['AUTHOR'] = getuser()  # TODO: use fluxstudio user name?
 
-            self.write_metadata(output_stream)
+        self.write_metadata(output_stream)
 
-        except Exception as e:
-            import traceback
-            logger.info('G_to_F fail')
-            traceback.print_exc(file=sys.stdout)
-            return 'broken'
+
+def read_blocks(input_stream, block_lines=BLOCK_LINES):
+    """
+    Read input_stream in blocks of block_lines lines, yield (lines, tokenize_gcode(lines))
+    """
+    input_stream = iter(input_stream)
+    while True:
+        lines = list(islice(input_stream, block_lines))
+        if not lines:
+            break
+        yield lines, tokenize_gcode(lines)
 
 
-def arc(p_1, p_2, p_c, clock=True, sample_n=100):
+def read_blocks_parallel(filename, processes, chunk_size=CHUNK_SIZE):
+    """
+    Same as read_blocks, but chunks of file(see split_layers) are read and tokenized by a process pool
+    only a few chunks are on the way at once, so memory is bounded even if the converting is slower
+    """
+    def receive(begin, end, result):
+        lines, kinds, given, words, comments = result.get()
+        moves = np.full((len(given), 5), np.nan)
+        moves[np.unpackbits(given, axis=1, count=5).astype(bool)] = words
+        values = np.full((len(kinds), 5), np.nan)
+        values[kinds == MOVE] = moves
+        return ChunkLines(filename, begin, end, lines), (kinds, values, comments)
+
+    with Pool(processes) as pool:
+        pending = deque()
+        for begin, end in split_layers(filename, chunk_size):
+            pending.append((begin, end, pool.apply_async(tokenize_chunk, (filename, begin, end))))
+            if len(pending) >= 2 * processes:
+                yield receive(*pending.popleft())
+        while pending:
+            yield receive(*pending.popleft())
+
+
+def split_layers(filename, chunk_size=CHUNK_SIZE):
+    """
+    Split a gcode file into chunks of about chunk_size bytes,
+    each chunk(except the first one) begins at a line with layer change mark
+    return a list of (begin, end) byte offsets
+    """
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        data = mmap(f.fileno(), 0, access=ACCESS_READ)
+        try:
+            bounds = [0]
+            cut = chunk_size
+            while cut < size:
+                marks = [i for i in (data.find(mark, cut) for mark in LAYER_MARKS) if i != -1]
+                if not marks:
+                    break
+                begin = data.rfind(b'\n', bounds[-1], min(marks)) + 1
+                if begin > bounds[-1]:
+                    bounds.append(begin)
+                cut = max(min(marks) + 1, bounds[-1] + chunk_size)
+            bounds.append(size)
+        finally:
+            data.close()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def tokenize_chunk(filename, begin, end):
+    """
+    Read bytes [begin, end) of a gcode file and tokenize them, run in worker processes
+    only what the converting process needs is sent back, so little is pickled between processes:
+    return (lines, kinds, given, words, comments)
+      lines: lines of the chunk, None for lines in long runs of moves(process_moves takes them from tokens)
+      given: packed bits of which [F, X, Y, Z, E] each MOVE line gives
+      words: the given values, in order
+      see tokenize_gcode for the others
+    """
+    lines = read_chunk(filename, begin, end)
+    kinds, values, comments = tokenize_gcode(lines)
+    for run_start, run_end in zip(*long_move_runs(kinds)):
+        lines[run_start:run_end] = [None] * (run_end - run_start)
+    moves = values[kinds == MOVE]
+    given = ~np.isnan(moves)
+    return lines, kinds, np.packbits(given, axis=1), moves[given], comments
+
+
+def read_chunk(filename, begin, end):
+    """
+    Read lines in bytes [begin, end) of a gcode file, decoded like open(filename, 'r') does
+    """
+    with open(filename, 'rb') as f:
+        f.seek(begin)
+        buf = f.read(end - begin)
+    return list(TextIOWrapper(BytesIO(buf)))
+
+
+class ChunkLines(object):
+    """
+    Lines of a chunk from tokenize_chunk, lines left out by the worker are read from file again
+    if they are asked for(process_block falls back to process_line on a run of moves)
+    """
+    def __init__(self, filename, begin, end, lines):
+        self.filename = filename
+        self.begin = begin
+        self.end = end
+        self.lines = lines
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, index):
+        lines = self.lines[index]
+        if None in lines:
+            self.lines = read_chunk(self.filename, self.begin, self.end)
+            lines = self.lines[index]
+        return lines
+
+
+def tokenize_gcode(lines):
+    """
+    Tokenize a block of gcode lines at once
+    lines[in]: list of gcode strings
+    return (kinds, values, comments)
+      kinds: uint8 array, MOVE for a G0/G1 process_moves can take, OTHER for the rest
+      values: float array (n, 5), [F, X, Y, Z, E] of each MOVE line, nan if not given
+      comments: list of in line comment, None if the line has no ';'
+    """
+    n = len(lines)
+    kinds = np.zeros(n, np.uint8)
+    comments = [None] * n
+    rows = []
+    words = []
+    match = MOVE_RE.fullmatch
+    for i, line in enumerate(lines):
+        code, sep, comment = line.partition(';')
+        if sep:
+            comments[i] = comment
+        m = match(code)
+        if m is not None:
+            rows.append(i)
+            words.extend(m.groups('nan'))
+
+    values = np.full((n, 5), np.nan)
+    if rows:
+        kinds[rows] = MOVE
+        values[rows] = np.array(words, dtype=float).reshape(-1, 5)
+    return kinds, values, comments
+
+
+def long_move_runs(kinds):
+    """
+    Find the runs of MOVE in kinds that are long enough to be vectorized(see MIN_VECTOR_MOVES)
+    return (starts, ends), lists of the first and one past the last line of each run
+    """
+    edges = np.flatnonzero(np.diff(kinds)) + 1
+    starts = np.append(0, edges)
+    ends = np.append(edges, len(kinds))
+    long_moves = (kinds[starts] == MOVE) & (ends - starts >= MIN_VECTOR_MOVES)
+    return starts[long_moves].tolist(), ends[long_moves].tolist()
+
+
+def fill_forward(a, first):
+    """
+    Replace nan in each column of a (n, k) by the last value before it, or by first (k,) if there is none
+    """
+    index = np.where(np.isnan(a), 0, np.arange(1, len(a) + 1)[:, None])
+    np.maximum.accumulate(index, axis=0, out=index)
+    return np.take_along_axis(np.vstack((first, a)), index, axis=0)
+
+
+def arc(p_1, p_2, p_c, clock=True, sample_n=None, tolerance=ARC_TOLERANCE):
     """
     a function dealing with G2, G3 commands
     ref: http://www.cnccookbook.com/CCCNCGCodeArcsG02G03Part2.htm
+    sample_n[in]: number of segments, if None it's decided by tolerance:
+                  the least segments keeping chord error(distance between arc and segment) under tolerance mm
+    return float array (sample_n + 1, 3), points from p_1 to p_2(z is linear interpolated)
     """
     _p_1 = [p_1[i] - p_c[i] for i in range(2)]
     _p_2 = [p_2[i] - p_c[i] for i in range(2)]
@@ -512,12 +861,15 @@ def arc(p_1, p_2, p_c, clock=True, sample_n=100):
     elif theta_2 < theta_1 and not clock:
         theta_2 += 2 * pi
 
-    ret = []
     r = r_1
-    for t in range(sample_n + 1):
-        ratio = t / sample_n
-        theta = ratio * (theta_2) + (1 - ratio) * (theta_1)
-        np = [p_c[0] + r * cos(theta), p_c[1] + r * sin(theta), ratio * (p_2[2]) + (1 - ratio) * (p_1[2])]
-        ret.append(np)
+    if sample_n is None:
+        # chord error of a segment spanning angle t is r * (1 - cos(t / 2))
+        if r > tolerance:
+            sample_n = ceil(abs(theta_2 - theta_1) / (2 * acos(1 - tolerance / r)))
+        else:
+            sample_n = 1
+        sample_n = min(max(sample_n, 1), ARC_MAX_SEGMENTS)
 
-    return ret
+    ratio = np.arange(sample_n + 1) / sample_n
+    theta = ratio * (theta_2) + (1 - ratio) * (theta_1)
+    return np.column_stack((p_c[0] + r * np.cos(theta), p_c[1] + r * np.sin(theta), ratio * (p_2[2]) + (1 - ratio) * (p_1[2])))
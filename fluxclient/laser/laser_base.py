@@ -1,7 +1,9 @@
 # !/usr/bin/env python3
 
 import sys
-from io import BytesIO, StringIO
+import logging
+from io import BytesIO
+from os import environ
 from math import pi, sin, cos, sqrt, degrees
 from time import time
 from datetime import datetime
@@ -11,6 +13,7 @@ import numpy as np
 from fluxclient.fcode.g_to_f import GcodeToFcode
 import pkg_resources
 
+logger = logging.getLogger(__name__)
 
 class LaserBase(object):
     """base class for all laser usage calss"""
@@ -166,13 +169,35 @@ class LaserBase(object):
 
         return image
 
-    def gcode_generate(self):
-        """Virtual function gcode_generate"""
-        raise NotImplementedError('Successor didn\'t implement "gcode_generate" method')
+    def gcode_lines(self):
+        """Virtual function gcode_lines, yield gcode line by line (without newline)"""
+        raise NotImplementedError('Successor didn\'t implement "gcode_lines" method')
+
+    def gcode_iter(self, *args):
+        """
+        yield gcode line by line, each line ends with a newline
+        args are passed to gcode_lines
+        """
+        return map('{}\n'.format, self.gcode_lines(*args))
+
+    def gcode_generate(self, *args):
+        """
+        return gcode in string type
+        use method: export_to_stream to export gcode to a stream
+        """
+        gcode = ''.join(self.gcode_iter(*args))
+        logger.debug("generate gcode done:%d bytes" % len(gcode))
+        ######################## fake code ####################################
+        if environ.get("flux_debug") == '1':
+            self.dump('./preview.png')
+            with open('output.gcode', 'w') as f:
+                print(gcode, file=f)
+        #######################################################################
+        return gcode
 
     def export_to_stream(self, stream, *args):
         """export gcode to stream"""
-        stream.write(self.gcode_generate(*args))
+        stream.writelines(self.gcode_iter(*args))
 
     def set_params(self, key, value):
         """
@@ -312,14 +337,28 @@ class LaserBase(object):
             raise NotImplementedError("unsupport mode {}".format(mode), file=sys.stderr)
 
     def fcode_generate(self, *args):
-        f = StringIO()
-        f.write(self.gcode_generate(*args))
-        f.seek(0)
-
+        """
+        return fcode in bytes and the GcodeToFcode object used
+        use method: export_fcode_to_stream to export fcode to a stream
+        """
         fcode_output = BytesIO()
+        m_GcodeToFcode = self.export_fcode_to_stream(fcode_output, *args)
+        return fcode_output.getvalue(), m_GcodeToFcode
+
+    def export_fcode_to_stream(self, stream, *args):
+        """
+        export fcode to stream, gcode is converted while it's being generated
+        so neither the whole gcode nor the whole fcode is held in memory
+        stream[in]: binary file, or a socket file that can't seek (see GcodeToFcode.process)
+        return the GcodeToFcode object used
+        """
         m_GcodeToFcode = GcodeToFcode(ext_metadata=self.ext_metadata)
-        m_GcodeToFcode.image = self.dump(mode='preview')
         m_GcodeToFcode.md['OBJECT_HEIGHT'] = str(self.obj_height)
 
-        m_GcodeToFcode.process(f, fcode_output)
-        return fcode_output.getvalue(), m_GcodeToFcode
+        def gcode():
+            yield from self.gcode_iter(*args)
+            # image_map is only complete after all gcode is generated, preview is written at the end anyway
+            m_GcodeToFcode.image = self.dump(mode='preview')
+
+        m_GcodeToFcode.process(gcode(), stream)
+        return m_GcodeToFcode
@@ -2,7 +2,6 @@
 
 from math import pi, sin, cos, degrees
 import logging
-from os import environ
 
 import numpy as np
 from PIL import Image
@@ -33,14 +32,13 @@ class LaserBitmap(LaserBase):
         self.thres = 255
         self.ratio *= 1 / self.pixel_per_mm
 
-    def gcode_generate(self, res=1):
+    def gcode_lines(self, res=1):
         """
-        return gcode in string type
+        yield gcode line by line
         res: resolution
         use method: export_to_stream to export gcode to a stream
         """
-        gcode = []
-        gcode += self.header('FLUX. Laser Bitmap.')
+        yield from self.header('FLUX. Laser Bitmap.')
 
         abs_shift = len(self.image_map) / 2
 
@@ -80,29 +78,20 @@ class LaserBitmap(LaserBase):
                 if this != 255:
                     if back:
                         back = False
-                        # gcode += self.moveTo(itera[w_record] - abs_shift_x, abs_shift - h, speed=8000)
-                        gcode += self.moveTo(itera[w_record] - abs_shift_x - 40, abs_shift - h, speed=5000)
-                        gcode += self.turnOff()
-                        gcode += self.moveTo(itera[w_record] - abs_shift_x, abs_shift - h)
+                        # yield from self.moveTo(itera[w_record] - abs_shift_x, abs_shift - h, speed=8000)
+                        yield from self.moveTo(itera[w_record] - abs_shift_x - 40, abs_shift - h, speed=5000)
+                        yield from self.turnOff()
+                        yield from self.moveTo(itera[w_record] - abs_shift_x, abs_shift - h)
 
                     else:
-                        gcode += self.moveTo(itera[w_record] - abs_shift_x, abs_shift - h)
-                    gcode += self.turnTo(255 - this)
-                    gcode += self.moveTo(itera[w] - abs_shift_x, abs_shift - h)
-                    gcode += self.turnOff()
-
-            gcode += self.turnOff()
-
-        gcode += self.turnOff()
-        gcode = "\n".join(gcode) + "\n"
-        logger.debug("generate gcode done:%d bytes" % len(gcode))
-        ######################## fake code ####################################
-        if environ.get("flux_debug") == '1':
-            self.dump('./preview.png')
-            with open('output.gcode', 'w') as f:
-                print(gcode, file=f)
-        #######################################################################
-        return gcode
+                        yield from self.moveTo(itera[w_record] - abs_shift_x, abs_shift - h)
+                    yield from self.turnTo(255 - this)
+                    yield from self.moveTo(itera[w] - abs_shift_x, abs_shift - h)
+                    yield from self.turnOff()
+
+            yield from self.turnOff()
+
+        yield from self.turnOff()
 
 
 if __name__ == '__main__':
@@ -2,7 +2,6 @@
 
 import sys
 import logging
-from os import environ
 
 from lxml import etree as ET
 
@@ -35,10 +34,9 @@ class LaserSvg(LaserBase, SVGParser):
         """
         self.ready_svgs[name] = data
 
-    def gcode_generate(self, names, ws=None):
+    def gcode_lines(self, names, ws=None):
         self.reset_image()
-        gcode = []
-        gcode += self.header('FLUX. Laser SVG.')
+        yield from self.header('FLUX. Laser SVG.')
         progress = 0.1
         offset = 4 * len(names) / 0.98
         name_index = offset
@@ -70,9 +68,9 @@ class LaserSvg(LaserBase, SVGParser):
                 for x, y in each_path:
                     if x != '\n':
                         if not moveTo:
-                            gcode += self.drawTo(x, y, speed=self.laser_speed)
+                            yield from self.drawTo(x, y, speed=self.laser_speed)
                         else:
-                            gcode += self.closeTo(x, y, self.travel_speed)
+                            yield from self.closeTo(x, y, self.travel_speed)
                             moveTo = False
                     else:
                         moveTo = True
@@ -82,19 +80,7 @@ class LaserSvg(LaserBase, SVGParser):
                 ws.send_progress('preparing image', progress)
             if ready_svg[-1]:
                 self.add_image(ready_svg[-1], ready_svg[-3], ready_svg[-2], *ready_svg[3:-3], thres=100)
-        gcode += self.turnOff()
-
-        gcode = "\n".join(gcode) + "\n"
-        logger.debug("generate gcode done:%d bytes" % len(gcode))
-
-        ################ fake code ##############
-        if environ.get("flux_debug") == '1':
-            self.dump('./preview.png')
-            with open('output.gcode', 'w') as f:
-                print(gcode, file=f)
-        ##########################################
-
-        return gcode
+        yield from self.turnOff()
 
 if __name__ == '__main__':
     m_laser_svg = LaserSvg()
@@ -62,17 +62,15 @@ class Circle(LaserBase):
         super(Circle, self).__init__()
         self.speed = 100
 
-    def gcode_generate(self):
-        gcode = []
-        gcode += self.header('Circle')
+    def gcode_lines(self):
+        yield from self.header('Circle')
         sample_n = 1000
-        gcode += self.moveTo(self.radius, 0)
+        yield from self.moveTo(self.radius, 0)
         for i in range(sample_n + 1):
             theta = (i / sample_n) * 2 * pi
-            gcode += self.drawTo(self.radius * cos(theta), self.radius * sin(theta), speed=self.speed)
-        gcode += self.turnOff()
-        gcode += ['G28']
-        return "\n".join(gcode) + "\n"
+            yield from self.drawTo(self.radius * cos(theta), self.radius * sin(theta), speed=self.speed)
+        yield from self.turnOff()
+        yield 'G28'
 
 
 class Logo(LaserBase):
@@ -98,69 +96,67 @@ class Logo(LaserBase):
         gcode += self.turnOn()
         return gcode
 
-    def gcode_generate(self):
-        gcode = []
-        gcode += self.header('Logo')
+    def gcode_lines(self):
+        yield from self.header('Logo')
 
         # print "G4 P50"  # pause when starting
 
         # frame for align
-        gcode += self.turnTo()
+        yield from self.turnTo()
         for i in range(1):
-            gcode += self.close_and_move_and_on(50, 10, 253)
-            gcode += self.shift_move(50, 10, speed=400)
-            gcode += self.shift_move(7, 35, speed=400)
-            gcode += self.shift_move(7, 85, speed=400)
-            gcode += self.shift_move(50, 110, speed=400)
-            gcode += self.shift_move(93.3, 85, speed=400)
-            gcode += self.shift_move(93.3, 35, speed=400)
-            gcode += self.shift_move(50, 10, speed=400)
-
-        gcode += self.close_and_move_and_on(50, 10)
-        gcode += self.shift_move(50, 10)
-        gcode += self.shift_move(6.7, 35)
-        gcode += self.shift_move(6.7, 85)
-        gcode += self.shift_move(50, 110)
-        gcode += self.shift_move(93.3, 85)
-        gcode += self.shift_move(93.3, 35)
-        gcode += self.shift_move(50, 10)
-
-        gcode += self.close_and_move_and_on(50, 40)
-        gcode += self.shift_move(50, 40)
-        gcode += self.shift_move(32.7, 50)
-        gcode += self.shift_move(32.7, 70)
-        gcode += self.shift_move(50, 80)
-        gcode += self.shift_move(67.3, 70)
-        gcode += self.shift_move(67.3, 50)
-        gcode += self.shift_move(50, 40)
-
-        gcode += self.close_and_move_and_on(50, 40)
-        gcode += self.shift_move(50, 40)
+            yield from self.close_and_move_and_on(50, 10, 253)
+            yield from self.shift_move(50, 10, speed=400)
+            yield from self.shift_move(7, 35, speed=400)
+            yield from self.shift_move(7, 85, speed=400)
+            yield from self.shift_move(50, 110, speed=400)
+            yield from self.shift_move(93.3, 85, speed=400)
+            yield from self.shift_move(93.3, 35, speed=400)
+            yield from self.shift_move(50, 10, speed=400)
+
+        yield from self.close_and_move_and_on(50, 10)
+        yield from self.shift_move(50, 10)
+        yield from self.shift_move(6.7, 35)
+        yield from self.shift_move(6.7, 85)
+        yield from self.shift_move(50, 110)
+        yield from self.shift_move(93.3, 85)
+        yield from self.shift_move(93.3, 35)
+        yield from self.shift_move(50, 10)
+
+        yield from self.close_and_move_and_on(50, 40)
+        yield from self.shift_move(50, 40)
+        yield from self.shift_move(32.7, 50)
+        yield from self.shift_move(32.7, 70)
+        yield from self.shift_move(50, 80)
+        yield from self.shift_move(67.3, 70)
+        yield from self.shift_move(67.3, 50)
+        yield from self.shift_move(50, 40)
+
+        yield from self.close_and_move_and_on(50, 40)
+        yield from self.shift_move(50, 40)
         # line that pass (50, 40) and (67.3,50) , line that pass (37.3,1) and (37.3, 2)
-        gcode += self.shift_move(37.3, 32.6)
-        gcode += self.shift_move(32.7 - (50 - 37.3), 50 - 7.4)
+        yield from self.shift_move(37.3, 32.6)
+        yield from self.shift_move(32.7 - (50 - 37.3), 50 - 7.4)
         # line that pass (50, 110) and (6.7,85) , line that pass (20,1) and (20, 2)
-        gcode += self.shift_move(20, 92.7)
+        yield from self.shift_move(20, 92.7)
 
-        gcode += self.close_and_move_and_on(32.7, 70)
-        gcode += self.shift_move(32.7, 70)
-        gcode += self.shift_move(32.7, 85)
-        gcode += self.shift_move(63.0, 102.5)
+        yield from self.close_and_move_and_on(32.7, 70)
+        yield from self.shift_move(32.7, 70)
+        yield from self.shift_move(32.7, 85)
+        yield from self.shift_move(63.0, 102.5)
 
-        gcode += self.close_and_move_and_on(50, 80)
-        gcode += self.shift_move(50, 80)
+        yield from self.close_and_move_and_on(50, 80)
+        yield from self.shift_move(50, 80)
         # line that pass (50, 80) and (32.7,70) , line that pass (63,1) and (63, 2)
-        gcode += self.shift_move(63.0, 87.5)
-        gcode += self.shift_move(80.3, 77.4)
-        gcode += self.shift_move(80.3, 27.5)
-
-        gcode += self.close_and_move_and_on(67.3, 50)
-        gcode += self.shift_move(67.3, 50)
-        gcode += self.shift_move(67.3, 35)
-        gcode += self.shift_move(37.3, 17.3)
-        gcode += self.turnOff()
-        gcode += ['G1 F5000 Z200']
-        return "\n".join(gcode) + "\n"
+        yield from self.shift_move(63.0, 87.5)
+        yield from self.shift_move(80.3, 77.4)
+        yield from self.shift_move(80.3, 27.5)
+
+        yield from self.close_and_move_and_on(67.3, 50)
+        yield from self.shift_move(67.3, 50)
+        yield from self.shift_move(67.3, 35)
+        yield from self.shift_move(37.3, 17.3)
+        yield from self.turnOff()
+        yield 'G1 F5000 Z200'
 
 
 class Grid(LaserBase):
@@ -169,9 +165,8 @@ class Grid(LaserBase):
         super(Grid, self).__init__()
         self.obj_height = 0.0  # change if needed
 
-    def gcode_generate(self):
-        gcode = []
-        gcode += self.header('Grid')
+    def gcode_lines(self):
+        yield from self.header('Grid')
 
         path = []
         path2 = []
@@ -200,10 +195,9 @@ class Grid(LaserBase):
 
         path += path2
         for i in path:
-            gcode += self.closeTo(i[0], i[1])
-            gcode += self.drawTo(i[2], i[3])
-        gcode += self.turnOff()
-        return '\n'.join(gcode)
+            yield from self.closeTo(i[0], i[1])
+            yield from self.drawTo(i[2], i[3])
+        yield from self.turnOff()
 
 
 class FindFocal(LaserBase):
@@ -211,8 +205,8 @@ class FindFocal(LaserBase):
     def __init__(self):
         super(FindFocal, self).__init__()
 
-    def gcode_generate(self):
-        gcode = self.header('FindFocal')
+    def gcode_lines(self):
+        yield from self.header('FindFocal')
         focal_max = 10
         z_candidate = myrange(focal_max, 0.1, -0.02)
         tmp_i = 0
@@ -220,12 +214,12 @@ class FindFocal(LaserBase):
         step = 50
         length = 30
         while tmp_i + step < len(z_candidate):
-            gcode += self.closeTo(-15, tmp_y)
+            yield from self.closeTo(-15, tmp_y)
             tmp = 0
             for z in z_candidate[tmp_i:tmp_i + step]:
-                gcode += self.drawTo(-15 + 30 / step * tmp, tmp_y, z=z)
-                gcode += self.drawTo(-15 + 30 / step * tmp, tmp_y + 1, z=z)
-                gcode += self.drawTo(-15 + 30 / step * tmp, tmp_y, z=z)
+                yield from self.drawTo(-15 + 30 / step * tmp, tmp_y, z=z)
+                yield from self.drawTo(-15 + 30 / step * tmp, tmp_y + 1, z=z)
+                yield from self.drawTo(-15 + 30 / step * tmp, tmp_y, z=z)
                 tmp += 1
 
             tmp_i += step
@@ -233,13 +227,12 @@ class FindFocal(LaserBase):
             print(tmp_y, file=sys.stderr)
         tmp = 0
         for z in z_candidate[tmp_i:]:
-            gcode += self.drawTo(-15 + 30 / step * tmp, tmp_y, z=z)
-            gcode += self.drawTo(-15 + 30 / step * tmp, tmp_y + 1, z=z)
-            gcode += self.drawTo(-15 + 30 / step * tmp, tmp_y, z=z)
+            yield from self.drawTo(-15 + 30 / step * tmp, tmp_y, z=z)
+            yield from self.drawTo(-15 + 30 / step * tmp, tmp_y + 1, z=z)
+            yield from self.drawTo(-15 + 30 / step * tmp, tmp_y, z=z)
             tmp += 1
-        gcode += self.turnOff()
-        gcode += ['G28']
-        return '\n'.join(gcode)
+        yield from self.turnOff()
+        yield 'G28'
 
 
 def myrange(start, end, step):
@@ -219,6 +219,7 @@ flux_refill_empty = 0
 flux_first_layer = 0
 flux_raft = 0
 flux_floor = -1
+flux_decimate = 500000
 detect_filament_runout = 1
 detect_head_shake = 1
 detect_head_tilt = 1
@@ -359,6 +360,7 @@ ini_constraint = {
     'flux_first_layer': [binary],
     'flux_raft': [binary],
     'flux_floor': [float_range, -1, 240],
+    'flux_decimate': [int_range, 0],
     'detect_filament_runout': [binary],
     'detect_head_shake': [binary],
     'detect_head_tilt': [binary],
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+ascii stl and obj parsers
+
+the buffer is cut into chunks at facet(stl) or line(obj) boundaries, numbers in each chunk
+are parsed at once with numpy, and large files are parsed by several processes
+"""
+from concurrent.futures import ProcessPoolExecutor
+import warnings
+import os
+import re
+
+import numpy as np
+
+ASCII_CHUNK_SIZE = 8 * 1024 * 1024  # bytes parsed at once
+PARSE_WORKERS = os.cpu_count() or 1  # processes parsing a large file
+PARALLEL_CHUNKS = 4  # files cut into fewer chunks are parsed in this process
+
+_STL_NUMBERS = r'\s+(\S+)\s+(\S+)\s+(\S+)\s*$'
+STL_NORMAL_RE = re.compile(r'^\s*facet\s+normal' + _STL_NUMBERS, re.M)
+STL_VERTEX_RE = re.compile(r'^\s*vertex' + _STL_NUMBERS, re.M)
+
+_SPACE = np.uint8(ord(' '))
+_SLASH = np.uint8(ord('/'))
+
+
+def chunk_bounds(data, boundary, size=ASCII_CHUNK_SIZE):
+    """
+    data[in]: bytes or mmap
+    boundary[in]: bytes, chunks end right after it
+    return [(start, end), ...] covering the whole data
+    """
+    bounds = []
+    start = 0
+    while start < len(data):
+        end = data.find(boundary, start + size) if start + size < len(data) else -1
+        end = len(data) if end == -1 else end + len(boundary)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def read_chunk(source, start, end):
+    """
+    source[in]: bytes, mmap or a file path
+    """
+    if type(source) == str:
+        with open(source, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+    return source[start:end]
+
+
+def parse_numbers(text, count, dtype=np.float64):
+    """
+    parse whitespace separated numbers
+    return array of numbers, or None if there aren't exactly count of them
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # older numpy warns instead of raising when it stops at a bad token
+            numbers = np.fromstring(text, dtype=dtype, sep=' ')
+    except ValueError:
+        return None
+    if len(numbers) != count:
+        return None
+    return numbers
+
+
+def blank_words(chunk):
+    """
+    replace letters with spaces, except the exponent in numbers like 1.5e+01
+    return bytes
+    """
+    buf = np.frombuffer(chunk, np.uint8).copy()
+    lower = buf | 0x20
+    letter = (lower >= ord('a')) & (lower <= ord('z'))
+    prev = np.concatenate(([_SPACE], buf[:-1]))
+    exponent = (lower == ord('e')) & (((prev >= ord('0')) & (prev <= ord('9'))) | (prev == ord('.')))
+    buf[letter & ~exponent] = _SPACE
+    return buf.tobytes()
+
+
+def parse_stl_chunk(source, start, end):
+    """
+    source[in]: ascii stl, bytes, mmap or a file path
+    return (normals, vertices) in [start, end), float64 array (n, 3) and (n, 3, 3)
+    """
+    chunk = read_chunk(source, start, end)
+    # drop 'solid name' and 'endsolid name' lines, names can be anything
+    i = chunk.find(b'solid')
+    while i != -1:
+        line_start = chunk.rfind(b'\n', 0, i) + 1
+        line_end = chunk.find(b'\n', i)
+        chunk = chunk[:line_start] + (chunk[line_end:] if line_end != -1 else b'')
+        i = chunk.find(b'solid', line_start)
+
+    numbers = parse_numbers(blank_words(chunk), chunk.count(b'endfacet') * 12)
+    if numbers is not None:
+        numbers = numbers.reshape(-1, 4, 3)
+        return numbers[:, 0].copy(), numbers[:, 1:].copy()
+
+    # not in the usual layout, match line by line
+    text = chunk.decode('utf8')
+    normals = np.array(STL_NORMAL_RE.findall(text), dtype=np.float64).reshape(-1, 3)
+    vertices = np.array(STL_VERTEX_RE.findall(text), dtype=np.float64).reshape(-1, 3, 3)
+    return normals, vertices
+
+
+def parse_obj_lines(chunk):
+    """
+    parse obj line by line, for lines numpy can't handle at once
+    return (points, faces): float64 array (n, 3), int64 array (m, 3) of index as in the file
+    """
+    points = []
+    faces = []
+    for t in chunk.decode('utf8').splitlines():
+        t = t.split()
+        if not t or t[0].startswith('#'):  # empty line or comment
+            continue
+        elif t[0] == 'v':
+            points.append(tuple(float(t[j]) for j in range(1, 4)))
+        elif t[0] == 'f':
+            faces.append([int(t[j].split('/')[0]) for j in range(1, 4)])
+    return np.array(points, np.float64).reshape(-1, 3), np.array(faces, np.int64).reshape(-1, 3)
+
+
+def parse_obj_chunk(source, start, end):
+    """
+    source[in]: obj, bytes, mmap or a file path
+    return (points, faces) in [start, end): float64 array (n, 3), int64 array (m, 3) of index as in the file
+    """
+    chunk = read_chunk(source, start, end)
+    buf = np.frombuffer(chunk + b'\n\n', np.uint8).copy()
+    line_starts = np.concatenate(([0], np.flatnonzero(buf[:-2] == ord('\n')) + 1))
+    lengths = np.diff(np.append(line_starts, len(buf) - 2))
+    first, second = buf[line_starts], buf[line_starts + 1]
+    if ((first == ord(' ')) | (first == ord('\t'))).any():
+        return parse_obj_lines(chunk)  # indented lines
+
+    separated = (second == ord(' ')) | (second == ord('\t'))
+    is_point = (first == ord('v')) & separated
+    is_face = (first == ord('f')) & separated
+    buf[line_starts[is_point | is_face]] = _SPACE  # keep the numbers only
+
+    points = parse_numbers(buf[:-2][np.repeat(is_point, lengths)].tobytes(), 3 * is_point.sum())
+    face_text = buf[:-2][np.repeat(is_face, lengths)]
+    if (face_text == _SLASH).any():
+        # v/vt/vn -> v, blank from a slash to the end of its word
+        index = np.arange(len(face_text), dtype=np.int64)
+        last_slash = np.maximum.accumulate(np.where(face_text == _SLASH, index, -1))
+        last_space = np.maximum.accumulate(np.where(face_text <= _SPACE, index, -1))
+        face_text[last_slash > last_space] = _SPACE
+    faces = parse_numbers(face_text.tobytes(), 3 * is_face.sum(), np.int64)
+    if points is None or faces is None:
+        return parse_obj_lines(chunk)  # more than 3 numbers in some line
+    return points.reshape(-1, 3), faces.reshape(-1, 3)
+
+
+def map_chunks(func, data, bounds, path=None):
+    """
+    run func(data, start, end) for each chunk, in worker processes if there are many chunks
+    path[in]: file path of data, workers read the file by themselves instead of receiving the chunk
+    return results in order
+    """
+    workers = min(PARSE_WORKERS, len(bounds))
+    if len(bounds) < PARALLEL_CHUNKS or workers < 2:
+        return [func(data, start, end) for start, end in bounds]
+    with ProcessPoolExecutor(workers) as pool:
+        if path:
+            futures = [pool.submit(func, path, start, end) for start, end in bounds]
+        else:
+            futures = [pool.submit(func, data[start:end], 0, end - start) for start, end in bounds]
+        return [f.result() for f in futures]
+
+
+def read_ascii_stl(data, path=None):
+    """
+    data[in]: ascii stl, bytes or mmap
+    path[in]: file path of data if it's from a file, so workers can read it directly
+    return (normals, vertices): float64 array (n, 3) and (n, 3, 3)
+    """
+    bounds = chunk_bounds(data, b'endfacet')
+    results = map_chunks(parse_stl_chunk, data, bounds, path)
+    if not results:
+        return np.zeros((0, 3), np.float64), np.zeros((0, 3, 3), np.float64)
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+def read_obj(data, path=None):
+    """
+    data[in]: obj, bytes or mmap
+    path[in]: file path of data if it's from a file, so workers can read it directly
+    return (points, faces): float64 array (n, 3), int64 array (m, 3) of point index
+    """
+    bounds = chunk_bounds(data, b'\n')
+    results = map_chunks(parse_obj_chunk, data, bounds, path)
+    points = np.concatenate([r[0] for r in results] or [np.zeros((0, 3), np.float64)])
+    faces = np.concatenate([r[1] for r in results] or [np.zeros((0, 3), np.int64)])
+    # index start from 1, negative ones count from the end
+    faces = np.where(faces > 0, faces - 1, faces + len(points))
+    return points, faces
@@ -4,10 +4,16 @@ import time
 import math
 import re
 import os
-from queue import Queue
 from math import ceil, sqrt
+from itertools import chain, islice
 
 import numpy as np
+from scipy import ndimage
+
+# 8 neighbours in clockwise order, for tracing edges
+NEIGHBOURS = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+NEIGHBOUR_INDEX = {d: i for i, d in enumerate(NEIGHBOURS)}
+Z_RE = re.compile(r"Z ?(-?[\d.]+)")
 
 
 class Raft():
@@ -23,6 +29,8 @@ class Raft():
         self.z_space = 0.12
         self.width = ceil(172 / self.resolution)
         self.grid = [[]]
+        self.labels = None  # island label of each grid cell
+        self.head = []  # gcode lines read to fill the grid
         self.gcode = []
 
     def print_start_gcode(self):
@@ -44,6 +52,10 @@ G1 F1800
         print(code, file=self.output_stream)
 
     def process(self, gcode, debug=False):
+        """
+        gcode[in]: iterable of gcode lines, only the first few layers are kept in memory
+        """
+        gcode = iter(gcode)
         #Process all gcode on first few layers, and fill the grid, skip skirt...
         self.grid = self.fill_grid(gcode)
         #Select all connected islands, find the edge points at each one
@@ -57,15 +69,17 @@ G1 F1800
         if debug and os.environ.get("flux_debug") == '1':
             self.output_grid()
         #Print other gcode ( uplift Z by elf.count*self.layer_height+self.z_space )
-        skip = 15
+        #Skip first 15 lines, lines read for the grid go first, then the rest is streamed
+        self.output_stream.writelines(self.lift_z(islice(chain(self.head, gcode), 15, None)))
+
+    def lift_z(self, gcode):
+        """
+        lift Z by self.count * self.layer_height + self.z_space, lines without Z are passed as is
+        """
         for line in gcode:
-            #Skip first 15 lines
-            if skip > 0:
-                skip = skip - 1
-                continue
-            #Lift Z
-            line = re.sub("Z ?(-?[\d.]+)", self.z_rep, line)
-            print(line, end="", file=self.output_stream)
+            if 'Z' in line:
+                line = Z_RE.sub(self.z_rep, line)
+            yield line
 
     def z_rep(self, matchobj):
         z_old = float(matchobj.group(1))
@@ -73,132 +87,64 @@ G1 F1800
 
     def generate_gcode(self, islands):
         island_id = 0
-        for island in islands:
+        for contour in islands:
             island_id = island_id + 1
             print(";Island #%d" % island_id, file=self.output_stream)
-            edge = island
-
-            x = edge[0][0]
-            y = edge[0][1]
-            last_point = [0, 0]
-
-            sorted_edge = [[x, y]]
-
-            #Traverse the edge
-            while len(edge) > 0:
-                if self.is_edge(edge, x - 1, y):
-                    x = x - 1
-                elif self.is_edge(edge, x + 1, y):
-                    x = x + 1
-                elif self.is_edge(edge, x, y - 1):
-                    y = y - 1
-                elif self.is_edge(edge, x, y + 1):
-                    y = y + 1
-                elif self.is_edge(edge, x - 1, y - 1):
-                    (x, y) = (x - 1, y - 1)
-                elif self.is_edge(edge, x + 1, y + 1):
-                    (x, y) = (x + 1, y + 1)
-                elif self.is_edge(edge, x + 1, y - 1):
-                    (x, y) = (x + 1, y - 1)
-                elif self.is_edge(edge, x - 1, y + 1):
-                    (x, y) = (x - 1, y + 1)
-
-                if last_point[0] == x and last_point[1] == y:
-                    x = edge[0][0]
-                    y = edge[0][1]
-                    continue
-                else:
-                    edge.remove([x, y])
-
-                self.grid[x][y] = 4
-                last_point = [x, y]
-                sorted_edge.append([x, y])
+            self.grid[contour[:, 0], contour[:, 1]] = 4
 
             #Outline of raft
             print("G92 E0", file=self.output_stream)
             print("G1 Z%lf" % self.first_layer, file=self.output_stream)
 
             extruded = 0
-            (x_min, y_min, x_max, y_max) = (999999, 999999, -1, -1)
-            last_point = [0, 0]
-            for pt in sorted_edge:
-                if x_min > pt[0]:
-                    x_min = pt[0]
-                if x_max < pt[0]:
-                    x_max = pt[0]
-                if y_min > pt[1]:
-                    y_min = pt[1]
-                if y_max < pt[1]:
-                    y_max = pt[1]
-
-                x = self.m2g(pt[0])
-                y = self.m2g(pt[1])
-
-                if last_point[0] == 0 and last_point[1] == 0:
-                    last_point = [x, y]
-
-                e = self.dist(last_point[0], last_point[1], x, y) * self.extrusion
-                extruded = extruded + e
-
-                last_point = [x, y]
+            outline = self.m2g(np.concatenate((contour, contour[:1])))
+            e = np.sqrt((np.diff(outline, axis=0) ** 2).sum(axis=1)) * self.extrusion
+            for (x, y), extruded in zip(outline.tolist(), np.concatenate(([0.], np.cumsum(e))).tolist()):
                 print("G1X%lfY%lfE%lf" % (x, y, extruded), file=self.output_stream)
 
             #Infill of raft
+            (x_min, y_min), (x_max, y_max) = contour.min(axis=0), contour.max(axis=0)
             horizontal_lines = abs(ceil((y_max - y_min) * self.resolution / self.line_width))
             vertical_lines = abs(ceil((x_max - x_min) * self.resolution / self.line_width))
 
             print("Lines / Horizontal %lf Vertical %lf" % (horizontal_lines, vertical_lines), file=sys.stderr)
             print("Xmin %lf Xmax %lf Ymin %lf Ymax %lf" % (x_min, x_max, y_min, y_max), file=sys.stderr)
-            width = len(self.grid)
+            island = self.labels == self.labels[contour[0, 0], contour[0, 1]]
 
             for l in range(0, self.count):
                 print("G1 Z%lf" % (self.first_layer + l * self.layer_height), file=self.output_stream)
                 if l % 2 == 0:
                     for r in range(0, horizontal_lines):
                         y = self.g2m(self.m2g(y_min) + self.line_width * r)
-                        range_of_x = range(0, width)
-                        if r % 2 == 1:
-                            range_of_x = reversed(range_of_x)
-
-                        inside = False
-                        fill_start = 0
-                        for x in range_of_x:
-                            if self.grid[x][y] > 0 and not inside:
-                                inside = True
-                                fill_start = self.m2g(x)
-                            elif self.grid[x][y] == 0 and inside:
-                                e = abs(self.m2g(x) - fill_start) * self.extrusion
+                        if 0 <= y < self.width:
+                            for fill_start, x in self.scanline(island[:, y], r % 2 == 1):
+                                e = abs(self.m2g(x) - self.m2g(fill_start)) * self.extrusion
                                 extruded = extruded + e
 
-                                print("G1 X%lf Y%lf ; H line" % (fill_start, self.m2g(y)), file=self.output_stream)
+                                print("G1 X%lf Y%lf ; H line" % (self.m2g(fill_start), self.m2g(y)), file=self.output_stream)
                                 print("G1 X%lf Y%lf E%lf" % (self.m2g(x), self.m2g(y), extruded), file=self.output_stream)
-                                inside = False
                 else:
                     for r in range(0, vertical_lines):
                         x = self.g2m(self.m2g(x_min) + self.line_width * r)
-                        range_of_y = range(0, width)
-                        if r % 2 == 1:
-                            range_of_y = reversed(range_of_y)
-
-                        inside = False
-                        fill_start = 0
-                        for y in range_of_y:
-                            if self.grid[x][y] > 0 and not inside:
-                                inside = True
-                                fill_start = self.m2g(y)
-                            elif self.grid[x][y] == 0 and inside:
-                                e = abs(self.m2g(y) - fill_start) * self.extrusion
+                        if 0 <= x < self.width:
+                            for fill_start, y in self.scanline(island[x, :], r % 2 == 1):
+                                e = abs(self.m2g(y) - self.m2g(fill_start)) * self.extrusion
                                 extruded = extruded + e
 
-                                print("G1 X%lf Y%lf ; V line" % (self.m2g(x), fill_start), file=self.output_stream)
+                                print("G1 X%lf Y%lf ; V line" % (self.m2g(x), self.m2g(fill_start)), file=self.output_stream)
                                 print("G1 X%lf Y%lf E%lf" % (self.m2g(x), self.m2g(y), extruded), file=self.output_stream)
-                                inside = False
 
-    def is_edge(self, edge, x, y):
-        if [x, y] in edge and self.check_grid(x, y) == 3:
-            return True
-        else:
-            return False
+    def scanline(self, line, reverse):
+        """
+        line[in]: bool array, filled cells of a row(or column)
+        reverse[in]: scan from the end
+        return [(first filled cell, first empty cell after it), ...] of each run, in scanning order
+        """
+        change = np.flatnonzero(np.diff(np.concatenate(([False], line, [False])).astype(np.int8)))
+        starts, ends = change[0::2], change[1::2]  # [start, end) of each run
+        if reverse:
+            return list(zip((ends - 1).tolist()[::-1], (starts - 1).tolist()[::-1]))
+        return list(zip(starts.tolist(), ends.tolist()))
 
     def dist(self, x, y, x2, y2):
         return sqrt((x - x2) * (x - x2) + (y - y2) * (y - y2))
@@ -209,133 +155,127 @@ G1 F1800
     def g2m(self, val):
         return round(val / self.resolution) + ceil(86 / self.resolution)
 
-    def check_grid(self, x, y):
-        if x >= 0 and y >= 0 and x < self.width and y < self.width:
-            return self.grid[x][y]
-        return 0
-
-    def fill_grid(self, gcode):
-        self.grid = np.zeros((ceil(172 / self.resolution), ceil(172 / self.resolution)))
-        self.width = ceil(172 / self.resolution)
-        print("Grid size %d^2" % len(self.grid), file=sys.stderr)
+    def read_path(self, gcode):
+        """
+        read moves of the first few layers(until z > 2), skip skirt
+        lines read are kept in self.head
+        return (points, extruding): xy of each move (n, 2), starting from origin,
+                                    and whether the move to each point extrudes (n,)
+        """
         x = y = z = 0
-        expansion = self.expansion / self.resolution
-        last_point = [0, 0]
-        min_division = self.resolution * expansion / 10.0
-        for ln in range(0, len(gcode)):
-            line = gcode[ln]
+        points = [(0., 0.)]
+        extruding = [False]
+        self.head = []
+        for line in gcode:
+            self.head.append(line)
             if "skirt" in line:
                 continue
             if z > 2:
                 print("Gcode parsing end", file=sys.stderr)
                 break
             if self.move_re.match(line):
+                axes = set()
                 for (axis, number) in self.axis_re.findall(line):
+                    axes.add(axis)
                     if axis == 'X':
                         x = float(number)
-                    if axis == 'Y':
+                    elif axis == 'Y':
                         y = float(number)
-                    if axis == 'Z':
+                    elif axis == 'Z':
                         z = float(number)
+                points.append((x, y))
+                extruding.append('E' in axes and ('X' in axes or 'Y' in axes))
+        return np.array(points), np.array(extruding)
 
-                    if (x - last_point[0]) * (x - last_point[0]) + (y - last_point[1]) * (y - last_point[1]) > min_division * min_division:
-                        denom = int(ceil(sqrt((x - last_point[0]) * (x - last_point[0]) + (y - last_point[1]) * (y - last_point[1])) / min_division))
-                        for numer in range(0, denom + 1):
-                            lx = last_point[0] + (x - last_point[0]) * numer / denom
-                            ly = last_point[1] + (y - last_point[1]) * numer / denom
-                            (rx, ry) = (self.g2m(lx), self.g2m(ly))
-                            self.fill_circle(rx, ry, 0, 0, expansion * expansion)
-                    else:
-                        (rx, ry) = (self.g2m(x), self.g2m(y))
-                        self.fill_circle(rx, ry, 0, 0, expansion * expansion)
-
-                    last_point = [x, y]
-
+    def fill_grid(self, gcode):
+        """
+        rasterize extruding moves and expand them by self.expansion mm
+        grid[x][y] is 1 for cells within expansion of any extruded path
+        """
+        self.width = ceil(172 / self.resolution)
+        print("Grid size %d^2" % self.width, file=sys.stderr)
+        points, extruding = self.read_path(gcode)
+
+        # sample every extruded segment with step less than a cell
+        begin, end = points[:-1][extruding[1:]], points[1:][extruding[1:]]
+        n = np.ceil(np.sqrt(((end - begin) ** 2).sum(axis=1)) / self.resolution).astype(np.int64) + 1
+        segment = np.repeat(np.arange(len(n)), n)
+        t = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / np.maximum(n - 1, 1)[segment]
+        samples = begin[segment] + (end - begin)[segment] * t[:, None]
+
+        cells = np.rint(samples / self.resolution).astype(np.int64) + ceil(86 / self.resolution)
+        cells = cells[((cells >= 0) & (cells < self.width)).all(axis=1)]
+        seeds = np.zeros((self.width, self.width), bool)
+        seeds[cells[:, 0], cells[:, 1]] = True
+
+        # dilate with a disk: cells closer than expansion to any sample
+        expansion = self.expansion / self.resolution
+        self.grid = np.zeros((self.width, self.width), np.uint8)
+        if seeds.any():
+            distance = ndimage.distance_transform_edt(~seeds)
+            self.grid[np.rint(distance * distance) < expansion * expansion] = 1
         return self.grid
 
-    def fill_circle(self, rx, ry, x, y, r):
-        Q = Queue()
-        Q.put([x, y])
-        while not Q.empty():
-            n = Q.get()
-            (x, y) = n
-            if x * x + y * y < r:
-                if rx + x >= 0 and ry + y >= 0 and rx + x < self.width and ry + y < self.width and self.grid[rx + x][ry + y] == 0:
-                    self.grid[rx + x][ry + y] = 1
-                    Q.put([x - 1, y])
-                    Q.put([x + 1, y])
-                    Q.put([x, y - 1])
-                    Q.put([x, y + 1])
-
     #find all connected islands
     def find_islands(self):
-        islands = []
-        #iterate all points on grid
-        for x in range(0, self.width):
-            for y in range(0, self.width):
-                if self.grid[x][y] == 1:
-                    edge = []
-                    self.find_all_connected_points(edge, x, y)
-                    islands.append(edge)
-
-        return islands
-
-    #flood grouping
-    def find_all_connected_points(self, edge, x, y):
-        grid = self.grid
-        width = len(self.grid)
-        Q = Queue()
-        if x >= width or y >= width or x < 0 or y < 0:
-            return
-        if self.grid[x][y] != 1:
-            return
-
-        Q.put([x, y])
-
-        while not Q.empty():
-            n = Q.get()
-            (x, y) = n
-
-            if self.grid[x][y] == 1:
-                #Edge detection
-                #If surrounded by filled area, then it's not
-                if self.check_grid(x, y - 1) > 0 and self.check_grid(x - 1, y) > 0 and self.check_grid(x + 1, y) > 0 and self.check_grid(x, y + 1) > 0:
-                    self.grid[x][y] = 2
-                else:  # n is on edge
-                    edge.append([x, y])
-                    self.grid[x][y] = 3
-                if self.check_grid(x - 1, y) == 1:
-                    Q.put([x - 1, y])
-                if self.check_grid(x + 1, y) == 1:
-                    Q.put([x + 1, y])
-                if self.check_grid(x, y - 1) == 1:
-                    Q.put([x, y - 1])
-                if self.check_grid(x, y + 1) == 1:
-                    Q.put([x, y + 1])
+        """
+        label connected(4-neighbour) islands on grid, mark edge cells as 3, inner cells as 2
+        return ordered outer edge of each island, [(n, 2) array of cells, ...]
+        """
+        filled = self.grid > 0
+        self.labels, count = ndimage.label(filled)
+        inner = ndimage.binary_erosion(filled, border_value=0)
+        self.grid[filled] = 3
+        self.grid[inner] = 2
+
+        # first cell of each island in scan order
+        index = np.flatnonzero(self.labels)
+        first = index[np.unique(self.labels.ravel()[index], return_index=True)[1]]
+        return [self.trace_contour(start // self.width, start % self.width) for start in first.tolist()]
+
+    def trace_contour(self, x, y):
+        """
+        trace the outer boundary of the island containing cell (x, y) in order(Moore-neighbour tracing)
+        (x, y) has to be its first cell in scan order, so (x - 1, y) is outside
+        return (n, 2) array of cells
+        """
+        label = self.labels[x, y]
+        inside = np.pad(self.labels == label, 1).tolist()  # padded, so neighbours are never out of range
+        start = (x, y)
+        contour = [start]
+        backtrack = 0  # direction from current cell to the last outside cell checked
+        second = None
+        while True:
+            for k in range(1, 9):
+                d = (backtrack + k) % 8
+                nx, ny = x + NEIGHBOURS[d][0], y + NEIGHBOURS[d][1]
+                if inside[nx + 1][ny + 1]:
+                    break
+            else:  # single cell
+                break
+            # the cell checked before (nx, ny) is outside, seen from (nx, ny)
+            px, py = x + NEIGHBOURS[(d - 1) % 8][0], y + NEIGHBOURS[(d - 1) % 8][1]
+            backtrack = NEIGHBOUR_INDEX[(px - nx, py - ny)]
+            if second is None:
+                second = (nx, ny)
+            elif (x, y) == start and (nx, ny) == second:
+                contour.pop()  # back to start
+                break
+            x, y = nx, ny
+            contour.append((x, y))
+        return np.array(contour, np.int64)
 
     #debug tool
     def output_grid(self):
         from PIL import Image
-        im = np.zeros((self.width, self.width, 3))
-        for x in range(0, self.width):
-            for y in range(0, self.width):
-                if self.grid[x][y] == 1:
-                    im[x][y] = [0, 255, 0]
-                elif self.grid[x][y] == 2:
-                    im[x][y] = [0, 0, 255]
-                elif self.grid[x][y] == 3:
-                    im[x][y] = [255, 0, 0]
-                elif self.grid[x][y] == 4:
-                    im[x][y] = [0, 128, 255]
-                else:
-                    im[x][y] = [255, 255, 255]
-
-        Image.fromarray(im.astype(np.uint8)).save("grid.png")
+        colors = np.array([[255, 255, 255], [0, 255, 0], [0, 0, 255], [255, 0, 0], [0, 128, 255]], np.uint8)
+        Image.fromarray(colors[self.grid]).save("grid.png")
 
     def main(self, gcode, output_stream, debug):
-        if type(gcode) == str:
-            with open(gcode) as f:
-                gcode = f.readlines()
+        """
+        gcode[in]: gcode file path, or lines of gcode
+        output_stream[in]: text stream to write gcode with raft to
+        """
         self.output_stream = output_stream
 
         self.resolution = 0.5
@@ -343,13 +283,13 @@ G1 F1800
         self.first_layer = 0.3  # equal to first layer height
         self.layer_height = 0.2  # equal to layer height
         self.count = 3  # equal to raft layers
-        self.process(gcode)
+        if type(gcode) == str:
+            with open(gcode) as f:
+                self.process(f)
+        else:
+            self.process(gcode)
 
 
 if __name__ == '__main__':
-    #Read gcode
-    fname = sys.argv[1]
-    with open(fname) as f:
-        gcode = f.readlines()
     raft = Raft()
-    raft.main(gcode, output_stream=sys.stdout, debug=True)
+    raft.main(sys.argv[1], output_stream=sys.stdout, debug=True)
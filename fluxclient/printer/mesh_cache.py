@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+import logging
+import os
+
+import numpy as np
+
+from fluxclient.printer import _printer
+
+logger = logging.getLogger(__name__)
+
+MESH_CACHE_BUDGET = 256 * 1024 * 1024  # bytes kept in memory
+HASH_CHUNK = 1024 * 1024  # bytes hashed at a time when reading a file
+
+
+def buffer_digest(buf):
+    """
+    buf[in]: bytes, or a file path
+    return hex sha1 of the content
+    """
+    h = sha1()
+    if type(buf) == str:
+        with open(buf, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                h.update(chunk)
+    else:
+        h.update(buf)
+    return h.hexdigest()
+
+
+class MeshEntry(object):
+    """
+    a parsed model: points (n, 3) and faces (m, 3) as read-only arrays,
+    with the _printer.MeshObj built from them on first use
+    entries are shared between models and slicers, MeshObj must not be modified,
+    copy it with add_on before transforming
+    """
+    def __init__(self, key, points, faces):
+        self.key = key
+        self.points = points
+        self.faces = faces
+        self.points.flags.writeable = False
+        self.faces.flags.writeable = False
+        self._mesh = None
+        self._decimated = {}
+        self.counted = 0  # nbytes counted in MeshCache.size
+
+    def __iter__(self):
+        # so that "points, faces = entry" still works
+        return iter((self.points, self.faces))
+
+    @property
+    def mesh(self):
+        if self._mesh is None:
+            self._mesh = self.build_mesh()
+        return self._mesh
+
+    def build_mesh(self):
+        """
+        a new MeshObj from points and faces, not kept by the entry
+        """
+        return _printer.MeshObj.from_arrays(np.ascontiguousarray(self.points, np.float32),
+                                            np.ascontiguousarray(self.faces, np.int32))
+
+    def copy_mesh(self):
+        """
+        a new MeshObj with the same content, safe to transform
+        """
+        m_mesh = _printer.MeshObj([], [])
+        m_mesh.add_on(self.mesh)
+        return m_mesh
+
+    def decimate(self, target_faces, max_error):
+        """
+        simplified copy of the model, memoized, the full MeshObj is not kept for it
+        target_faces[in], max_error[in]: see MeshObj.decimate
+        return (points, faces) as read-only arrays, call MeshCache.touch after to count them
+        """
+        key = (target_faces, max_error)
+        if key not in self._decimated:
+            m_mesh = self.build_mesh()
+            m_mesh.decimate(target_faces, max_error)
+            points, faces = m_mesh.to_arrays()
+            points.flags.writeable = False
+            faces.flags.writeable = False
+            self._decimated[key] = (points, faces)
+        return self._decimated[key]
+
+    @property
+    def nbytes(self):
+        """
+        rough memory used, including the built MeshObj(points in float, faces in pcl::Vertices)
+        """
+        size = self.points.nbytes + self.faces.nbytes
+        if self._mesh is not None:
+            size += len(self.points) * 16 + len(self.faces) * 40
+        for points, faces in self._decimated.values():
+            size += points.nbytes + faces.nbytes
+        return size
+
+
+class MeshCache(object):
+    """
+    parsed models keyed by the hash of the uploaded buffer,
+    least recently used ones are dropped when using more than budget bytes,
+    or written to spill_dir(if given) and read back when needed again
+
+    cache.load(buf, 'stl', StlSlicer.read_stl) -> MeshEntry
+    """
+    def __init__(self, budget=MESH_CACHE_BUDGET, spill_dir=None):
+        self.budget = budget
+        self.spill_dir = spill_dir
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = Lock()
+
+    def spill_path(self, key):
+        return os.path.join(self.spill_dir, key + '.npz')
+
+    def get(self, key):
+        """
+        return the MeshEntry of key, None if not cached
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        if self.spill_dir and os.path.isfile(self.spill_path(key)):
+            try:
+                with np.load(self.spill_path(key)) as data:
+                    return self.put(key, data['points'], data['faces'])
+            except (OSError, ValueError, KeyError):
+                logger.warning('broken mesh cache file %s', self.spill_path(key))
+        return None
+
+    def put(self, key, points, faces):
+        """
+        add a parsed model into cache
+        return the MeshEntry
+        """
+        entry = MeshEntry(key, points, faces)
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries[key].counted
+            self.entries[key] = entry
+            entry.counted = entry.nbytes
+            self.size += entry.counted
+            self.shrink()
+        return entry
+
+    def load(self, buf, buf_type, reader):
+        """
+        buf[in]: bytes or a file path, the model file
+        buf_type[in]: 'stl', 'obj'...
+        reader[in]: function parsing buf into (points, faces), only called when not cached
+        return the MeshEntry
+        """
+        key = '%s-%s' % (buffer_digest(buf), buf_type)
+        entry = self.get(key)
+        if entry is None:
+            points, faces = reader(buf)
+            entry = self.put(key, points, faces)
+        return entry
+
+    def touch(self, entry):
+        """
+        update the size of entry after it grows(MeshObj built or decimated), and mark it used
+        """
+        with self.lock:
+            if self.entries.get(entry.key) is entry:
+                nbytes = entry.nbytes
+                self.size += nbytes - entry.counted
+                entry.counted = nbytes
+                self.entries.move_to_end(entry.key)
+                self.shrink()
+
+    def shrink(self):
+        """
+        drop least recently used entries until within budget, the newest one is always kept
+        (lock must be held)
+        """
+        while self.size > self.budget and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            self.size -= entry.counted
+            if self.spill_dir and not os.path.isfile(self.spill_path(key)):
+                try:
+                    os.makedirs(self.spill_dir, exist_ok=True)
+                    tmp_path = self.spill_path(key) + '.tmp'
+                    with open(tmp_path, 'wb') as f:
+                        np.savez(f, points=entry.points, faces=entry.faces)
+                    os.replace(tmp_path, self.spill_path(key))
+                except OSError:
+                    logger.warning('can not write mesh cache file %s', self.spill_path(key))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+mesh_cache = MeshCache()
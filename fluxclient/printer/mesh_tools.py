@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+mesh operations on numpy arrays, for meshes given as
+points: float (n, 3) and faces: int (m, 3) of point index
+"""
+from math import cos, sin
+import struct
+
+import numpy as np
+
+STL_HEADER = b'FLUX 3d printer: flux3dp.com, 2015'.ljust(80)
+# binary stl facet
+STL_FACET = np.dtype([('normal', '<f4', (3,)), ('vertex', '<f4', (3, 3)), ('attribute', '<u2')])
+
+
+def transform(points, parameter):
+    """
+    same as MeshObj.apply_transform
+    parameter[in]: x, y, z, rx, ry, rz, sc_x, sc_y, sc_z
+    scale, move the center of bounding box to origin, rotate around x, y, then z axis, and move to (x, y, z)
+    return float32 (n, 3)
+    """
+    x, y, z, rx, ry, rz, sc_x, sc_y, sc_z = [float(i) for i in parameter]
+    p = points * np.array([sc_x, sc_y, sc_z])
+    if len(p):
+        p -= (p.min(axis=0) + p.max(axis=0)) / 2
+    rotate_x = np.array([[1, 0, 0], [0, cos(rx), -sin(rx)], [0, sin(rx), cos(rx)]])
+    rotate_y = np.array([[cos(ry), 0, sin(ry)], [0, 1, 0], [-sin(ry), 0, cos(ry)]])
+    rotate_z = np.array([[cos(rz), -sin(rz), 0], [sin(rz), cos(rz), 0], [0, 0, 1]])
+    p = p.dot(rotate_z.dot(rotate_y).dot(rotate_x).T)
+    p += [x, y, z]
+    return p.astype(np.float32)
+
+
+def merge(meshes):
+    """
+    meshes[in]: [(points, faces), ...]
+    return (points, faces) of all meshes in one
+    """
+    if not meshes:
+        return np.zeros((0, 3), np.float32), np.zeros((0, 3), np.int64)
+    offsets = np.cumsum([0] + [len(points) for points, _ in meshes[:-1]])
+    points = np.concatenate([points for points, _ in meshes])
+    faces = np.concatenate([faces + offset for (_, faces), offset in zip(meshes, offsets)])
+    return points, faces
+
+
+def intersect(a, b, floor_v):
+    """
+    points on segments a[i] -> b[i] at z = floor_v
+    """
+    t = (floor_v - a[:, 2]) / (b[:, 2] - a[:, 2])
+    return a + t[:, None] * (b - a)
+
+
+def cut(points, faces, floor_v):
+    """
+    same as MeshObj.cut, remove the part under z = floor_v(included)
+    faces across floor are split, new points are appended after points
+    return (points, faces)
+    """
+    under = points[faces, 2] <= floor_v
+    count = under.sum(axis=1)
+    # faces each face becomes: all above -> itself, 2 under -> 1, 1 under -> 3, all under -> none
+    n_out = np.array([1, 3, 1, 0])[count]
+    start = np.cumsum(n_out) - n_out
+    out = np.empty((n_out.sum(), 3), np.int64)
+    out[start[count == 0]] = faces[count == 0]
+
+    # vertices of each face in [above..., under...] order, each part in original order
+    order = np.take_along_axis(faces, np.argsort(under, axis=1, kind='stable'), axis=1)
+    new_points = [points]
+    base = len(points)
+
+    # 2 under: (above, intersection to under0, intersection to under1)
+    two = order[count == 2]
+    above = points[two[:, 0]]
+    new_points += [intersect(above, points[two[:, 1]], floor_v), intersect(above, points[two[:, 2]], floor_v)]
+    i = np.arange(len(two))
+    out[start[count == 2]] = np.column_stack((two[:, 0], base + i, base + len(two) + i))
+    base += 2 * len(two)
+
+    # 1 under: split into 3 faces with middle point of the 2 above
+    one = order[count == 1]
+    above0, above1, below = points[one[:, 0]], points[one[:, 1]], points[one[:, 2]]
+    new_points += [(above0 + above1) / 2, intersect(above0, below, floor_v), intersect(above1, below, floor_v)]
+    i = np.arange(len(one))
+    mid, i0, i1 = base + i, base + len(one) + i, base + 2 * len(one) + i
+    s = start[count == 1]
+    out[s] = np.column_stack((one[:, 0], i0, mid))
+    out[s + 1] = np.column_stack((mid, i0, i1))
+    out[s + 2] = np.column_stack((mid, i1, one[:, 1]))
+
+    return np.concatenate(new_points).astype(points.dtype), out
+
+
+def bounding_box(points, faces):
+    """
+    bounding box of points used by faces
+    return [[min x, min y, min z], [max x, max y, max z]]
+    """
+    used = np.zeros(len(points), bool)
+    used[faces.ravel()] = True
+    if not used.any():
+        return [[float('inf')] * 3, [float('-inf')] * 3]
+    return [points[used].min(axis=0).tolist(), points[used].max(axis=0).tolist()]
+
+
+def face_normals(tri):
+    """
+    unit normal(right hand) of each triangle
+    tri[in]: (m, 3, 3)
+    """
+    tri = tri.astype(np.float64)
+    n = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    l = np.sqrt((n ** 2).sum(axis=1))
+    np.divide(n, l[:, None], out=n, where=l[:, None] != 0)
+    return n
+
+
+def write_stl(points, faces, output):
+    """
+    write mesh as binary stl
+    output[in]: file path or binary file object
+    """
+    facets = np.zeros(len(faces), STL_FACET)
+    facets['vertex'] = points[faces]
+    facets['normal'] = face_normals(facets['vertex'])
+    header = STL_HEADER + struct.pack('<I', len(faces))
+    if type(output) == str:
+        with open(output, 'wb') as f:
+            f.write(header)
+            facets.tofile(f)
+    else:
+        output.write(header)
+        output.write(facets.tobytes())
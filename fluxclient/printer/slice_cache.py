@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+from hashlib import sha1
+from threading import Lock
+import logging
+import shutil
+import json
+import os
+
+from fluxclient.fcode.fcode_base import PathStore
+from fluxclient.printer.slicer_settings import settings_digest
+from fluxclient.utils.cache_dir import user_cache_dir, is_private_dir, make_private_dir
+
+logger = logging.getLogger(__name__)
+
+SLICE_CACHE_DIR = user_cache_dir('slice')
+SLICE_CACHE_BUDGET = 512 * 1024 * 1024  # bytes kept on disk
+SLICE_FILES = ('.gcode', '.fc', '.path', '.json')  # files of a result, in the order put moves them in place
+
+
+def slice_digest(engine, meshes, config, image=b'', ext_metadata=None):
+    """
+    engine[in]: str naming the slicer(eg. class name and its path)
+    meshes[in]: [(mesh digest, transform parameter), ...] of models being sliced, in order
+    config[in]: SlicerSettings, or dict of settings as from my_ini_parser
+    image[in]: preview image put into fcode
+    ext_metadata[in]: extra fcode metadata
+    return hex digest identifying the slicing result
+    """
+    h = sha1(engine.encode('utf8'))
+    for digest, parameter in meshes:
+        h.update(('\nmesh %s %s' % (digest, ' '.join(repr(float(i)) for i in parameter))).encode('utf8'))
+    h.update(('\nconfig %s' % settings_digest(config)).encode('utf8'))
+    ext_metadata = ext_metadata or {}
+    for key in sorted(ext_metadata):
+        h.update(('\nmeta %s=%s' % (key, ext_metadata[key])).encode('utf8'))
+    h.update(b'\nimage ' + sha1(image).digest())
+    return h.hexdigest()
+
+
+class SliceCache(object):
+    """
+    slicing results(gcode, fcode, preview path and metadata) on disk, keyed by slice_digest
+    least recently used results are removed when using more than budget bytes
+    results are sent to printers as they are, so nothing is read or written unless the directory
+    is private(see make_private_dir)
+    """
+    def __init__(self, cache_dir=SLICE_CACHE_DIR, budget=SLICE_CACHE_BUDGET):
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.lock = Lock()
+
+    def file_path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def get(self, key, output_type):
+        """
+        output_type[in]: '-g' for gcode, '-f' for fcode
+        return (output, metadata, path, warnings), None if not cached
+        """
+        if not is_private_dir(self.cache_dir):
+            return None
+        try:
+            with open(self.file_path(key, '.json')) as f:
+                info = json.load(f)
+            ext = '.gcode' if output_type == '-g' else '.fc'
+            with open(self.file_path(key, ext), 'rb') as f:
+                output = f.read()
+            if len(output) != info['sizes'][ext]:
+                return None  # not from the same put as .json
+            path = None
+            if info['path']:
+                with open(self.file_path(key, '.path'), 'rb') as f:
+                    path = PathStore.from_binary(f.read())
+            for ext in SLICE_FILES:
+                os.utime(self.file_path(key, ext))  # mark as used
+        except (OSError, ValueError, KeyError):
+            return None
+        return output, info['metadata'], path, info['warnings']
+
+    def put(self, key, gcode_file, fcode, metadata, path, warnings=()):
+        """
+        gcode_file[in]: path of gcode file, copied into cache
+        fcode[in]: bytes of fcode
+        metadata[in]: [TIME_COST, FILAMENT_USED]
+        path[in]: PathStore of preview path, or None
+        warnings[in]: warning messages while slicing
+        """
+        if not make_private_dir(self.cache_dir):
+            logger.warning('%s is not a private directory, slicing result is not cached', self.cache_dir)
+            return
+        # every file is written to a .tmp first then moved in place, so get never reads a half written one
+        try:
+            shutil.copyfile(gcode_file, self.file_path(key, '.gcode.tmp'))
+            with open(self.file_path(key, '.fc.tmp'), 'wb') as f:
+                f.write(fcode)
+            with open(self.file_path(key, '.path.tmp'), 'wb') as f:
+                if isinstance(path, PathStore):
+                    f.write(path.to_binary(quantize=False))
+            sizes = {'.gcode': os.path.getsize(self.file_path(key, '.gcode.tmp')), '.fc': len(fcode)}
+            with open(self.file_path(key, '.json.tmp'), 'w') as f:
+                json.dump({'metadata': metadata, 'path': isinstance(path, PathStore), 'warnings': list(warnings),
+                           'sizes': sizes}, f)
+            for ext in SLICE_FILES:
+                os.replace(self.file_path(key, ext + '.tmp'), self.file_path(key, ext))
+        except OSError:
+            logger.warning('can not write slice cache %s', key)
+            return
+        self.shrink()
+
+    def shrink(self):
+        """
+        remove least recently used results until within budget
+        """
+        with self.lock:
+            results = {}  # key: [last used, size]
+            try:
+                for entry in os.scandir(self.cache_dir):
+                    key, ext = os.path.splitext(entry.name)
+                    if ext == '.tmp':  # left by a failed put
+                        key, ext = os.path.splitext(key)
+                    if ext not in SLICE_FILES:
+                        continue
+                    stat = entry.stat()
+                    result = results.setdefault(key, [0, 0])
+                    result[0] = max(result[0], stat.st_mtime)
+                    result[1] += stat.st_size
+            except OSError:
+                return
+            size = sum(i[1] for i in results.values())
+            for key in sorted(results, key=lambda k: results[k][0]):
+                if size <= self.budget:
+                    break
+                size -= results[key][1]
+                for ext in SLICE_FILES:
+                    for name in (ext, ext + '.tmp'):
+                        try:
+                            os.remove(self.file_path(key, name))
+                        except OSError:
+                            pass
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+slice_cache = SliceCache()
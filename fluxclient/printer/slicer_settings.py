@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+slicer settings as immutable objects identified by a digest, with validation
+and ini files cached, so slicing again with the same settings parses and writes nothing
+"""
+from collections.abc import Mapping
+from functools import lru_cache
+from hashlib import sha1
+from threading import Lock
+import tempfile
+import logging
+import atexit
+import shutil
+import os
+
+from fluxclient.printer import ini_constraint
+from fluxclient.utils.cache_dir import user_cache_dir, make_private_dir
+
+logger = logging.getLogger(__name__)
+
+INI_CACHE_DIR = user_cache_dir('ini')
+INI_CACHE_FILES = 64  # ini files kept on disk
+
+
+class SlicerSettings(Mapping):
+    """
+    settings of slicer, str key -> str value as in a slic3r ini file
+    it can't be modified, updated returns a new one
+    digest identifies the settings, so it can be a key of other caches
+    """
+    __slots__ = ('_values', '_digest')
+
+    def __init__(self, values=()):
+        self._values = dict(values)
+        self._digest = None
+
+    @classmethod
+    def parse(cls, data):
+        """
+        data[in]: [str] indicating a file path or [list of str] indicating lines of ini file
+        lines starting with '#' are comments
+        """
+        if type(data) == str:
+            with open(data, 'r') as f:
+                lines = f.readlines()
+        else:
+            lines = data
+
+        values = {}
+        for i in lines:
+            if i[0] == '#':
+                pass
+            elif '=' in i:
+                tmp = i.rstrip().split('=')
+                values[tmp[0].strip()] = tmp[1].strip()
+            else:
+                logger.error(i)
+                raise ValueError('not ini file?')
+        return cls(values)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __eq__(self, other):
+        if isinstance(other, SlicerSettings):
+            return self.digest == other.digest
+        return Mapping.__eq__(self, other)
+
+    def __repr__(self):
+        return '<SlicerSettings %s>' % self.digest
+
+    @property
+    def digest(self):
+        """
+        hex sha1 of sorted key=value lines
+        """
+        if self._digest is None:
+            h = sha1()
+            for key in sorted(self._values):
+                h.update(('\n%s=%s' % (key.strip(), str(self._values[key]).strip())).encode('utf8'))
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def getint(self, key, default=None):
+        if key not in self._values:
+            return default
+        return int(self._values[key])
+
+    def getfloat(self, key, default=None):
+        """
+        percentage like '20%' gives 20.
+        """
+        if key not in self._values:
+            return default
+        return float(self._values[key].rstrip('%'))
+
+    def updated(self, changes):
+        """
+        changes[in]: dict or [(key, value), ...], applied in order
+        return new settings with changes, or self if nothing changed
+        """
+        values = dict(self._values)
+        values.update(changes)
+        if values == self._values:
+            return self
+        return type(self)(values)
+
+    def check(self, key, value):
+        """
+        key[in]: str
+        value[in]: str
+        return: 'ok', 'ignore' or error message
+        check whether (key, value) pair is valid according to ini_constraint
+        """
+        if key not in self._values:
+            return 'key not exist: %s' % key
+        if value.strip() == 'default':
+            return 'ok'
+        constraint = ini_constraint.get(key)
+        if not constraint:
+            return 'ok'
+        try:
+            return check_value(key, value, tuple(constraint))
+        except TypeError:  # unhashable arguments, eg. white list of finite_choice
+            return constraint[0](key, value, *constraint[1:])
+
+
+@lru_cache(maxsize=4096)
+def check_value(key, value, constraint):
+    """
+    constraint[in]: (checking function, extra arguments...), as in ini_constraint
+    results are cached, constraint is part of the key since ini_constraint may change
+    """
+    return constraint[0](key, value, *constraint[1:])
+
+
+@lru_cache(maxsize=256)
+def parse_setting_lines(text):
+    """
+    parse advanced setting text
+    use '#' as comment symbol (different from wiki's ini file standard)
+    return ((line number, key, value), ...), ((line number, error message), ...)
+    """
+    pairs = []
+    bad_lines = []
+    for counter, line in enumerate(text.split('\n'), 1):
+        if '#' in line:  # clean up comement
+            line = line[:line.index('#')].strip()
+        if '=' in line:
+            key, value = map(lambda x: x.strip(), line.split('=', 1))
+            pairs.append((counter, key, value))
+        elif line != '' and line != 'default':
+            bad_lines.append((counter, 'syntax error: %s' % line))
+    return tuple(pairs), tuple(bad_lines)
+
+
+def settings_digest(config):
+    """
+    config[in]: SlicerSettings or dict of settings
+    """
+    if not isinstance(config, SlicerSettings):
+        config = SlicerSettings(config)
+    return config.digest
+
+
+class IniCache(object):
+    """
+    ini files written from settings, keyed by settings digest and how they are written
+    files are shared, they must not be modified or removed by users
+    only files written by this process are used again, slic3r runs whatever the ini file says
+    the directory must be private(see make_private_dir), or a temporary directory of this process is used instead
+    least recently used files are removed when there are more than max_files
+    """
+    def __init__(self, cache_dir=INI_CACHE_DIR, max_files=INI_CACHE_FILES):
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self.lock = Lock()
+        self.written = set()  # paths of files written by this process
+        self.fallback_dir = None
+
+    def directory(self):
+        """
+        return cache_dir if it's private, or a private temporary directory removed at exit
+        """
+        if make_private_dir(self.cache_dir):
+            return self.cache_dir
+        with self.lock:
+            if self.fallback_dir is None:
+                logger.warning('%s is not a private directory, ini files are written to a temporary one', self.cache_dir)
+                self.fallback_dir = tempfile.mkdtemp(prefix='fluxclient_ini_')
+                atexit.register(shutil.rmtree, self.fallback_dir, True)
+        return self.fallback_dir
+
+    def get(self, settings, writer, delete=None):
+        """
+        settings[in]: SlicerSettings
+        writer[in]: writer(file_path, settings, delete), eg. StlSlicer.my_ini_writer
+        delete[in]: passed to writer
+        return path of the ini file
+        """
+        h = sha1(settings.digest.encode('utf8'))
+        h.update(('\n%s.%s %r' % (writer.__module__, writer.__qualname__, delete)).encode('utf8'))
+        cache_dir = self.directory()
+        file_path = os.path.join(cache_dir, h.hexdigest() + '.ini')
+        if file_path in self.written:
+            try:
+                os.utime(file_path)  # mark as used
+                return file_path
+            except OSError:
+                pass
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+        os.close(fd)
+        try:
+            writer(tmp_path, settings, delete)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with self.lock:
+            self.written.add(file_path)
+        self.shrink(cache_dir)
+        return file_path
+
+    def shrink(self, cache_dir=None):
+        """
+        remove least recently used files until at most max_files left
+        """
+        cache_dir = cache_dir or self.cache_dir
+        with self.lock:
+            try:
+                entries = [(entry.stat().st_mtime, entry.path) for entry in os.scandir(cache_dir) if entry.name.endswith('.ini')]
+            except OSError:
+                return
+            entries.sort()
+            for _, path in entries[:max(0, len(entries) - self.max_files)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                self.written.discard(path)
+
+    def clear(self):
+        with self.lock:
+            self.written.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+ini_cache = IniCache()
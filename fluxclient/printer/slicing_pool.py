@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from queue import Queue, Empty
+from threading import Lock
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SLICING_WORKERS = max(1, (os.cpu_count() or 1) // 2)  # slicing jobs running at the same time
+
+
+class SlicingJob(object):
+    """
+    a slicing job in SlicingPool
+
+    progress is reported as events, dicts with at least 'job' and 'slice_status'
+    ('computing', 'warning', 'complete' or 'error'), they are put into job.events
+    and passed to callback(job, event) if given
+    the last event('complete' or 'error') also carries 'result': [output, metadata, path],
+    or [False, [error code, message], path]
+    """
+    def __init__(self, job_id, key, tmp_files=(), callback=None):
+        self.id = job_id
+        self.key = key
+        self.tmp_files = list(tmp_files)
+        self.callback = callback
+        self.events = Queue()
+        self.processes = []  # subprocess started by the job
+        self.cancelled = False
+        self.future = None
+        self.lock = Lock()
+
+    def emit(self, slice_status, **event):
+        event['job'] = self.id
+        event['slice_status'] = slice_status
+        self.events.put(event)
+        if self.callback:
+            self.callback(self, event)
+
+    def get_events(self):
+        """
+        return events not read yet
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except Empty:
+                return events
+
+    def add_process(self, process):
+        """
+        register a subprocess, so it's terminated when the job is cancelled
+        """
+        with self.lock:
+            self.processes.append(process)
+            if self.cancelled:
+                process.terminate()
+
+    def cancel(self):
+        """
+        cancel the job, terminate its processes if it's running
+        """
+        with self.lock:
+            self.cancelled = True
+            for process in self.processes:
+                if process.poll() is None:
+                    process.terminate()
+        if self.future is not None and self.future.cancel():
+            self.cleanup()  # never started
+
+    def cleanup(self):
+        for filename in self.tmp_files:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+
+class SlicingPool(object):
+    """
+    run slicing jobs on at most workers threads
+    jobs are submitted with a key(eg. a slicer's model set),
+    a new job cancels the older one with the same key
+    """
+    def __init__(self, workers=SLICING_WORKERS):
+        self.executor = ThreadPoolExecutor(workers)
+        self.jobs = {}  # the latest job of each key
+        self.job_ids = count(1)
+        self.lock = Lock()
+
+    def submit(self, key, target, args=(), tmp_files=(), callback=None):
+        """
+        key[in]: hashable, jobs with the same key replace each other
+        target[in]: function called as target(job, *args) in a worker thread
+        tmp_files[in]: files to remove when the job finishes or is cancelled
+        callback[in]: callback(job, event) called for every progress event
+        return SlicingJob
+        """
+        with self.lock:
+            job = SlicingJob(next(self.job_ids), key, tmp_files, callback)
+            old_job = self.jobs.get(key)
+            self.jobs[key] = job
+        if old_job is not None:
+            logger.debug('job %d replaced by %d', old_job.id, job.id)
+            old_job.cancel()
+        job.future = self.executor.submit(self.run, job, target, args)
+        return job
+
+    def run(self, job, target, args):
+        try:
+            if not job.cancelled:
+                target(job, *args)
+        except Exception as e:
+            logger.exception('slicing job %d failed', job.id)
+            job.emit('error', error=5, info=str(e), result=[False, [5, str(e)], None])
+        finally:
+            job.cleanup()
+            with self.lock:
+                if self.jobs.get(job.key) is job:
+                    del self.jobs[job.key]
+
+    def cancel(self, key):
+        """
+        cancel the job with key
+        """
+        with self.lock:
+            job = self.jobs.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def shutdown(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+            self.jobs.clear()
+        for job in jobs:
+            job.cancel()
+        self.executor.shutdown(wait=True)
+
+
+slicing_pool = SlicingPool()
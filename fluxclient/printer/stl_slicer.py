@@ -1,37 +1,100 @@
 # !/usr/bin/env python3
 
 from struct import unpack, Struct, pack
-from io import BytesIO, StringIO
+from io import BytesIO
 import subprocess
 import tempfile
 import os
 from platform import platform
 import logging
-import copy
+from mmap import mmap, ACCESS_READ
 from fluxclient.utils._utils import Tools
 
+import numpy as np
+
 from PIL import Image
 
 from fluxclient.hw_profile import HW_PROFILE
-from fluxclient.printer import _printer
 from fluxclient.fcode.g_to_f import GcodeToFcode
-from fluxclient.scanner.tools import dot, normal, normalize
+from fluxclient.fcode.fcode_base import PathStore
 from fluxclient.printer import ini_string, ini_constraint, ignore
 from fluxclient.printer.flux_raft import Raft
+from fluxclient.printer.mesh_cache import mesh_cache
+from fluxclient.printer import mesh_tools, ascii_mesh
+from fluxclient.printer.mesh_tools import STL_FACET
+from fluxclient.printer.slicing_pool import slicing_pool
+from fluxclient.printer.slice_cache import slice_cache, slice_digest
+from fluxclient.printer.slicer_settings import SlicerSettings, ini_cache, parse_setting_lines
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_SETTINGS = SlicerSettings.parse(ini_string.split('\n'))
+
+# slicing events(see SlicingJob) in the form report_slicing gives
+STATUS_FORMAT = {
+    'computing': '{"slice_status": "computing", "message": "%(message)s", "percentage": %(percentage).2f}',
+    'warning': '{"slice_status": "warning", "message" : "%(message)s"}',
+    'complete': '{"slice_status": "complete", "length": %(length)d, "time": %(time).3f, "filament_length": %(filament_length).2f}',
+    'error': '{"slice_status": "error", "error": "%(error)d", "info": "%(info)s"}'
+}
 
-def read_until(f):
+def fix_winding(normals, vertices):
+    """
+    make faces right handed, in place
+    normals[in]: normal read in, array (n, 3)
+    vertices[in]: vertices of each face, array (n, 3, 3), v1 and v2 are swapped where
+                  right hand normal of v0, v1, v2 is against the normal read in
     """
-    eat all the empty line
+    v = vertices.astype(np.float64)
+    a = v[:, 1] - v[:, 0]  # vector v0 -> v1
+    b = v[:, 2] - v[:, 0]  # vector v0 -> v2
+    right_hand_normal = np.column_stack((a[:, 1] * b[:, 2] - a[:, 2] * b[:, 1],
+                                         a[:, 2] * b[:, 0] - a[:, 0] * b[:, 2],
+                                         a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]))
+    l = np.sqrt(right_hand_normal[:, 0] ** 2 + right_hand_normal[:, 1] ** 2 + right_hand_normal[:, 2] ** 2)
+    np.divide(right_hand_normal, l[:, None], out=right_hand_normal, where=l[:, None] != 0)
+    product = right_hand_normal * normals
+    swap = product[:, 0] + product[:, 1] + product[:, 2] < 0
+    vertices[swap, 1], vertices[swap, 2] = vertices[swap, 2], vertices[swap, 1].copy()
+
+
+def weld_vertices(vertices):
     """
-    while True:
-        l = f.readline().strip()
-        if len(l) != 0:
-            return l
-        if f.tell() == len(f.getvalue()):
-            return ''
+    merge vertices with the same coordinate
+    vertices[in]: vertices of each face, float array (n, 3, 3)
+    return (points, faces): unique points in order of first appearance (m, 3),
+                            and index of points of each face (n, 3)
+    """
+    points = np.ascontiguousarray(vertices.reshape(-1, 3) + vertices.dtype.type(0))  # -0.0 -> 0.0
+    if len(points) == 0:
+        return points, np.zeros((0, 3), np.int64)
+    # sort by a 64 bit hash of each point
+    keys = points.view(np.uint32 if points.dtype == np.float32 else np.uint64).astype(np.uint64)
+    h = keys[:, 0] * np.uint64(0x9E3779B97F4A7C15)
+    for i in range(1, 3):
+        h ^= h >> np.uint64(29)
+        h = (h ^ keys[:, i]) * np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(32)
+    order = np.argsort(h)
+    h = h[order]
+    new = np.empty(len(h), bool)  # first one of each point in sorted order
+    new[0] = True
+    np.not_equal(h[1:], h[:-1], out=new[1:])
+    sorted_points = points[order]
+    if not (new[1:] | (sorted_points[1:] == sorted_points[:-1]).all(axis=1)).all():
+        # hash collision, sort by coordinate instead
+        order = np.lexsort(keys.T[::-1])
+        sorted_points = points[order]
+        new[1:] = (sorted_points[1:] != sorted_points[:-1]).any(axis=1)
+
+    starts = np.flatnonzero(new)
+    first = np.minimum.reduceat(order, starts)  # first appearance of each point
+    appearance = np.argsort(first)
+    rank = np.empty(len(first), np.int64)
+    rank[appearance] = np.arange(len(first))
+    index = np.empty(len(points), np.int64)
+    index[order] = rank[np.cumsum(new) - 1]
+    return points[first[appearance]], index.reshape(-1, 3)
 
 
 class StlSlicer(object):
@@ -44,8 +107,12 @@ class StlSlicer(object):
         self.end_slicing()
 
     def reset(self, slic3r):
-        self.working_p = []  # process that are slicing
-        self.models = {}  # models data, store the buf(stl file)
+        self.job = None  # the latest SlicingJob
+        self.slicing_pool = slicing_pool
+        self.slice_cache = slice_cache  # results of slicing, on disk
+        self.ini_cache = ini_cache  # ini files of settings, on disk
+        self.models = {}  # models data, MeshEntry of each model
+        self.mesh_cache = mesh_cache  # parsed models shared by all slicers
         self.parameter = {}  # model's parameter
 
         # self.slic3r = '../Slic3r/slic3r.pl'  # slic3r's location
@@ -53,9 +120,9 @@ class StlSlicer(object):
         self.slic3r = slic3r
 
         # self.slic3r_setting = './fluxghost/assets/flux_slicing.ini'
-        self.config = self.my_ini_parser(ini_string.split('\n'))
-        # self.config = self.my_ini_parser(self.slic3r_setting)
-        self.config['gcode_comments'] = '1'  # force open comment in gcode generated
+        # SlicerSettings, replaced as a whole when changed
+        self.config = DEFAULT_SETTINGS.updated({'gcode_comments': '1'})  # force open comment in gcode generated
+        # self.config = SlicerSettings.parse(self.slic3r_setting)
         self.path = None
         self.output = None
         self.image = b''
@@ -64,7 +131,7 @@ class StlSlicer(object):
         self.T = None
 
     def from_other(self, other):
-        self.working_p = other.working_p
+        self.job = other.job
         self.models = other.models
         self.parameter = other.parameter
         self.config = other.config
@@ -79,9 +146,9 @@ class StlSlicer(object):
         """
         try:
             if buf_type == 'stl':
-                self.models[name] = self.read_stl(buf)
+                self.models[name] = self.mesh_cache.load(buf, buf_type, self.read_stl)
             elif buf_type == 'obj':
-                self.models[name] = self.read_obj(buf)
+                self.models[name] = self.mesh_cache.load(buf, buf_type, self.read_obj)
             else:
                 raise('unknown file type')
         except:
@@ -98,7 +165,7 @@ class StlSlicer(object):
         """
         logger.debug('duplicate in:{} out:{}'.format(name_in, name_out))
         if name_in in self.models:
-            self.models[name_out] = copy.deepcopy(self.models[name_in])
+            self.models[name_out] = self.models[name_in]  # MeshEntry is read-only, share it
             return True
         else:
             return False
@@ -164,55 +231,60 @@ class StlSlicer(object):
 
         """
         # TODO: close 'ignore' flag when changing some key back
-        counter = 1
-        lines = lines.split('\n')
-        bad_lines = []
-        for line in lines:
-            if '#' in line:  # clean up comement
-                line = line[:line.index('#')].strip()
-            if '=' in line:
-                key, value = map(lambda x: x.strip(), line.split('=', 1))
-                result = self.ini_value_check(key, value)
-                if result == 'ok':
-                    self.config[key] = value
-                    if key == 'temperature':
-                        self.config['first_layer_temperature'] = str(min(230, float(value) + 5))
-                    # elif key == 'overhangs' and value == '0':
-                    #     self.config['support_material'] = '0'
-                    #     ini_constraint['support_material'] = [ignore]
-                    elif key == 'spiral_vase' and value == '1':
-                        self.config['support_material'] = '0'
-                        ini_constraint['support_material'] = [ignore]
-                        self.config['fill_density'] = '0%'
-                        ini_constraint['fill_density'] = [ignore]
-                        self.config['perimeters'] = '1'
-                        ini_constraint['perimeters'] = [ignore]
-                        self.config['top_solid_layers'] = '0'
-                        ini_constraint['top_solid_layers'] = [ignore]
-
-                elif result == 'ignore':
-                    # ignore this config key anyway
-                    pass
-                else:
-                    bad_lines.append((counter, result))
-            elif line != '' and line != 'default':
-                bad_lines.append((counter, 'syntax error: %s' % line))
-            counter += 1
+        pairs, syntax_errors = parse_setting_lines(lines)
+        bad_lines = list(syntax_errors)
+        changes = {}
+        for counter, key, value in pairs:
+            result = self.config.check(key, value)
+            if result == 'ok':
+                changes[key] = value
+                if key == 'temperature':
+                    changes['first_layer_temperature'] = str(min(230, float(value) + 5))
+                # elif key == 'overhangs' and value == '0':
+                #     changes['support_material'] = '0'
+                #     ini_constraint['support_material'] = [ignore]
+                elif key == 'spiral_vase' and value == '1':
+                    changes['support_material'] = '0'
+                    ini_constraint['support_material'] = [ignore]
+                    changes['fill_density'] = '0%'
+                    ini_constraint['fill_density'] = [ignore]
+                    changes['perimeters'] = '1'
+                    ini_constraint['perimeters'] = [ignore]
+                    changes['top_solid_layers'] = '0'
+                    ini_constraint['top_solid_layers'] = [ignore]
+
+            elif result == 'ignore':
+                # ignore this config key anyway
+                pass
+            else:
+                bad_lines.append((counter, result))
+        self.config = self.config.updated(changes)
+        bad_lines.sort()
         return bad_lines
 
     def sub_convert_path(self):
-        self.path_js = Tools().path_to_js(self.path).decode()
+        if isinstance(self.path, PathStore):
+            self.path_js = self.path.to_js()
+        else:
+            self.path_js = Tools().path_to_js(self.path).decode()
 
-    def get_path(self):
+    def get_path(self, path_type='js', tolerance=0.):
         """
+        path_type[in]: 'js' for javascript string, 'binary' for compact binary form(see PathStore.to_binary)
+        tolerance[in]: level of detail of binary form, in mm
         """
+        if path_type == 'binary':
+            if isinstance(self.path, PathStore):
+                return self.path.to_binary(tolerance=tolerance)
+            return None
         if self.T:
             self.T.join()
         return self.path_js
 
-    def begin_slicing(self, names, ws, output_type):
+    def begin_slicing(self, names, ws, output_type, callback=None):
         """
         :param list names: names of stl that need to be sliced
+        :param callback: callback(job, event) for progress events(see SlicingJob), optional
         :return:
             if success:
                 gcode (binary in bytes), metadata([TIME_COST, FILAMENT_USED])
@@ -223,6 +295,13 @@ class StlSlicer(object):
         for n in names:
             if not (n in self.models and n in self.parameter):
                 return False, 'id:%s is not setted yet' % (n)
+
+        cache_key = self.slice_digest(names)
+        cached = self.slice_cache.get(cache_key, output_type)
+        if cached:
+            self.job = self.slicing_pool.submit(id(self), self.cached_worker, (cached,), callback=callback)
+            return True, ''
+
         # tmp files
         if platform().startswith("Windows"):
             if not os.path.isdir('C:\Temp'):
@@ -237,46 +316,53 @@ class StlSlicer(object):
         tmp = tempfile.NamedTemporaryFile(dir=temp_dir, suffix='.gcode', delete=False)
         tmp_gcode_file = tmp.name  # store gcode
 
-        tmp = tempfile.NamedTemporaryFile(dir=temp_dir, suffix='.ini', delete=False)
-        tmp_slic3r_setting_file = tmp.name  # store gcode
-
-        m_mesh_merge = _printer.MeshObj([], [])
-        for n in names:
-            points, faces = self.models[n]
-            m_mesh = _printer.MeshObj(points, faces)
-            m_mesh.apply_transform(self.parameter[n])
-            m_mesh_merge.add_on(m_mesh)
-        m_mesh_merge = m_mesh_merge.cut(float(self.config['flux_floor']))
-
-        bounding_box = m_mesh_merge.bounding_box()
+        points, faces = self.merge_models(names)
+        bounding_box = mesh_tools.bounding_box(points, faces)
         cx, cy = (bounding_box[0][0] + bounding_box[1][0]) / 2., (bounding_box[0][1] + bounding_box[1][1]) / 2.
-        m_mesh_merge.write_stl(tmp_stl_file)
+        mesh_tools.write_stl(points, faces, tmp_stl_file)
 
-        self.my_ini_writer(tmp_slic3r_setting_file, self.config, delete=['flux_', 'detect_'])
+        slic3r_setting_file = self.ini_cache.get(self.config, self.my_ini_writer, delete=('flux_', 'detect_'))
 
         command = [self.slic3r, tmp_stl_file]
         command += ['--output', tmp_gcode_file]
         command += ['--print-center', '%f,%f' % (cx, cy)]
-        command += ['--load', tmp_slic3r_setting_file]
+        command += ['--load', slic3r_setting_file]
 
         logger.debug('command: ' + ' '.join(command))
-        self.end_slicing()
-
-        status_list = []
 
-        from threading import Thread  # Do not expose thrading in module level
-        p = Thread(target=self.slicing_worker, args=(command[:], dict(self.config), self.image, dict(self.ext_metadata), output_type, status_list, len(self.working_p)))
-        self.working_p.append([p, [tmp_stl_file, tmp_gcode_file, tmp_slic3r_setting_file], status_list])
-        p.start()
+        # replaces the job this slicer started before
+        self.job = self.slicing_pool.submit(id(self), self.slicing_worker, (command[:], self.config, self.image, dict(self.ext_metadata), output_type, cache_key),
+                                            tmp_files=[tmp_stl_file, tmp_gcode_file], callback=callback)
         return True, ''
 
-    def slicing_worker(self, command, config, image, ext_metadata, output_type, status_list, p_index):
+    def merge_models(self, names):
+        """
+        transform models in names, merge them and cut by flux_floor
+        models with more than flux_decimate faces are simplified first(0 to disable)
+        return (points, faces) of merged mesh
+        """
+        threshold = self.config.getint('flux_decimate', 0)
+        meshes = []
+        for n in names:
+            points, faces = self.models[n]
+            if threshold and len(faces) > threshold:
+                # keep the surface within one resolution after scaling
+                scale = max(abs(float(i)) for i in self.parameter[n][6:9])
+                max_error = self.config.getfloat('resolution', 0.01) / scale if scale else float('inf')
+                points, faces = self.models[n].decimate(threshold, max_error)
+                self.mesh_cache.touch(self.models[n])  # count the decimated arrays
+            meshes.append((mesh_tools.transform(points, self.parameter[n]), faces))
+        points, faces = mesh_tools.merge(meshes)
+        return mesh_tools.cut(points, faces, self.config.getfloat('flux_floor'))
+
+    def slicing_worker(self, job, command, config, image, ext_metadata, output_type, cache_key=None):
         tmp_gcode_file = command[3]
         fail_flag = False
+        warnings = []
         subp = subprocess.Popen(command, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, universal_newlines=True)
         path = ''
 
-        self.working_p[p_index].append(subp)
+        job.add_process(subp)
         progress = 0.2
         slic3r_error = False
         slic3r_out = [None, None]
@@ -289,24 +375,24 @@ class StlSlicer(object):
                 logger.info(line)
                 if line.startswith('=> ') and not line.startswith('=> Exporting'):
                     progress += 0.11
-                    status_list.append('{"slice_status": "computing", "message": "%s", "percentage": %.2f}' % ((line.rstrip())[3:], progress))
+                    job.emit('computing', message=(line.rstrip())[3:], percentage=progress)
                 elif "Unable to close this loop" in line:
                     slic3r_error = True
                 slic3r_out = [5, line]  # errorcode 5
         if subp.poll() != 0:
             fail_flag = True
+        if job.cancelled:
+            return
 
         if config['flux_raft'] == '1':
             m_preprocessor = Raft()
-            raft_output = StringIO()
-            m_preprocessor.main(tmp_gcode_file, raft_output, debug=False)
-            raft_output = raft_output.getvalue()
-            with open(tmp_gcode_file, 'w') as f:  # overwrite the file
-                print(raft_output, file=f)
+            with open(tmp_gcode_file + '.raft', 'w') as raft_output:
+                m_preprocessor.main(tmp_gcode_file, raft_output, debug=False)
+            os.replace(tmp_gcode_file + '.raft', tmp_gcode_file)  # overwrite the file
 
         if not fail_flag:
             # analying gcode(even transform)
-            status_list.append('{"slice_status": "computing", "message": "Analyzing Metadata", "percentage": 0.99}')
+            job.emit('computing', message="Analyzing Metadata", percentage=0.99)
 
             fcode_output = BytesIO()
 
@@ -334,7 +420,8 @@ class StlSlicer(object):
                 metadata = m_GcodeToFcode.md
                 metadata = [float(metadata['TIME_COST']), float(metadata['FILAMENT_USED'].split(',')[0])]
                 if slic3r_error or len(m_GcodeToFcode.empty_layer) > 0:
-                    status_list.append('{"slice_status": "warning", "message" : "%s"}' % ("{} empty layers, might be error when slicing {}".format(len(m_GcodeToFcode.empty_layer), repr(m_GcodeToFcode.empty_layer))))
+                    warnings.append("{} empty layers, might be error when slicing {}".format(len(m_GcodeToFcode.empty_layer), repr(m_GcodeToFcode.empty_layer)))
+                    job.emit('warning', message=warnings[-1])
 
                 if float(m_GcodeToFcode.md['MAX_R']) >= HW_PROFILE['model-1']['radius']:
                     fail_flag = True
@@ -366,61 +453,64 @@ class StlSlicer(object):
                 StlSlicer.my_ini_writer("output.ini", config)
             ###########################################################
 
+            if cache_key and not fail_flag:
+                self.slice_cache.put(cache_key, tmp_gcode_file, fcode_output.getvalue(), metadata, path, warnings)
+
             # # clean up tmp files
             fcode_output.close()
         if fail_flag:
-            status_list.append([False, slic3r_out, path])
+            job.emit('error', error=slic3r_out[0], info=slic3r_out[1], result=[False, slic3r_out, path])
         else:
-            status_list.append([output, metadata, path])
+            job.emit('complete', length=len(output), time=metadata[0], filament_length=metadata[1], result=[output, metadata, path])
+
+    def cached_worker(self, job, cached):
+        """
+        report a result found in slice cache
+        """
+        output, metadata, path, warnings = cached
+        for message in warnings:
+            job.emit('warning', message=message)
+        job.emit('complete', length=len(output), time=metadata[0], filament_length=metadata[1], result=[output, metadata, path])
+
+    def slice_digest(self, names):
+        """
+        digest of everything deciding the result of slicing names, key of slice cache
+        """
+        return slice_digest('%s %s' % (type(self).__name__, self.slic3r),
+                            [(self.models[n].key, self.parameter[n]) for n in names],
+                            self.config, self.image, self.ext_metadata)
 
     def end_slicing(self):
         """
-        when being called, end every working slic3r process
-        but couldn't kill the thread
+        when being called, cancel the slicing job, its slic3r process is terminated
         """
-        for p in self.working_p:
-            if type(p[-1]) == (subprocess.Popen):
-                if p[-1].poll() is None:
-                    p[-1].terminate()
-            else:
-                pass
-            for filename in p[1]:
-                try:
-                    os.remove(filename)
-                except:
-                    pass
-        # self.working_p = []
+        if self.job:
+            self.job.cancel()
 
     def report_slicing(self):
         """
         report the slicing state
-        find the last working process(self.working_p)
-        and return the message in it
+        read the events of the latest job(self.job)
+        and return them as json strings
         """
         ret = []
-        if self.working_p:
-            for _ in range(len(self.working_p[-1][2])):
-                message = self.working_p[-1][2][0]
-                self.working_p[-1][2].pop(0)
-                if type(message) == str:
-                    ret.append(message)
-                else:
-
+        if self.job:
+            for event in self.job.get_events():
+                if 'result' in event:
+                    message = event['result']
                     if message[0]:
                         self.output = message[0]
                         self.metadata = message[1]
-                        msg = '{"slice_status": "complete", "length": %d, "time": %.3f, "filament_length": %.2f}' % (len(self.output), self.metadata[0], self.metadata[1])
                     else:
                         self.output = None
                         self.metadata = None
-                        msg = '{"slice_status": "error", "error": "%d", "info": "%s"}' % (message[1][0], message[1][1])
 
                     self.path = message[2]
                     self.path_js = None
                     from threading import Thread  # Do not expose thrading in module level
                     self.T = Thread(target=self.sub_convert_path)
                     self.T.start()
-                    ret.append(msg)
+                ret.append(STATUS_FORMAT[event['slice_status']] % event)
         return ret
 
     @classmethod
@@ -430,24 +520,7 @@ class StlSlicer(object):
         read-in .ini file setting file as default settings
         return a dict
         """
-        result = {}
-        if type(data) == str:
-            # file path
-            f = open(data, 'r')
-            lines = f.readlines()
-        else:
-            lines = data
-
-        for i in lines:
-            if i[0] == '#':
-                pass
-            elif '=' in i:
-                tmp = i.rstrip().split('=')
-                result[tmp[0].strip()] = tmp[1].strip()
-            else:
-                logger.error(i)
-                raise ValueError('not ini file?')
-        return result
+        return dict(SlicerSettings.parse(data))
 
     def ini_value_check(self, key, value):
         """
@@ -456,15 +529,7 @@ class StlSlicer(object):
         return: 'ok' or [error message]
         check whether (key, value) pair is valid according to the constraint
         """
-        if key in self.config:
-            if value.strip() == 'default':
-                return 'ok'
-            if ini_constraint[key]:
-                return ini_constraint[key][0](key, value, *ini_constraint[key][1:])
-            else:
-                return 'ok'
-        else:
-            return 'key not exist: %s' % key
+        return self.config.check(key, value)
 
     @classmethod
     def my_ini_writer(cls, file_path, content, delete=None):
@@ -490,8 +555,9 @@ class StlSlicer(object):
         check what kind of stl file it is
         return False -> binary
         return True -> ascii
+        data can be bytes or mmap
         """
-        if not data.startswith(b'solid '):
+        if data[:6] != b'solid ':
             return False
 
         length = unpack(byte_order + 'I', data[80:84])[0]
@@ -504,123 +570,62 @@ class StlSlicer(object):
         """
         file_data[in]: string indicating a a file path, or a bytes that is the content of stl file
         read in stl
+        return (points, faces): float array (n, 3) of unique points in order of appearance,
+                                int array (m, 3) of point index of each face
         """
         # ref: https://en.wikipedia.org/wiki/STL_(file_format)
         if type(file_data) == str:
             with open(file_data, 'rb') as f:
-                file_data = f.read()
-                byte_order = '@'
+                data = mmap(f.fileno(), 0, access=ACCESS_READ)
+                try:
+                    return cls.read_stl_buffer(data, file_data)
+                finally:
+                    data.close()
         elif type(file_data) == bytes:
-            byte_order = '<'
+            return cls.read_stl_buffer(file_data)
         else:
             raise ValueError('wrong stl data type: %s' % str(type(file_data)))
-        points = {}  # key: points, value: index
-        faces = []
-        counter = 0
-        if cls.ascii_or_binary(file_data, byte_order):
-            # ascii stl file
-            instl = StringIO(file_data.decode('utf8'))
-
-            read_until(instl)  # read in: "solid [name]"
-            while True:
-                t = read_until(instl)  # read in: "facet normal 0 0 0"
-
-                # if not t.startswith('endsolid'):  # end of file
-                if t.startswith('endsolid'):
-                    tt = read_until(instl)
-                    if len(tt) == 0:
-                        break
-                    else:
-                        continue
-
-                read_normal = tuple(map(float, (t.split()[-3:])))
-                read_until(instl)   # outer loop
-                v0 = tuple(map(float, (read_until(instl).split()[-3:])))
-                v1 = tuple(map(float, (read_until(instl).split()[-3:])))
-                v2 = tuple(map(float, (read_until(instl).split()[-3:])))
-                right_hand_mormal = normalize(normal([v0, v1, v2]))
-                if dot(right_hand_mormal, read_normal) < 0:
-                    v1, v2 = v2, v1
-
-                read_until(instl)  # read in: "endloop"
-                read_until(instl)  # read in: "endfacet"
-
-                face = []
-                for v in [v0, v1, v2]:
-                    if v not in points:
-                        points[v] = counter
-                        points[counter] = v
-                        counter += 1
-                    face.append(points[v])
-                faces.append(face)
 
+    @classmethod
+    def read_stl_buffer(cls, data, path=None):
+        """
+        read in stl from bytes or mmap
+        path[in]: file path of data if it's from a file
+        """
+        if cls.ascii_or_binary(data, '<'):
+            # ascii stl file
+            normals, vertices = ascii_mesh.read_ascii_stl(data, path)
         else:
             # binary stl file
-            header = file_data[:80]
-            length = unpack(byte_order + 'I', file_data[80:84])[0]
-
-            patten = byte_order + 'fff'
-            index = 84
-            for i in range(length):
-                read_normal = unpack(patten, file_data[index + (4 * 3 * 0):index + (4 * 3 * 1)])
-                v0 = unpack(patten, file_data[index + (4 * 3 * 1):index + (4 * 3 * 2)])
-                v1 = unpack(patten, file_data[index + (4 * 3 * 2):index + (4 * 3 * 3)])
-                v2 = unpack(patten, file_data[index + (4 * 3 * 3):index + (4 * 3 * 4)])
-                right_hand_mormal = normalize(normal([v0, v1, v2]))
-                if dot(right_hand_mormal, read_normal) < 0:
-                    v1, v2 = v2, v1
-
-                face = []
-                for v in [v0, v1, v2]:
-                    if v not in points:
-                        points[v] = counter
-                        points[counter] = v
-                        counter += 1
-                    face.append(points[v])
-                faces.append(face)
-                index += 50
-
-        points_list = []
-        for i in range(counter):
-            points_list.append(points[i])
-        return points_list, faces
+            length = unpack('<I', data[80:84])[0]
+            facets = np.frombuffer(data, STL_FACET, length, 84)
+            normals = facets['normal'].astype(np.float64)
+            vertices = facets['vertex'].copy()
+            del facets  # release data
+        if len(normals) != len(vertices):
+            raise ValueError('bad stl data')
+        fix_winding(normals, vertices)
+        return weld_vertices(vertices)
 
     @classmethod
     def read_obj(cls, file_data):
+        """
+        file_data[in]: string indicating a a file path, or a bytes that is the content of obj file
+        read in obj, only v and f lines are used
+        return (points, faces): float array (n, 3), int array (m, 3) of point index of each face
+        """
         if type(file_data) == str:
             with open(file_data, 'rb') as f:
-                file_data = f.read()
+                data = mmap(f.fileno(), 0, access=ACCESS_READ)
+                try:
+                    return ascii_mesh.read_obj(data, file_data)
+                finally:
+                    data.close()
         elif type(file_data) == bytes:
-            pass
+            return ascii_mesh.read_obj(file_data)
         else:
             raise ValueError('wrong stl data type: %s' % str(type(file_data)))
 
-        in_obj = StringIO(file_data.decode('utf8'))
-        points_list = []
-        faces = []
-        while True:
-            t = read_until(in_obj)
-            if len(t) == 0:
-                break
-            elif t.startswith('#'):  # comment
-                continue
-            t = t.split()
-            if t[0] == 'v':
-                points_list.append(tuple(float(t[j]) for j in range(1, 4)))
-            elif t[0] == 'f':
-                t = [i.split('/') for i in t]
-                faces.append([int(t[j][0]) for j in range(1, 4)])
-            else:
-                pass
-        for i in range(len(faces)):
-            for j in range(3):
-                if faces[i][j] > 0:
-                    faces[i][j] -= 1
-                else:
-                    faces[i][j] = len(points_list) + faces[i][j]
-
-        return points_list, faces
-
 
 class StlSlicerCura(StlSlicer):
     def __init__(self, slic3r):
@@ -628,9 +633,10 @@ class StlSlicerCura(StlSlicer):
         self.slic3r = slic3r
         self.now_type = 3
 
-    def begin_slicing(self, names, ws, output_type):
+    def begin_slicing(self, names, ws, output_type, callback=None):
         """
         :param list names: names of stl that need to be sliced
+        :param callback: callback(job, event) for progress events(see SlicingJob), optional
 
         :return:
             if success:
@@ -642,6 +648,13 @@ class StlSlicerCura(StlSlicer):
         for n in names:
             if not (n in self.models and n in self.parameter):
                 return False, 'id:%s is not setted yet' % (n)
+
+        cache_key = self.slice_digest(names)
+        cached = self.slice_cache.get(cache_key, output_type)
+        if cached:
+            self.job = self.slicing_pool.submit(id(self), self.cached_worker, (cached,), callback=callback)
+            return True, ''
+
         # tmp files
         if platform().startswith("Windows"):
             if not os.path.isdir('C:\Temp'):
@@ -656,43 +669,30 @@ class StlSlicerCura(StlSlicer):
         tmp = tempfile.NamedTemporaryFile(dir=temp_dir, suffix='.gcode', delete=False)
         tmp_gcode_file = tmp.name  # store gcode
 
-        tmp = tempfile.NamedTemporaryFile(dir=temp_dir, suffix='.ini', delete=False)
-        tmp_slic3r_setting_file = tmp.name  # store gcode
-
-        m_mesh_merge = _printer.MeshObj([], [])
-        for n in names:
-            points, faces = self.models[n]
-            m_mesh = _printer.MeshObj(points, faces)
-            m_mesh.apply_transform(self.parameter[n])
-            m_mesh_merge.add_on(m_mesh)
-        m_mesh_merge = m_mesh_merge.cut(float(self.config['flux_floor']))
-
-        m_mesh_merge.write_stl(tmp_stl_file)
-        self.cura_ini_writer(tmp_slic3r_setting_file, self.config, delete=['flux_', 'detect_'])
+        points, faces = self.merge_models(names)
+        mesh_tools.write_stl(points, faces, tmp_stl_file)
+        slic3r_setting_file = self.ini_cache.get(self.config, self.cura_ini_writer, delete=('flux_', 'detect_'))
 
         command = [self.slic3r]
         command += ['-o', tmp_gcode_file]
-        command += ['-c', tmp_slic3r_setting_file]
+        command += ['-c', slic3r_setting_file]
         command.append(tmp_stl_file)
         command.append('-v')
 
         logger.debug('command: ' + ' '.join(command))
-        self.end_slicing()
-
-        status_list = []
-        from threading import Thread  # Do not expose thrading in module level
-        p = Thread(target=self.slicing_worker, args=(command[:], dict(self.config), self.image, dict(self.ext_metadata), output_type, status_list, len(self.working_p)))
-        self.working_p.append([p, [tmp_stl_file, tmp_gcode_file, tmp_slic3r_setting_file], status_list])
-        p.start()
+        # replaces the job this slicer started before
+        self.job = self.slicing_pool.submit(id(self), self.slicing_worker, (command[:], self.config, self.image, dict(self.ext_metadata), output_type, cache_key),
+                                            tmp_files=[tmp_stl_file, tmp_gcode_file], callback=callback)
         return True, ''
 
-    def slicing_worker(self, command, config, image, ext_metadata, output_type, status_list, p_index):
+    def slicing_worker(self, job, command, config, image, ext_metadata, output_type, cache_key=None):
         tmp_gcode_file = command[2]
         tmp_slic3r_setting_file = command[4]
         fail_flag = False
+        warnings = []
         try:
             subp = subprocess.Popen(command, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, universal_newlines=True, bufsize=0)
-            self.working_p[p_index].append(subp)
+            job.add_process(subp)
             progress = 0.2
             slic3r_error = False
             slic3r_out = [None, None]
@@ -704,7 +704,7 @@ class StlSlicerCura(StlSlicer):
                         logger.info(line)
                         if line.endswith('s'):
                             progress += 0.12
-                            status_list.append('{"slice_status": "computing", "message": "%s", "percentage": %.2f}' % (line, progress))
+                            job.emit('computing', message=line, percentage=progress)
                         elif "Unable to close this loop" in line:
                             slic3r_error = True
                         slic3r_out = [5, line]  # errorcode 5
@@ -714,18 +714,18 @@ class StlSlicerCura(StlSlicer):
         except:
             fail_flag = True
             slic3r_out = [5, 'CuraEngine fail']  # errorcode 5
+        if job.cancelled:
+            return
 
         if config['flux_raft'] == '1':
             m_preprocessor = Raft()
-            raft_output = StringIO()
-            m_preprocessor.main(tmp_gcode_file, raft_output, debug=False)
-            raft_output = raft_output.getvalue()
-            with open(tmp_gcode_file, 'w') as f:  # overwrite the file
-                print(raft_output, file=f)
+            with open(tmp_gcode_file + '.raft', 'w') as raft_output:
+                m_preprocessor.main(tmp_gcode_file, raft_output, debug=False)
+            os.replace(tmp_gcode_file + '.raft', tmp_gcode_file)  # overwrite the file
 
         if not fail_flag:
             # analying gcode(even transform)
-            status_list.append('{"slice_status": "computing", "message": "analyzing metadata", "percentage": 0.99}')
+            job.emit('computing', message="analyzing metadata", percentage=0.99)
 
             fcode_output = BytesIO()
             if config['flux_calibration'] == '0':
@@ -758,7 +758,8 @@ class StlSlicerCura(StlSlicer):
                 metadata = m_GcodeToFcode.md
                 metadata = [float(metadata['TIME_COST']), float(metadata['FILAMENT_USED'].split(',')[0])]
                 if slic3r_error or len(m_GcodeToFcode.empty_layer) > 0:
-                    status_list.append('{"slice_status": "warning", "message" : "%s"}' % ("{} empty layers, might be error when slicing {}".format(len(m_GcodeToFcode.empty_layer), repr(m_GcodeToFcode.empty_layer))))
+                    warnings.append("{} empty layers, might be error when slicing {}".format(len(m_GcodeToFcode.empty_layer), repr(m_GcodeToFcode.empty_layer)))
+                    job.emit('warning', message=warnings[-1])
 
                 if float(m_GcodeToFcode.md['MAX_R']) >= HW_PROFILE['model-1']['radius']:
                     fail_flag = True
@@ -793,10 +794,13 @@ class StlSlicerCura(StlSlicer):
                         f2.write(f.read())
             ###########################################################
 
+            if cache_key and not fail_flag:
+                self.slice_cache.put(cache_key, tmp_gcode_file, fcode_output.getvalue(), metadata, path, warnings)
+
             # # clean up tmp files
             fcode_output.close()
         if fail_flag:
-            status_list.append([False, slic3r_out, path])
+            job.emit('error', error=slic3r_out[0], info=slic3r_out[1], result=[False, slic3r_out, path])
             ###########################################################
 
             with open(tmp_slic3r_setting_file, 'rb') as f:
@@ -804,7 +808,7 @@ class StlSlicerCura(StlSlicer):
                         f2.write(f.read())
             ###########################################################
         else:
-            status_list.append([output, metadata, path])
+            job.emit('complete', length=len(output), time=metadata[0], filament_length=metadata[1], result=[output, metadata, path])
 
     @classmethod
     def cura_ini_writer(cls, file_path, content, delete=None):
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from functools import lru_cache
 import sys
 import time
 import math
@@ -14,11 +15,62 @@ except:
 NUM_LASER_RANGE_THRESHOLD = 3
 RED_HUE_UPPER_THRESHOLD = 5
 
+# bounding cylinder of points
+MAX_DIST_XZ_SQ = 70 ** 2
+PLATE_Y = -0.5
+MAX_DIST_Y = 90
+
+# ScanSetting attributes deciding camera rays
+CAMERA_SETTINGS = ('img_width', 'img_height', 'sensorWidth', 'sensorHeight', 'focalLength', 'cameraX', 'cameraY', 'cameraZ')
+
 
 def pre_cut(img, x=0, y=0, w=None, h=None):
     return img[y: y + h, x: x + w]  # x, y, w, h
 
 
+def camera_rays(camera, x, y):
+    """
+      same as freeless.calculateCameraRay, for arrays of x, y
+      camera[in]: values of CAMERA_SETTINGS
+      return (origins, directions): float arrays (..., 3)
+    """
+    img_width, img_height, sensorWidth, sensorHeight, focalLength, cameraX, cameraY, cameraZ = camera
+    x = np.asarray(x) / float(img_width - 1)
+    y = (img_height - 1 - np.asarray(y)) / float(img_height - 1)
+
+    x = (x * sensorWidth) + cameraX - (sensorWidth * 0.5)
+    y = (y * sensorHeight) + cameraY - (sensorHeight * 0.5)
+    x, y = np.broadcast_arrays(x, y)
+    origins = np.stack((x, y, np.full(x.shape, cameraZ + focalLength)), axis=-1)
+
+    directions = origins - [cameraX, cameraY, cameraZ]
+    l = np.sqrt(directions[..., 0] ** 2 + directions[..., 1] ** 2 + directions[..., 2] ** 2)
+    np.divide(directions, l[..., None], out=directions, where=l[..., None] != 0)
+    return origins, directions
+
+
+@lru_cache(maxsize=4)
+def camera_ray_table(camera):
+    """
+      camera rays of every pixel, the same for every step, cached by camera settings
+      camera[in]: values of CAMERA_SETTINGS
+      return (origins, directions): read-only float arrays (img_height, img_width, 3)
+    """
+    img_width, img_height = camera[:2]
+    origins, directions = camera_rays(camera, np.arange(img_width)[None, :], np.arange(img_height)[:, None])
+    origins.flags.writeable = False
+    directions.flags.writeable = False
+    return origins, directions
+
+
+def in_cylinder(points):
+    """
+      points[in]: float array (..., 3)
+      return whether points are inside the bounding cylinder
+    """
+    return (points[..., 0] ** 2 + points[..., 2] ** 2 < MAX_DIST_XZ_SQ) & (points[..., 1] >= PLATE_Y) & (points[..., 1] < MAX_DIST_Y)
+
+
 class freeless():
 
     """
@@ -48,6 +100,7 @@ class freeless():
             d = (scan_settings.cab_l - scan_settings.cab_m) * 35 / 125
             self.laser_plane = [[d, 0, 0], normalize([laserZ, 0, -1 * (laserX - d)])]
         self.place = {}
+        self._point_table = None  # (ray table, points, valid) of laser_point_table
 
     def img_to_points(self, img_o, img_red, indices, step, side, cab_offset, clock=False):
         """
@@ -62,29 +115,27 @@ class freeless():
         [WARNING] coordinate change here!!!!!!!!!!!
                   switch y, z
         """
-        points = []
         _step = step  # real step
-
-        MAX_DIST_XZ_SQ = 70 ** 2
-        PLATE_Y = -0.5
-        MAX_DIST_Y = 90
-
-        for y, x in indices:
-            ray = self.calculateCameraRay(x, y)
-            f, point = self.intersectLaserPlane(ray)
-
-            if f:
-                if point[0][0] ** 2 + point[0][2] ** 2 < MAX_DIST_XZ_SQ and point[0][1] >= PLATE_Y and point[0][1] < MAX_DIST_Y:
-                    # add color
-                    point.append([img_o[y][x - cab_offset][0], img_o[y][x - cab_offset][1], img_o[y][x - cab_offset][2]])
-                    # point.append([img_o[y][x][0], img_o[y][x][1], img_o[y][x][2]])
-                    point.append([x, y])
-
-                    points.append(point)
-                else:  # points that out of bounding cylinder
-                    pass
-                    # print point[0][1] >= 0.0, point[0][0] ** 2 + point[0][2] ** 2 < MAX_DIST_XZ_SQ,
-                    # point[0][1] < MAX_DIST_Y, step
+        indices = np.asarray(indices, int).reshape(-1, 2)
+        y, x = indices[:, 0], indices[:, 1]
+
+        # look up pixels in the image, compute the others(moved out by cab)
+        table_points, table_valid = self.laser_point_table()
+        inside = (x >= 0) & (x < table_valid.shape[1]) & (y >= 0) & (y < table_valid.shape[0])
+        outside = ~inside
+        points = np.empty((len(indices), 3))
+        valid = np.empty(len(indices), bool)
+        points[inside] = table_points[y[inside], x[inside]]
+        valid[inside] = table_valid[y[inside], x[inside]]
+        if outside.any():
+            origins, directions = camera_rays(self.camera_settings(), x[outside], y[outside])
+            points[outside], hit = self.intersectLaserPlanes(origins, directions)
+            valid[outside] = hit & in_cylinder(points[outside])
+
+        # points that out of bounding cylinder are dropped
+        points, indices = points[valid], indices[valid]
+        # add color
+        color = img_o[indices[:, 0], indices[:, 1] - cab_offset, :3]
 
         # rotate
         clock = True
@@ -96,13 +147,44 @@ class freeless():
         c = math.cos(theta)
         s = math.sin(theta)
 
-        new_points = []
-        for p in points:
-            # [WARNING] change here
-            new_points.append([p[0][0] * c + p[0][2] * (-s), p[0][0] * s + p[0][2] * c, p[0][1], p[2][2], p[2][1], p[2][0], _step, p[3][0], p[3][1]])
-            # new_points.append([p[0][0] * c + p[0][2] * (-s), p[0][0] * s + p[0][2] * c, p[0][1], (step % 2) * 255, 255 - step / 400. * 255, 255 - step / 400. * 255, step, p[3][0], p[3][1]])
+        # [WARNING] change here
+        coordinates = np.column_stack((points[:, 0] * c + points[:, 2] * (-s), points[:, 0] * s + points[:, 2] * c, points[:, 1]))
+        return [p + rgb + [_step] + xy for p, rgb, xy in zip(coordinates.tolist(), color[:, ::-1].tolist(), indices[:, ::-1].tolist())]
 
-        return new_points
+    def camera_settings(self):
+        return tuple(getattr(self.settings, i) for i in CAMERA_SETTINGS)
+
+    def laser_point_table(self):
+        """
+        intersection of laser plane and the camera ray of every pixel
+        return (points, valid): float array (img_height, img_width, 3),
+                                bool array (img_height, img_width) of whether it's a point inside the bounding cylinder
+        computed again when camera settings change
+        """
+        origins, directions = camera_ray_table(self.camera_settings())
+        if self._point_table is None or self._point_table[0] is not origins:
+            points, hit = self.intersectLaserPlanes(origins, directions)
+            valid = hit & in_cylinder(points)
+            points.flags.writeable = False
+            valid.flags.writeable = False
+            self._point_table = (origins, points, valid)
+        return self._point_table[1:]
+
+    def intersectLaserPlanes(self, origins, directions):
+        """
+        same as intersectLaserPlane, for arrays of rays
+        origins, directions[in]: float arrays (..., 3)
+        return (points, hit): float array (..., 3), bool array (...) of whether it intersects
+        """
+        n = self.laser_plane[1]
+        denominator = directions[..., 0] * n[0] + directions[..., 1] * n[1] + directions[..., 2] * n[2]
+        v = self.laser_plane[0] - origins
+        numerator = v[..., 0] * n[0] + v[..., 1] * n[1] + v[..., 2] * n[2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = numerator / denominator
+            # If dn is close to 0 then they don't intersect.  This should never happen
+            hit = (abs(denominator) >= 0.0000001) & (d >= 0)
+            return origins + directions * d[..., None], hit
 
     def intersectLaserPlane(self, ray):
         """
@@ -224,97 +306,79 @@ class freeless():
           find out the location of the laser dots
           return a list of indices [[x,y], [x,y], [x,y]]
         """
-        laserLocations = []
-        numMerged = 0
-        prevLaserCol = self.firstRowLaserCol
+        return self.chooseLaserRanges(*self.findLaserRanges(img1, img2))
 
+    def findLaserRanges(self, img1, img2):
+        """
+          find candidates of laser and their centers, the part of subProcess that doesn't depend on previous images,
+          so images can be processed at the same time
+          return (rows, starts, ends, centers): int arrays of candidates, as detectLaserRanges
+        """
         # diff two img, need set type as 'int' to avoid overflow in uint8
-        d = abs((img1.astype(int)) - (img2.astype(int)))
-        # squre each element
-        d = d.astype(int)
-        d = np.multiply(d, d)
-        # sum up r, g, b diff number into one number
-        d = np.sum(d, axis=2)
-
-        # self.MAX_MAGNITUDE_SQ = (255. * 255.)
-        # img1 = img1.astype(int)
-        # img2 = img2.astype(int)
-
-        # # 0.21 R + 0.72 G + 0.07 B
-        # img1_gray = img1[:, :, 0] * 0.07 + img1[:, :, 1] * 0.72 + img1[:, :, 2] * 0.21
-        # img2_gray = img2[:, :, 0] * 0.07 + img2[:, :, 1] * 0.72 + img2[:, :, 2] * 0.21
-        # d = abs(img1_gray - img2_gray)
-        # d = np.multiply(d, d)
-
-        # some transform
-        # self.MAX_MAGNITUDE_SQ = (255 * 3.0 * 255)
-        # self.m_laserMagnitudeThreshold = 0.3
+        # squre each element and sum up r, g, b diff number into one number
+        d = img1[:self.settings.img_height, :self.settings.img_width].astype(int) - img2[:self.settings.img_height, :self.settings.img_width].astype(int)
+        d = np.einsum('ijk,ijk->ij', d, d)
+
         mag = d / self.MAX_MAGNITUDE_SQ  # 0.0 ~ 1.0
-        # print(mag, np.amax(mag), file=sys.stderr)
-        # self.m_laserMagnitudeThreshold = .3
-
-        for row in range(self.settings.img_height):
-            m_laserRanges = []
-            # candidates, [ [starting index, ending index, middle point], ... ]
-            m_laserRanges.append([-1, -1, None])
-
-            for col in range(self.settings.img_width):
-                # diff value is bigger than threshold
-                if mag[row][col] > self.m_laserMagnitudeThreshold:
-                    # new candidate appear: first time > threshold, record as starting index
-                    if m_laserRanges[-1][0] == -1:
-                        m_laserRanges[-1][0] = col
-                    # otherwise keep going
-                    else:
-                        pass
-
-                # ending point of the candidate appear! (diff value is no longer bigger than threshold)
-                elif m_laserRanges[-1][0] != -1:
-                    laserWidth = col - m_laserRanges[-1][0]
-                    # laser width should within the constrain
-                    if laserWidth <= self.m_maxLaserWidth and laserWidth >= self.m_minLaserWidth:
-                        wasMerged = False
-                        # merge two candidate if they are very near
-                        if len(m_laserRanges) > 1:
-                            rangeDistance = m_laserRanges[-1][0] - m_laserRanges[-2][1]
-                            if rangeDistance < self.RANGE_DISTANCE_THRESHOLD:
-                                wasMerged = True
-                                m_laserRanges[-2][1] = col
-                                m_laserRanges[-2][2] = round((m_laserRanges[-2][0] + m_laserRanges[-2][1]) / 2.)
-                                numMerged += 1
-                                m_laserRanges[-1][0] = -1
-
-                        if not wasMerged:
-                            m_laserRanges[-1][1] = col
-                            m_laserRanges[-1][2] = round((m_laserRanges[-1][0] + m_laserRanges[-1][1]) / 2.)
-
-                            m_laserRanges.append([-1, -1, None])
-                    # laser width is not within the constrain, reinitialize the point
-                    else:
-                        m_laserRanges[-1][0] = -1
+        rows, starts, ends = self.detectLaserRanges(mag > self.m_laserMagnitudeThreshold)
+        return rows, starts, ends, self.detectLaserRangeCenter(d, rows, starts, ends)
 
-            # if m_laserRanges[-1][0] != -1 and m_laserRanges[-1][0] != self.settings.img_width - 1:
-            #   print m_laserRanges
-            #   input()
+    def chooseLaserRanges(self, rows, starts, ends, centers):
+        """
+          choose one candidate from findLaserRanges for each row, images must be given in order
+          return a list of indices [[x,y], [x,y], [x,y]]
+        """
+        if len(rows) == 0:
+            return []
+        mids = np.round((starts + ends) / 2.)
 
-            # for each row, find out the best candidate
-            if len(m_laserRanges) > 1:
-                rangeChoice = self.detectBestLaserRange(m_laserRanges, prevLaserCol)
+        # ranges of each row are rows[first[i]:first[i + 1]]
+        detected_rows, first, counts = np.unique(rows, return_index=True, return_counts=True)
 
-                prevLaserCol = m_laserRanges[rangeChoice][2]
+        # for each row, find out the best candidate
+        # i.e. the nearest one to the previous row's, rows with one candidate need no comparison
+        choice = first.copy()
+        prevLaserCol = self.firstRowLaserCol
+        for i in np.flatnonzero(counts > 1):
+            if i > 0:
+                prevLaserCol = mids[choice[i - 1]]
+            candidates = [[0, 0, m] for m in mids[first[i]:first[i] + counts[i]].tolist()] + [[-1, -1, None]]
+            choice[i] += self.detectBestLaserRange(candidates, prevLaserCol)
 
-                centerCol = self.detectLaserRangeCenter(m_laserRanges[rangeChoice], img1, img2, row)
-                laserLocations.append([row, centerCol])
+        # update self.firstRowLaserCol
+        self.firstRowLaserCol = int(starts[choice[0]])
 
-                # update self.firstRowLaserCol
-                if len(laserLocations) == 1:
-                    self.firstRowLaserCol = m_laserRanges[rangeChoice][0]
+        # suspect bad laser, candidates and the unfinished one are more than NUM_LASER_RANGE_THRESHOLD
+        self.numSuspectedBadLaserLocations += int(np.count_nonzero(counts + 1 > NUM_LASER_RANGE_THRESHOLD))
 
-                # suspect bad laser
-                if len(m_laserRanges) > NUM_LASER_RANGE_THRESHOLD:
-                    self.numSuspectedBadLaserLocations += 1
+        return np.column_stack((detected_rows, centers[choice])).tolist()
 
-        return laserLocations
+    def detectLaserRanges(self, bright):
+        """
+          find candidates of laser in each row
+          bright[in]: bool array (height, width), whether the diff value is bigger than threshold
+          runs of bright pixels within [m_minLaserWidth, m_maxLaserWidth] are candidates(runs reaching the right edge are not),
+          a candidate is merged into the previous one in the row if it starts within RANGE_DISTANCE_THRESHOLD from its end
+          return (rows, starts, ends): int arrays of merged candidates ordered by row then column, end is exclusive
+        """
+        # padded so that every run has a starting and ending point
+        padded = np.zeros((bright.shape[0], bright.shape[1] + 1), np.int8)
+        padded[:, 1:] = bright
+        edges = np.diff(padded, axis=1, append=0)
+        rows, starts = np.nonzero(edges == 1)  # first time > threshold
+        ends = np.nonzero(edges == -1)[1]  # diff value is no longer bigger than threshold
+
+        # laser width should within the constrain
+        width = ends - starts
+        valid = (width <= self.m_maxLaserWidth) & (width >= self.m_minLaserWidth) & (ends < bright.shape[1])
+        rows, starts, ends = rows[valid], starts[valid], ends[valid]
+
+        # merge two candidate if they are very near
+        # the merged one starts from the first candidate and ends with the last
+        new = np.ones(len(rows), bool)
+        new[1:] = (rows[1:] != rows[:-1]) | (starts[1:] - ends[:-1] >= self.RANGE_DISTANCE_THRESHOLD)
+        last = np.roll(new, -1)  # the next one is new, or it is the last one(new[0] is True)
+        return rows[new], starts[new], ends[last]
 
     def detectBestLaserRange(self, laserRanges, prevLaserCol):
         """
@@ -331,25 +395,25 @@ class freeless():
                 bestRange_index = i
         return bestRange_index
 
-    def detectLaserRangeCenter(self, bestRange, img1, img2, row):
+    def detectLaserRangeCenter(self, d, rows, starts, ends):
         """
-          find the Center of bestrange
-          use Weighted arithmetic mean
-          return int
+          find the Center of ranges
+          use Weighted arithmetic mean of d(squared diff) in [start, end)
+          return int array
 
           [TODO] in freelss/src/ImageProcessor.cpp ImageProcessor::detectLaserRangeCenter: two more center algorithm to try?
         """
-        d = abs((img1[row][bestRange[0]:bestRange[1]]).astype(int) - (img2[row][bestRange[0]:bestRange[1]]).astype(int))
-        d = d.astype(int)
-        d = np.multiply(d, d)
-        d = np.sum(d, axis=1)
-
-        total = sum(d)
-        d = np.multiply(d, range(0, (bestRange[1] - bestRange[0])))
-        d = sum(d)
-        centerCol = bestRange[0] + round(d / float(total))
-
-        return centerCol
+        # prefix sums of weight and weight * column, of each row having ranges
+        rows, row_index = np.unique(rows, return_inverse=True)
+        total = np.zeros((len(rows), d.shape[1] + 1), np.int64)
+        np.cumsum(d[rows], axis=1, out=total[:, 1:])
+        moment = np.zeros_like(total)
+        np.cumsum(d[rows] * np.arange(d.shape[1]), axis=1, out=moment[:, 1:])
+
+        total = total[row_index, ends] - total[row_index, starts]
+        moment = moment[row_index, ends] - moment[row_index, starts] - starts * total  # weighted by column - start
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return starts + np.round(moment / total.astype(float)).astype(int)
 
 if __name__ == '__main__':
     import subprocess
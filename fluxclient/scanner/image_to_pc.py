@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-import struct
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 import sys
+import os
 
 import numpy as np
 from PIL import Image
@@ -20,6 +21,41 @@ try:
 except:
     pass
 
+RECONSTRUCT_WORKERS = os.cpu_count() or 1  # steps decoded and detected at the same time
+# shared by all image_to_pc, numpy and PIL release the GIL for most of the work
+reconstruct_pool = ThreadPoolExecutor(RECONSTRUCT_WORKERS)
+
+# a point from freeless.img_to_points: [x, y, z, r, g, b, step, x in image, y in image]
+POINT_DTYPE = np.dtype([('position', '<f8', 3), ('color', '<f4', 3), ('step', '<i4'), ('x', '<i4'), ('y', '<i4')])
+
+
+def points_to_cloud(points):
+    """
+    points[in]: [[x, y, z, r, g, b, step, x, y], ...] as from freeless.img_to_points
+    return structured array of POINT_DTYPE
+    """
+    cloud = np.zeros(len(points), POINT_DTYPE)
+    if len(points):
+        a = np.array(points, np.float64)
+        cloud['position'] = a[:, :3]
+        cloud['color'] = a[:, 3:6]
+        cloud['step'] = a[:, 6]
+        cloud['x'] = a[:, 7]
+        cloud['y'] = a[:, 8]
+    return cloud
+
+
+def cloud_to_points(cloud):
+    """
+    inverse of points_to_cloud, return list of [x, y, z, r, g, b, step, x, y]
+    """
+    columns = cloud['position'].T.tolist() + cloud['color'].T.tolist() + [cloud['step'].tolist(), cloud['x'].tolist(), cloud['y'].tolist()]
+    return [list(p) for p in zip(*columns)]
+
+
+def concatenate_clouds(clouds):
+    return np.concatenate(clouds) if clouds else np.zeros(0, POINT_DTYPE)
+
 
 class image_to_pc():
     """docstring for image_to_pc"""
@@ -27,15 +63,33 @@ class image_to_pc():
         self.reset(steps, scan_settings)
 
     def reset(self, steps, scan_settings):
+        self.wait(cancel=True)
         self.settings = scan_settings
-        self.points_L = []
+        self.clouds_L = []  # POINT_DTYPE array of each step
         self.fs_L = freeless.freeless(self.settings.laserX_L, self.settings.laserZ_L, self.settings)
 
-        self.points_R = []
+        self.clouds_R = []
         self.fs_R = freeless.freeless(self.settings.laserX_R, self.settings.laserZ_R, self.settings)
 
         self.step_counter = 0
         self.steps = steps
+        self.pending = []  # futures of feed_async not waited yet
+        self.ordered = None  # executor running the part of steps that must be in order
+        self.cloud_M = None  # merged points, POINT_DTYPE array
+
+    @property
+    def points_L(self):
+        return cloud_to_points(concatenate_clouds(self.clouds_L))
+
+    @property
+    def points_R(self):
+        return cloud_to_points(concatenate_clouds(self.clouds_R))
+
+    @property
+    def points_M(self):
+        if self.cloud_M is None:
+            raise AttributeError('points_M: not merged yet')
+        return cloud_to_points(self.cloud_M)
 
     def to_image(self, buffer_data):
         """
@@ -46,6 +100,8 @@ class image_to_pc():
         im_array = np.array(im)
 
         # change order from "rgb" to "bgr" <- cv2's order
+        if im_array.shape[2] == 3:
+            return im_array[:, :, ::-1]  # a view, no copy
         im_array[:, :, [0, 2]] = im_array[:, :, [2, 0]]
         return im_array
 
@@ -55,25 +111,86 @@ class image_to_pc():
             note that this step index is the input
             p1[x-coordinate, y-coord, z-coord, r, g, b, step, x, y]
         """
+        ranges = self.detect(self.fs_L, self.fs_R, buffer_O, buffer_L, buffer_R)
+        point_L_this, point_R_this = self.reconstruct(self.fs_L, self.fs_R, ranges, step, l_cab, r_cab)
+        self.clouds_L.append(points_to_cloud(point_L_this))
+        self.clouds_R.append(points_to_cloud(point_R_this))
+        return [self.points_to_bytes(point_L_this), self.points_to_bytes(point_R_this)]
 
+    def feed_async(self, buffer_O, buffer_L, buffer_R, step, l_cab, r_cab):
+        """
+            same as feed, but return at once with the step running on reconstruct_pool,
+            so next steps can be captured and fed meanwhile
+            decoding and detection of steps run at the same time, the rest of each step runs in the order fed
+            return a concurrent.futures.Future of [points_L, points_R] in bytes, see points_to_buffer
+        """
+        if self.ordered is None:
+            self.ordered = ThreadPoolExecutor(1)
+        fs_L, fs_R, clouds_L, clouds_R = self.fs_L, self.fs_R, self.clouds_L, self.clouds_R  # the ones before reset
+        detecting = reconstruct_pool.submit(self.detect, fs_L, fs_R, buffer_O, buffer_L, buffer_R)
+
+        def finish():
+            point_L_this, point_R_this = self.reconstruct(fs_L, fs_R, detecting.result(), step, l_cab, r_cab)
+            clouds_L.append(points_to_cloud(point_L_this))
+            clouds_R.append(points_to_cloud(point_R_this))
+            return [self.points_to_buffer(point_L_this), self.points_to_buffer(point_R_this)]
+
+        future = self.ordered.submit(finish)
+        self.pending.append(future)
+        return future
+
+    def wait(self, cancel=False):
+        """
+            wait for steps fed by feed_async, cancel the ones not started yet if cancel is set
+        """
+        for future in getattr(self, 'pending', ()):
+            if cancel:
+                future.cancel()
+            elif not future.cancelled():
+                future.result()
+        self.pending = []
+
+    def detect(self, fs_L, fs_R, buffer_O, buffer_L, buffer_R):
+        """
+            decode images and find laser candidates of both side, independent of other steps
+        """
         img_O = self.to_image(buffer_O)
         img_L = self.to_image(buffer_L)
         img_R = self.to_image(buffer_R)
+        return img_O, img_L, img_R, fs_L.findLaserRanges(img_O, img_L), fs_R.findLaserRanges(img_O, img_R)
 
-        indices_L = self.fs_L.subProcess(img_O, img_L, self.settings.img_height)
+    @staticmethod
+    def reconstruct(fs_L, fs_R, ranges, step, l_cab, r_cab):
+        """
+            choose laser locations and compute points of a step from detect, steps must be given in order
+            return (points_L, points_R)
+        """
+        img_O, img_L, img_R, ranges_L, ranges_R = ranges
+        indices_L = fs_L.chooseLaserRanges(*ranges_L)
 
         indices_L = [[p[0], p[1] + l_cab]for p in indices_L]
         # indices_L = [[i, step] for i in range(self.settings.img_height)]
-        point_L_this = self.fs_L.img_to_points(img_O, img_L, indices_L, step, 'L', l_cab, clock=True)
-        self.points_L.extend(point_L_this)
-        # return [self.points_to_bytes(point_L_this), []]
+        point_L_this = fs_L.img_to_points(img_O, img_L, indices_L, step, 'L', l_cab, clock=True)
 
-        indices_R = self.fs_R.subProcess(img_O, img_R, self.settings.img_height)
+        indices_R = fs_R.chooseLaserRanges(*ranges_R)
         indices_R = [[p[0], p[1] + r_cab]for p in indices_R]
-        point_R_this = self.fs_R.img_to_points(img_O, img_R, indices_R, step, 'R', r_cab, clock=True)
-        self.points_R.extend(point_R_this)
-        # return [[], self.points_to_bytes(point_R_this)]
-        return [self.points_to_bytes(point_L_this), self.points_to_bytes(point_R_this)]
+        point_R_this = fs_R.img_to_points(img_O, img_R, indices_R, step, 'R', r_cab, clock=True)
+        return point_L_this, point_R_this
+
+    def points_to_buffer(self, points):
+        """
+        convert points to contiguous little endian float32 (x, y, z, r, g, b) of each point,
+        r, g, b are in [0, 1]
+        points[in]: list of points or POINT_DTYPE array, eg. cloud_M
+        output format: check https://github.com/flux3dp/fluxghost/wiki/websocket-3dscan-control
+        """
+        data = np.zeros((len(points), 6), '<f4')
+        if isinstance(points, np.ndarray):
+            data[:, :3] = points['position']
+            data[:, 3:] = points['color'] / np.float64(255.)
+        elif points:
+            data[:] = np.array([p[:6] for p in points], np.float64) / [1, 1, 1, 255., 255., 255.]
+        return data.tobytes()
 
     def points_to_bytes(self, points):
         """
@@ -87,7 +204,8 @@ class image_to_pc():
 
         output format: check https://github.com/flux3dp/fluxghost/wiki/websocket-3dscan-control
         """
-        return [struct.pack('<ffffff', p[0], p[1], p[2], p[3] / 255., p[4] / 255., p[5] / 255.) for p in points]
+        buf = self.points_to_buffer(points)
+        return [buf[i:i + 24] for i in range(0, len(buf), 24)]
 
     def merge(self):
         """
@@ -95,39 +213,53 @@ class image_to_pc():
         find which side is brighter, use it as base
         use Left side as base
         """
-        s_R = sum(int(p[3]) + p[4] + p[5] for p in self.points_R)
-        s_L = sum(int(p[3]) + p[4] + p[5] for p in self.points_L)
+        self.wait()
+        cloud_L = self.clouds_L[0] if len(self.clouds_L) == 1 else concatenate_clouds(self.clouds_L)
+        cloud_R = self.clouds_R[0] if len(self.clouds_R) == 1 else concatenate_clouds(self.clouds_R)
+        self.clouds_L[:] = [cloud_L]
+        self.clouds_R[:] = [cloud_R]
+        s_R = cloud_R['color'].sum(dtype=np.float64)
+        s_L = cloud_L['color'].sum(dtype=np.float64)
 
         if s_R > s_L:
             print('R', file=sys.stderr)
-            base = self.points_R
-            add_on = self.points_L
+            base = cloud_R
+            add_on = cloud_L
             delta = round(60 / (360 / self.steps))
         else:
             print('L', file=sys.stderr)
-            base = self.points_L
-            add_on = self.points_R
+            base = cloud_L
+            add_on = cloud_R
             delta = -round(60 / (360 / self.steps))
 
-        record = {}
-        for p in range(len(base)):
-            record[(base[p][6], base[p][8])] = p
-
-        self.points_M = base[:]
-
         print('merging base {}, add_on {}'.format(len(base), len(add_on)), file=sys.stderr)
 
-        for p in add_on:
-            t = (p[6] + delta) % 400, p[8]
-            if t in record:
-                old_p = base[record[t]]
-                base[record[t]][3] = p[3] / 2 + old_p[3] / 2
-                base[record[t]][4] = p[4] / 2 + old_p[4] / 2
-                base[record[t]][5] = p[5] / 2 + old_p[5] / 2
-            else:
-                self.points_M.append(p)
-
-        print('merge done: output self.mpoints_M:{}'.format(len(self.points_M)), file=sys.stderr)
+        # add_on point at (step, y) is the same as base point at ((step + delta) % steps, y)
+        base_key = (base['step'].astype(np.int64) << 32) + base['y']
+        add_on_key = ((add_on['step'].astype(np.int64) + delta) % self.steps << 32) + add_on['y']
+        order = np.argsort(base_key, kind='stable')
+        sorted_key = base_key[order]
+        index = np.searchsorted(sorted_key, add_on_key, side='right') - 1  # the last base point with the key
+        matched = index >= 0
+        matched[matched] = sorted_key[index[matched]] == add_on_key[matched]
+        target = order[index[matched]]
+
+        # blend colors: color = color / 2 + add_on / 2, for each matched add_on point in order
+        blend_order = np.argsort(target, kind='stable')
+        target = target[blend_order]
+        colors = add_on['color'][matched][blend_order].astype(np.float64)
+        if len(target):
+            group_start = np.flatnonzero(np.concatenate(([True], target[1:] != target[:-1])))
+            group_size = np.diff(np.append(group_start, len(target)))
+            rank = np.arange(len(target)) - np.repeat(group_start, group_size)
+            colors *= 0.5 ** (np.repeat(group_size, group_size) - rank)[:, None]
+            targets, first = target[group_start], base['color'][target[group_start]]
+            blended = first * 0.5 ** group_size[:, None] + np.add.reduceat(colors, group_start)
+            base['color'][targets] = blended
+
+        self.cloud_M = np.concatenate((base, add_on[~matched]))
+
+        print('merge done: output self.mpoints_M:{}'.format(len(self.cloud_M)), file=sys.stderr)
 
 
 def print_progress(step, total):
@@ -209,7 +341,7 @@ if __name__ == '__main__':
 
     for i in range(ss):
         tmp = [open(img_location + '/' + str(i).zfill(3) + '_' + j + '.jpg', 'rb').read() for j in ['O', 'L', 'R']]
-        m_image_to_pc.feed(*tmp, step=i, l_cab=-SS.LLaserAdjustment, r_cab=-SS.RLaserAdjustment)
+        m_image_to_pc.feed_async(*tmp, step=i, l_cab=-SS.LLaserAdjustment, r_cab=-SS.RLaserAdjustment)
 
         print_progress(i, 400)
     print('')
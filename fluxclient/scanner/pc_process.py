@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
-import struct
 from operator import ge, le
 import logging
-from io import BytesIO, StringIO
+from io import StringIO
 from bisect import bisect
 import copy
 from os import environ
@@ -14,7 +13,7 @@ import sys
 from scipy.interpolate import Rbf
 import numpy as np
 
-from fluxclient.scanner.tools import write_stl, write_pcd, read_pcd, cross
+from fluxclient.scanner.tools import write_pcd, read_pcd, cross
 from fluxclient.scanner import _scanner
 
 
@@ -35,7 +34,7 @@ class PcProcess():
         """
         # upload [name] [point count L] [point count R]
         """
-        self.clouds[name] = self.to_cpp((self.unpack_data(buffer_pc_L), self.unpack_data(buffer_pc_R)))
+        self.clouds[name] = [_scanner.PointCloudXYZRGBObj.from_buffer(buffer_pc_L), _scanner.PointCloudXYZRGBObj.from_buffer(buffer_pc_R)]
         logger.debug('upload %s, L: %d R: %d' % (name, len(self.clouds[name][0]), len(self.clouds[name][1])))
         logger.debug('all:' + " ".join(self.clouds.keys()))
 
@@ -60,28 +59,21 @@ class PcProcess():
 
     def unpack_data(self, buffer_data):
         """
-        unpack buffer data into [[x, y, z, r, g, b]]
+        unpack buffer data into float32 array [[x, y, z, r, g, b]], colors are rounded into [0, 255]
         [in] buffer_data:
         """
         assert len(buffer_data) % 24 == 0, "wrong buffer size %d (can't devide by 24)" % (len(buffer_data) % 24)
-        pc = []
-        for p in range(int(len(buffer_data) / 24)):
-            tmp_point = list(struct.unpack('<ffffff', buffer_data[p * 24:p * 24 + 24]))
-            tmp_point[3] = round(tmp_point[3] * 255)
-            tmp_point[4] = round(tmp_point[4] * 255)
-            tmp_point[5] = round(tmp_point[5] * 255)
-            pc.append(tmp_point)
+        pc = np.frombuffer(buffer_data, '<f4').reshape(-1, 6).astype(np.float32)
+        pc[:, 3:] = np.rint(pc[:, 3:] * np.float64(255))
         return pc
 
     def to_cpp(self, pc_both):
         """
-        convert python style pc into cpp style pc object
+        convert python style pc(list of [x, y, z, r, g, b] or (n, 6) array) into cpp style pc object
         """
         c_both = []
         for pc_python in pc_both:
-            pc = _scanner.PointCloudXYZRGBObj()
-            for i in pc_python:
-                pc.push_backPoint(*i)  # pc.push_backPoint(i[0], i[1], i[2], i[3], i[4], i[5])
+            pc = _scanner.PointCloudXYZRGBObj.from_array(pc_python)
             # ne(): normal estimate
             # ne_viewpoint() :normal estimate considering view point
             # ref: http://pointclouds.org/documentation/tutorials/normal_estimation.php
@@ -140,14 +132,9 @@ class PcProcess():
         output = sorted(output, key=lambda x: len(x))
         # for i in output:
         #     print(len(i))
-        tmp_pc = self.to_cpp([[], []])
-        for j in output[-1:]:
-            for i in j:
-                if i < pc0_size:
-                    p = pc[0][i]
-                else:
-                    p = pc[1][i - pc0_size]
-                tmp_pc[0].push_backPoint(*p)
+        points = np.concatenate((pc[0].to_array(), pc[1].to_array()))
+        biggest = np.array(output[-1] if output else [], np.intp)
+        tmp_pc = self.to_cpp([points[biggest], []])
         logger.debug('finish with {} cluster, {} points in biggest one'.format(len(output), len(output[-1])))
         self.clouds[name_out] = tmp_pc
 
@@ -177,12 +164,12 @@ class PcProcess():
 
         pc_size = []
         for pc in pc_both:
-            l = len(pc)
-            pc_size.append(l)
-            for p_i in range(l):  # ?????
-                p = pc.get_item(p_i)
-                buffer_data.append(struct.pack('<ffffff', p[0], p[1], p[2], p[3] / 255., p[4] / 255., p[5] / 255.))
-                # buffer_data.append(struct.pack('<ffffff', p[0], p[1], p[2], 0 / 255., 0 / 255., 0 / 255.))
+            points = pc.to_array()
+            pc_size.append(len(points))
+            data = np.empty(points.shape, '<f4')
+            data[:, :3] = points[:, :3]
+            data[:, 3:] = points[:, 3:] / np.float64(255.)
+            buffer_data.append(data.tobytes())
         buffer_data = b''.join(buffer_data)
         return pc_size[0], pc_size[1], buffer_data
 
@@ -190,18 +177,13 @@ class PcProcess():
         """
         export as a file
         [in] name: the name of desired pc
-        [in] file_format: output as .pcd, .ply, .stl file
+        [in] file_format: output as .pcd, .ply, .stl, .obj file
         [in] mode: if using stl mode, you can specified ascii or binary stl file
         """
         if file_format == 'pcd':
             pc_both = self.clouds[name]
             # WARNING: merge L and R here!
-            pc_add = []
-            pc_size = []
-            for pc in pc_both:
-                pc_size.append(len(pc))
-                for p_i in range(pc_size[-1]):
-                    pc_add.append(pc.get_item(p_i))
+            pc_add = np.concatenate([pc.to_array() for pc in pc_both]).tolist()
             tmp = StringIO()
             write_pcd(pc_add, tmp)
             return tmp.getvalue().encode()
@@ -209,34 +191,20 @@ class PcProcess():
         elif file_format == 'ply':
             pc_both = self.clouds[name]
             # WARNING: merge L and R here!
-            pc_add = []
-            pc_size = []
-            for pc in pc_both:
-                pc_size.append(len(pc))
-                for p_i in range(pc_size[-1]):
-                    pc_add.append(pc.get_item(p_i))
+            pc_add = np.concatenate([pc.to_array() for pc in pc_both])
             raise NotImplementedError
 
-        elif file_format == 'stl':
+        elif file_format in ('stl', 'obj'):
             pc_mesh = self.to_mesh(name)
-            mesh_l = pc_mesh.STL_to_List()
-            if mode == 'ascii':
-                strbuf = StringIO()
-                ##################### fake code ###########################
-                if environ.get("flux_debug") == '1':
-                    write_stl(mesh_l, './output.stl', mode)
-                ###########################################################
-                write_stl(mesh_l, strbuf, mode)
-                return strbuf.getvalue().encode()
-
-            elif mode == 'binary':
-                buf = BytesIO()
-                ##################### fake code ###########################
-                if environ.get("flux_debug") == '1':
-                    write_stl(mesh_l, './output.stl', mode)
-                ###########################################################
-                write_stl(mesh_l, buf, mode)
-                return buf.getvalue()
+            if file_format == 'stl' and mode == 'ascii':
+                file_format = 'stl_ascii'
+            buf = pc_mesh.export_mesh(file_format)
+            ##################### fake code ###########################
+            if environ.get("flux_debug") == '1':
+                with open('./output.' + file_format[:3], 'wb') as f:
+                    f.write(buf)
+            ###########################################################
+            return buf
 
     def export_threading(self, name, file_format, mode='binary'):
         """
@@ -255,50 +223,7 @@ class PcProcess():
         return collect_name
 
     def sub_export(self, collect_name, name, file_format, mode='binary'):
-        if file_format == 'pcd':
-            pc_both = self.clouds[name]
-            # WARNING: merge L and R here!
-            pc_add = []
-            pc_size = []
-            for pc in pc_both:
-                pc_size.append(len(pc))
-                for p_i in range(pc_size[-1]):
-                    pc_add.append(pc.get_item(p_i))
-            tmp = StringIO()
-            write_pcd(pc_add, tmp)
-            ret_buf = tmp.getvalue().encode()
-
-        elif file_format == 'ply':
-            pc_both = self.clouds[name]
-            # WARNING: merge L and R here!
-            pc_add = []
-            pc_size = []
-            for pc in pc_both:
-                pc_size.append(len(pc))
-                for p_i in range(pc_size[-1]):
-                    pc_add.append(pc.get_item(p_i))
-            raise NotImplementedError
-
-        elif file_format == 'stl':
-            pc_mesh = self.to_mesh(name)
-            mesh_l = pc_mesh.STL_to_List()
-            if mode == 'ascii':
-                strbuf = StringIO()
-                ##################### fake code ###########################
-                if environ.get("flux_debug") == '1':
-                    write_stl(mesh_l, './output.stl', mode)
-                ###########################################################
-                write_stl(mesh_l, strbuf, mode)
-                ret_buf = strbuf.getvalue().encode()
-
-            elif mode == 'binary':
-                buf = BytesIO()
-                ##################### fake code ###########################
-                if environ.get("flux_debug") == '1':
-                    write_stl(mesh_l, './output.stl', mode)
-                ###########################################################
-                write_stl(mesh_l, buf, mode)
-                ret_buf = buf.getvalue()
+        ret_buf = self.export(name, file_format, mode)
         self.lock.acquire()
         self.export_data[collect_name] = ret_buf
         self.lock.release()
@@ -333,13 +258,14 @@ class PcProcess():
         pc.apply_transform(x, y, z, rx, ry, rz)
 
         # split
-        new_pc = self.to_cpp([[], []])
-        for i in range(len(pc_both[0])):
-            new_pc[0].push_backPoint(*pc[i])
-        for i in range(len(pc_both[0]), len(pc_both[0]) + len(pc_both[1])):
-            new_pc[1].push_backPoint(*pc[i])
+        self.clouds[name_out] = self.split(pc, len(pc_both[0]), len(pc_both[1]))
 
-        self.clouds[name_out] = new_pc
+    def split(self, pc, L_len, R_len):
+        """
+        split a pc made by adding L and R back into [L, R]
+        """
+        points = pc.to_array()
+        return self.to_cpp([points[:L_len], points[L_len:L_len + R_len]])
 
     def merge(self, name_base, name_2, name_out):
         """
@@ -386,13 +312,10 @@ class PcProcess():
         else:
             logger.debug('adding ceiling at {}'.format(z_value))
 
-        points = []
         out_pc = [i.clone() for i in self.clouds[name_in]]
 
         self.cut(name_out, name_out, 'z', floor, z_value)  # what the fuck
-        for i in range(2):
-            for p in range(len(out_pc[i])):
-                points.append(out_pc[i][p])
+        points = np.concatenate([pc.to_array() for pc in out_pc]).tolist()
 
         # get near floor and a ring point set
         points = [[p, asin(p[1] / sqrt(p[0] ** 2 + p[1] ** 2)) if p[0] > 0 else pi - asin(p[1] / sqrt(p[0] ** 2 + p[1] ** 2))] for p in points]  # add theta data
@@ -482,8 +405,7 @@ class PcProcess():
             print(e.args, file=sys.stderr)
 
         plane += tmp
-        for p in plane:
-            out_pc[0].push_backPoint(*p)
+        out_pc[0].push_back_array(np.array(plane, np.float32).reshape(-1, 6))
         self.clouds[name_out] = out_pc
 
     def auto_alignment(self, name_base, name_2, name_out):
@@ -506,11 +428,5 @@ class PcProcess():
             result, pc_both = reg.SCP()
             # TODO:result???
 
-        new_pc = self.to_cpp([[], []])
-        for i in range(len(self.clouds[name_2][0])):
-            new_pc[0].push_backPoint(*pc_both[i])
-        for i in range(len(self.clouds[name_2][0]), len(self.clouds[name_2][0]) + len(self.clouds[name_2][1])):
-            new_pc[1].push_backPoint(*pc_both[i])
-
-        self.clouds[name_out] = new_pc
+        self.clouds[name_out] = self.split(pc_both, len(self.clouds[name_2][0]), len(self.clouds[name_2][1]))
         return True
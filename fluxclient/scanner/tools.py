@@ -5,6 +5,8 @@ import sys
 from math import sqrt
 from io import StringIO
 
+import numpy as np
+
 
 # PCL NOTE: http://docs.pointclouds.org/1.7.0/structpcl_1_1_point_x_y_z_r_g_b.html
 # uint32_t rgb = ((uint32_t)r << 16 | (uint32_t)g << 8 | (uint32_t)b);
@@ -156,27 +158,22 @@ def write_stl(tri, output='model.stl', mode='binary'):
 
     if mode == 'binary':
         Header = b'FLUX 3d printer: flux3dp.com, 2015'
-
-        for i in range(80):
-            if i < len(Header):
-                outstl.write(struct.pack('@c', Header[i:i + 1]))
-            else:
-                outstl.write(struct.pack("@c", b' '))
-
-        outstl.write(struct.pack("@I", len(tri)))
-        for i in tri:
-            # output normal?
-            n = normal(i)
-            my_normal = normalize(n)
-            outstl.write(struct.pack("@fff", my_normal[0], my_normal[1], my_normal[2]))
-
-            # outstl.write(struct.pack("@fff", 0.0, 0.0, 0.0))
-
-            for j in i:
-                for k in j[:3]:
-                    outstl.write(struct.pack("@f", k))
-            for j in range(2):
-                outstl.write(struct.pack("@?", False))
+        outstl.write(Header.ljust(80) + struct.pack("@I", len(tri)))
+
+        # normal, 3 points and 2 bytes attribute for each triangle, normals computed all at once
+        facets = np.zeros(len(tri), [('normal', '=f4', (3,)), ('vertex', '=f4', (3, 3)), ('attribute', '=u2')])
+        if len(tri):
+            try:
+                v = np.asarray(tri, np.float64)[:, :, :3]
+            except ValueError:  # points with different length
+                v = np.array([[j[:3] for j in i] for i in tri], np.float64)
+            facets['vertex'] = v
+            # normals from the points as given, before rounding to float32
+            n = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+            l = np.sqrt((n ** 2).sum(axis=1))
+            np.divide(n, l[:, None], out=n, where=l[:, None] != 0)
+            facets['normal'] = n
+        outstl.write(facets.tobytes())
 
     elif mode == 'ascii':
         print('solid ascii', file=outstl)
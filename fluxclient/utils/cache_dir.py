@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+per-user cache directories
+
+files in a cache directory are trusted as written by the user, so the directory
+must be owned by the user and not accessible by others
+"""
+import stat
+import sys
+import os
+
+
+def user_cache_dir(name):
+    """
+    return path of name in the user cache directory, eg. ~/.cache/fluxclient/name
+    """
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'fluxclient', name)
+
+
+def is_private_dir(path):
+    """
+    whether path is a directory(not a link) owned by current user, without any permission for group and others
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        return False
+    if not hasattr(os, 'getuid'):
+        return True  # windows, permissions come from the user profile
+    return st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def make_private_dir(path):
+    """
+    create path and its parent with mode 0700 if they don't exist
+    return True if path is a private directory, existing ones are not changed
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    try:
+        if not os.path.isdir(parent):
+            os.makedirs(parent, mode=0o700, exist_ok=True)
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return False
+    return is_private_dir(path)
@@ -200,6 +200,7 @@ def create_pcl_extentions():
         'fluxclient.scanner._scanner',
         sources=[
             "src/scanner/scan_module.cpp",
+            "src/utils/mesh_export.cpp",
             "src/scanner/scanner.pyx"],
         language="c++",
         extra_compile_args=extra_compile_args,
@@ -212,7 +213,9 @@ def create_pcl_extentions():
         'fluxclient.printer._printer',
         sources=[
             "src/printer/printer_module.cpp",
-            # "src/printer/tree_support.cpp",
+            "src/printer/mesh_decimate.cpp",
+            "src/utils/mesh_export.cpp",
+            "src/printer/tree_support.cpp",
             "src/printer/printer.pyx"],
         language="c++",
         extra_compile_args=extra_compile_args,
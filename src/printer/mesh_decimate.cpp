@@ -0,0 +1,340 @@
+#include <cmath>
+#include <queue>
+#include <limits>
+#include <algorithm>
+#include <stdint.h>
+
+#include "mesh_decimate.h"
+// ref: http://mgarland.org/files/papers/quadrics.pdf
+
+#define BOUNDARY_WEIGHT 1000.0  // keep open edges from shrinking
+
+struct Quadric{
+  // symmetric 4x4 matrix, upper triangle: a00 a01 a02 a03 a11 a12 a13 a22 a23 a33
+  double a[10];
+  Quadric(){
+    std::fill(a, a + 10, 0.0);
+  }
+  Quadric(double x, double y, double z, double w, double weight){
+    // plane x * X + y * Y + z * Z + w = 0
+    a[0] = x * x * weight; a[1] = x * y * weight; a[2] = x * z * weight; a[3] = x * w * weight;
+    a[4] = y * y * weight; a[5] = y * z * weight; a[6] = y * w * weight;
+    a[7] = z * z * weight; a[8] = z * w * weight;
+    a[9] = w * w * weight;
+  }
+  Quadric &operator+=(const Quadric &q){
+    for (int i = 0; i < 10; i += 1){
+      a[i] += q.a[i];
+    }
+    return *this;
+  }
+  double error(const double *p) const{
+    // squared distance sum to the planes
+    double x = p[0], y = p[1], z = p[2];
+    return a[0] * x * x + 2 * a[1] * x * y + 2 * a[2] * x * z + 2 * a[3] * x
+         + a[4] * y * y + 2 * a[5] * y * z + 2 * a[6] * y
+         + a[7] * z * z + 2 * a[8] * z + a[9];
+  }
+  bool optimal(double *p) const{
+    // point with minimal error, false if it's not unique
+    double det = a[0] * (a[4] * a[7] - a[5] * a[5]) - a[1] * (a[1] * a[7] - a[5] * a[2]) + a[2] * (a[1] * a[5] - a[4] * a[2]);
+    double scale = std::fabs(a[0]) + std::fabs(a[4]) + std::fabs(a[7]);
+    if (std::fabs(det) <= 1e-9 * scale * scale * scale){
+      return false;
+    }
+    double b0 = -a[3], b1 = -a[6], b2 = -a[8];
+    p[0] = (b0 * (a[4] * a[7] - a[5] * a[5]) - a[1] * (b1 * a[7] - a[5] * b2) + a[2] * (b1 * a[5] - a[4] * b2)) / det;
+    p[1] = (a[0] * (b1 * a[7] - b2 * a[5]) - b0 * (a[1] * a[7] - a[5] * a[2]) + a[2] * (a[1] * b2 - b1 * a[2])) / det;
+    p[2] = (a[0] * (a[4] * b2 - a[5] * b1) - a[1] * (a[1] * b2 - b1 * a[2]) + b0 * (a[1] * a[5] - a[4] * a[2])) / det;
+    return true;
+  }
+};
+
+struct Collapse{
+  // collapse edge u, v into point p
+  double cost;
+  int u, v;
+  unsigned stamp_u, stamp_v;
+  double p[3];
+};
+
+struct CollapseCompare{
+  bool operator()(const Collapse &a, const Collapse &b) const{
+    return a.cost > b.cost;
+  }
+};
+
+class Decimator{
+public:
+  std::vector<double> pos;
+  std::vector<Quadric> quadric;
+  std::vector<std::vector<int> > vertex_faces;  // faces around each vertex, may contain removed faces
+  std::vector<int> &faces;
+  std::vector<char> face_alive, vertex_alive;
+  std::vector<unsigned> stamp;  // changed whenever a vertex moves
+  std::priority_queue<Collapse, std::vector<Collapse>, CollapseCompare> heap;
+  size_t alive_faces;
+
+  Decimator(std::vector<float> &points, std::vector<int> &f) : faces(f){
+    size_t n = points.size() / 3, m = faces.size() / 3;
+    pos.assign(points.begin(), points.end());
+    quadric.resize(n);
+    vertex_faces.resize(n);
+    vertex_alive.assign(n, 1);
+    stamp.assign(n, 0);
+    face_alive.assign(m, 1);
+    alive_faces = m;
+
+    // plane of each face
+    std::vector<double> normal(3 * m, 0.0);
+    for (size_t i = 0; i < m; i += 1){
+      face_normal(i, &normal[3 * i]);
+      double l = std::sqrt(normal[3 * i] * normal[3 * i] + normal[3 * i + 1] * normal[3 * i + 1] + normal[3 * i + 2] * normal[3 * i + 2]);
+      if (l > 0){
+        for (int k = 0; k < 3; k += 1){
+          normal[3 * i + k] /= l;
+        }
+      }
+      const double *p = &pos[3 * faces[3 * i]];
+      Quadric q(normal[3 * i], normal[3 * i + 1], normal[3 * i + 2], -(normal[3 * i] * p[0] + normal[3 * i + 1] * p[1] + normal[3 * i + 2] * p[2]), 1.0);
+      for (int j = 0; j < 3; j += 1){
+        quadric[faces[3 * i + j]] += q;
+        vertex_faces[faces[3 * i + j]].push_back(i);
+      }
+    }
+
+    // edges, sorted so that the same edges are next to each other
+    std::vector<std::pair<uint64_t, int> > edges;
+    edges.reserve(3 * m);
+    for (size_t i = 0; i < m; i += 1){
+      for (int j = 0; j < 3; j += 1){
+        uint64_t a = faces[3 * i + j], b = faces[3 * i + (j + 1) % 3];
+        edges.push_back(std::make_pair(std::min(a, b) << 32 | std::max(a, b), (int)i));
+      }
+    }
+    std::sort(edges.begin(), edges.end());
+    for (size_t i = 0; i < edges.size();){
+      size_t j = i;
+      while (j < edges.size() && edges[j].first == edges[i].first){
+        j += 1;
+      }
+      int u = edges[i].first >> 32, v = edges[i].first & 0xffffffff;
+      if (j - i == 1){
+        // boundary edge, add a plane through it perpendicular to the face
+        const double *n = &normal[3 * edges[i].second];
+        double e[3] = {pos[3 * v] - pos[3 * u], pos[3 * v + 1] - pos[3 * u + 1], pos[3 * v + 2] - pos[3 * u + 2]};
+        double c[3] = {e[1] * n[2] - e[2] * n[1], e[2] * n[0] - e[0] * n[2], e[0] * n[1] - e[1] * n[0]};
+        double l = std::sqrt(c[0] * c[0] + c[1] * c[1] + c[2] * c[2]);
+        if (l > 0){
+          Quadric q(c[0] / l, c[1] / l, c[2] / l, -(c[0] * pos[3 * u] + c[1] * pos[3 * u + 1] + c[2] * pos[3 * u + 2]) / l, BOUNDARY_WEIGHT);
+          quadric[u] += q;
+          quadric[v] += q;
+        }
+      }
+      i = j;
+    }
+    for (size_t i = 0; i < edges.size(); i += 1){
+      if (i == 0 || edges[i].first != edges[i - 1].first){
+        push(edges[i].first >> 32, edges[i].first & 0xffffffff);
+      }
+    }
+  }
+
+  void face_normal(size_t f, double *n){
+    // not normalized
+    const double *a = &pos[3 * faces[3 * f]], *b = &pos[3 * faces[3 * f + 1]], *c = &pos[3 * faces[3 * f + 2]];
+    double e1[3] = {b[0] - a[0], b[1] - a[1], b[2] - a[2]};
+    double e2[3] = {c[0] - a[0], c[1] - a[1], c[2] - a[2]};
+    n[0] = e1[1] * e2[2] - e1[2] * e2[1];
+    n[1] = e1[2] * e2[0] - e1[0] * e2[2];
+    n[2] = e1[0] * e2[1] - e1[1] * e2[0];
+  }
+
+  void push(int u, int v){
+    // plan collapsing edge u, v
+    Collapse c;
+    c.u = u;
+    c.v = v;
+    c.stamp_u = stamp[u];
+    c.stamp_v = stamp[v];
+    Quadric q = quadric[u];
+    q += quadric[v];
+    if (q.optimal(c.p)){
+      c.cost = q.error(c.p);
+    }
+    else{
+      // choose from two ends and the middle
+      double candidate[3][3];
+      for (int k = 0; k < 3; k += 1){
+        candidate[0][k] = pos[3 * u + k];
+        candidate[1][k] = pos[3 * v + k];
+        candidate[2][k] = (pos[3 * u + k] + pos[3 * v + k]) / 2;
+      }
+      c.cost = std::numeric_limits<double>::infinity();
+      for (int i = 0; i < 3; i += 1){
+        double e = q.error(candidate[i]);
+        if (e < c.cost){
+          c.cost = e;
+          std::copy(candidate[i], candidate[i] + 3, c.p);
+        }
+      }
+    }
+    c.cost = std::max(c.cost, 0.0);
+    heap.push(c);
+  }
+
+  void neighbours(int u, std::vector<int> &result){
+    result.clear();
+    for (size_t i = 0; i < vertex_faces[u].size(); i += 1){
+      int f = vertex_faces[u][i];
+      if (face_alive[f]){
+        for (int j = 0; j < 3; j += 1){
+          if (faces[3 * f + j] != u){
+            result.push_back(faces[3 * f + j]);
+          }
+        }
+      }
+    }
+    std::sort(result.begin(), result.end());
+    result.erase(std::unique(result.begin(), result.end()), result.end());
+  }
+
+  bool valid(const Collapse &c){
+    // reject collapses changing topology(link condition) or flipping faces
+    std::vector<int> nu, nv, common;
+    neighbours(c.u, nu);
+    neighbours(c.v, nv);
+    std::set_intersection(nu.begin(), nu.end(), nv.begin(), nv.end(), std::back_inserter(common));
+    size_t shared = 0;
+    for (size_t i = 0; i < vertex_faces[c.u].size(); i += 1){
+      int f = vertex_faces[c.u][i];
+      if (face_alive[f] && (faces[3 * f] == c.v || faces[3 * f + 1] == c.v || faces[3 * f + 2] == c.v)){
+        shared += 1;
+      }
+    }
+    if (shared == 0 || common.size() != shared){
+      return false;
+    }
+
+    int ends[2] = {c.u, c.v};
+    for (int k = 0; k < 2; k += 1){
+      int w = ends[k];
+      for (size_t i = 0; i < vertex_faces[w].size(); i += 1){
+        int f = vertex_faces[w][i];
+        if (!face_alive[f] || faces[3 * f] == ends[1 - k] || faces[3 * f + 1] == ends[1 - k] || faces[3 * f + 2] == ends[1 - k]){
+          continue;  // removed by the collapse
+        }
+        double before[3], after[3], saved[3];
+        face_normal(f, before);
+        std::copy(&pos[3 * w], &pos[3 * w] + 3, saved);
+        std::copy(c.p, c.p + 3, &pos[3 * w]);
+        face_normal(f, after);
+        std::copy(saved, saved + 3, &pos[3 * w]);
+        if (before[0] * after[0] + before[1] * after[1] + before[2] * after[2] <= 0){
+          return false;
+        }
+      }
+    }
+    return true;
+  }
+
+  void collapse(const Collapse &c){
+    // v is merged into u
+    int u = c.u, v = c.v;
+    std::copy(c.p, c.p + 3, &pos[3 * u]);
+    quadric[u] += quadric[v];
+    for (size_t i = 0; i < vertex_faces[v].size(); i += 1){
+      int f = vertex_faces[v][i];
+      if (!face_alive[f]){
+        continue;
+      }
+      if (faces[3 * f] == u || faces[3 * f + 1] == u || faces[3 * f + 2] == u){
+        face_alive[f] = 0;
+        alive_faces -= 1;
+      }
+      else{
+        for (int j = 0; j < 3; j += 1){
+          if (faces[3 * f + j] == v){
+            faces[3 * f + j] = u;
+          }
+        }
+        vertex_faces[u].push_back(f);
+      }
+    }
+    vertex_alive[v] = 0;
+    std::vector<int>().swap(vertex_faces[v]);
+
+    // drop removed faces from u's list
+    std::vector<int> &around = vertex_faces[u];
+    size_t k = 0;
+    for (size_t i = 0; i < around.size(); i += 1){
+      if (face_alive[around[i]]){
+        around[k++] = around[i];
+      }
+    }
+    around.resize(k);
+    stamp[u] += 1;
+
+    std::vector<int> n;
+    neighbours(u, n);
+    for (size_t i = 0; i < n.size(); i += 1){
+      push(u, n[i]);
+    }
+  }
+
+  void run(size_t target_faces, double max_error){
+    while (alive_faces > target_faces && !heap.empty()){
+      Collapse c = heap.top();
+      heap.pop();
+      if (!vertex_alive[c.u] || !vertex_alive[c.v] || stamp[c.u] != c.stamp_u || stamp[c.v] != c.stamp_v){
+        continue;  // outdated
+      }
+      if (c.cost > max_error * max_error){
+        break;
+      }
+      if (valid(c)){
+        collapse(c);
+      }
+    }
+  }
+
+  void output(std::vector<float> &points){
+    // compact points and faces, points are kept in order
+    std::vector<int> index(vertex_alive.size(), -1);
+    size_t m = 0;
+    for (size_t f = 0; f < face_alive.size(); f += 1){
+      if (face_alive[f]){
+        for (int j = 0; j < 3; j += 1){
+          index[faces[3 * f + j]] = 0;
+          faces[3 * m + j] = faces[3 * f + j];
+        }
+        m += 1;
+      }
+    }
+    faces.resize(3 * m);
+    size_t n = 0;
+    for (size_t i = 0; i < index.size(); i += 1){
+      if (index[i] == 0){
+        index[i] = n;
+        for (int k = 0; k < 3; k += 1){
+          points[3 * n + k] = pos[3 * i + k];
+        }
+        n += 1;
+      }
+    }
+    points.resize(3 * n);
+    for (size_t i = 0; i < faces.size(); i += 1){
+      faces[i] = index[faces[i]];
+    }
+  }
+};
+
+int decimate(std::vector<float> &points, std::vector<int> &faces, size_t target_faces, float max_error){
+  // collapse edges with least error until there're target_faces faces left,
+  // or error(distance to original surface) of next collapse is larger than max_error
+  // return faces left
+  Decimator decimator(points, faces);
+  decimator.run(target_faces, max_error);
+  decimator.output(points);
+  return faces.size() / 3;
+}
@@ -0,0 +1,6 @@
+#include <vector>
+#include <cstddef>
+
+// quadric error decimation(Garland & Heckbert) on plain arrays
+// points: x, y, z of each point, faces: 3 point index of each face, both are compacted in place
+int decimate(std::vector<float> &points, std::vector<int> &faces, size_t target_faces, float max_error);
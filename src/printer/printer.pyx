@@ -1,7 +1,8 @@
 import cython
 from libcpp.vector cimport vector
+from libcpp.string cimport string
 
-from fluxclient.scanner.tools import write_stl
+import numpy as np
 
 cdef extern from "printer_module.h":
     cdef cppclass MeshPtr:
@@ -9,15 +10,22 @@ cdef extern from "printer_module.h":
     MeshPtr createMeshPtr()
     int set_point(MeshPtr triangles, vector[vector [float]] points)
     int push_backFace(MeshPtr triangles, int v0, int v1, int v2)
+    int set_point_array(MeshPtr triangles, const float *points, size_t n)
+    int push_back_faces(MeshPtr triangles, const int *faces, size_t m)
+    size_t mesh_point_count(MeshPtr triangles)
+    int get_point_array(MeshPtr triangles, float *points)
+    int get_face_array(MeshPtr triangles, int *faces)
     int add_on(MeshPtr base, MeshPtr new_mesh)
     int STL_to_List(MeshPtr triangles, vector[vector [vector [float]]] &data)
     int apply_transform(MeshPtr triangles, float x, float y, float z, float rx, float ry, float rz, float sc_x, float sc_y, float sc_z)
     int bounding_box(MeshPtr triangles, vector[float] &b_box)
     int cut(MeshPtr input_mesh, MeshPtr out_mesh, float floor_v)
     int mesh_len(MeshPtr input_mesh)
+    int decimate(MeshPtr triangles, size_t target_faces, float max_error)
+    int export_mesh(MeshPtr triangles, string file_format, string &out)
 
-# cdef extern from "tree_support.h":
-#     int add_support(MeshPtr input_mesh, MeshPtr out_mesh, float alpha)
+cdef extern from "tree_support.h":
+    int add_support(MeshPtr input_mesh, MeshPtr out_mesh, float alpha)
 
 cdef class MeshObj:
     cdef MeshPtr meshobj
@@ -29,16 +37,58 @@ cdef class MeshObj:
         for i in face_indice:
             push_backFace(self.meshobj, i[0], i[1], i[2])
 
-    # def add_support(self, alpha):
-    #     out_mesh = MeshObj([], [])
-    #     add_support(self.meshobj, out_mesh.meshobj, alpha)
-    #     return out_mesh
+    @staticmethod
+    def from_arrays(const float[:, ::1] points, const int[:, ::1] faces):
+        """
+        build a mesh from arrays without converting them into lists
+        points[in]: float32 (n, 3)
+        faces[in]: int32 (m, 3), point index of each face
+        """
+        cdef MeshObj mesh = MeshObj([], [])
+        if points.shape[0]:
+            set_point_array(mesh.meshobj, &points[0, 0], points.shape[0])
+        if faces.shape[0]:
+            push_back_faces(mesh.meshobj, &faces[0, 0], faces.shape[0])
+        return mesh
+
+    def to_arrays(self):
+        """
+        return (points, faces): float32 (n, 3), int32 (m, 3)
+        """
+        points = np.empty((mesh_point_count(self.meshobj), 3), np.float32)
+        faces = np.empty((mesh_len(self.meshobj), 3), np.int32)
+        cdef float[:, ::1] points_view = points
+        cdef int[:, ::1] faces_view = faces
+        if points.shape[0]:
+            get_point_array(self.meshobj, &points_view[0, 0])
+        if faces.shape[0]:
+            get_face_array(self.meshobj, &faces_view[0, 0])
+        return points, faces
+
+    def add_support(self, float alpha):
+        """
+        generate tree support for the mesh, time used by each step is printed to stderr
+        alpha[in]: faces with overhang angle(radian) >= alpha are supported, also the angle of support cones
+        return MeshObj of the support struts
+        """
+        out_mesh = MeshObj([], [])
+        add_support(self.meshobj, out_mesh.meshobj, alpha)
+        return out_mesh
 
     def apply_transform(self, transform_param):
         # transform_param:  x, y, z, rx, ry, rz, scale
         x, y, z, rx, ry, rz, sc_x, sc_y, sc_z = transform_param
         apply_transform(self.meshobj, x, y, z, rx, ry, rz, sc_x, sc_y, sc_z)
 
+    def decimate(self, size_t target_faces, float max_error=float('inf')):
+        """
+        simplify the mesh in place by collapsing edges with least quadric error
+        target_faces[in]: stop when there're no more than target_faces faces
+        max_error[in]: stop when next collapse moves the surface farther than max_error
+        return number of faces left
+        """
+        return decimate(self.meshobj, target_faces, max_error)
+
     def add_on(self, MeshObj new_mesh):
         add_on(self.meshobj, new_mesh.meshobj)
 
@@ -50,13 +100,27 @@ cdef class MeshObj:
     def __len__(self):
         return mesh_len(self.meshobj)
 
+    def export(self, file_format='stl'):
+        """
+        write the whole file in c++, without converting the mesh into lists
+        file_format[in]: 'stl'(binary), 'stl_ascii', 'obj' or 'ply'
+        return bytes
+        """
+        cdef string out
+        if export_mesh(self.meshobj, file_format.encode(), out) == -1:
+            raise ValueError('unknown format: %s' % file_format)
+        return out
+
     cpdef write_stl(self, file_name, flag=None):
-        cpdef vector[vector [vector [float]]] tri
-        STL_to_List(self.meshobj, tri)
-        if flag is None:
-            write_stl(tri, file_name)
+        # flag: 'binary'(default) or 'ascii', file_name can also be a file object
+        buf = self.export('stl_ascii' if flag == 'ascii' else 'stl')
+        if type(file_name) == str:
+            with open(file_name, 'wb') as f:
+                f.write(buf)
+        elif flag == 'ascii':
+            file_name.write(buf.decode())
         else:
-            write_stl(tri, file_name, flag)
+            file_name.write(buf)
 
 
     cpdef bounding_box(self):
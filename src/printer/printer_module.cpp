@@ -5,6 +5,8 @@
 #include <limits>
 
 #include "printer_module.h"
+#include "mesh_decimate.h"
+#include "../utils/mesh_export.h"
 
 
 MeshPtr createMeshPtr(){
@@ -36,6 +38,60 @@ int push_backFace(MeshPtr triangles, int v0, int v1, int v2){
   return 0;
 }
 
+int set_point_array(MeshPtr triangles, const float *points, size_t n){
+  // points: float (n, 3), contiguous
+  pcl::PointCloud<pcl::PointXYZ> cloud;
+  cloud.resize(n);
+  for (size_t i = 0; i < n; i += 1){
+    cloud[i].x = points[3 * i];
+    cloud[i].y = points[3 * i + 1];
+    cloud[i].z = points[3 * i + 2];
+  }
+
+  toPCLPointCloud2(cloud, triangles->cloud);
+  return 0;
+}
+
+int push_back_faces(MeshPtr triangles, const int *faces, size_t m){
+  // faces: int (m, 3), contiguous
+  pcl::Vertices v;
+  v.vertices.resize(3);
+  triangles->polygons.reserve(triangles->polygons.size() + m);
+  for (size_t i = 0; i < m; i += 1){
+    v.vertices[0] = faces[3 * i];
+    v.vertices[1] = faces[3 * i + 1];
+    v.vertices[2] = faces[3 * i + 2];
+    triangles->polygons.push_back(v);
+  }
+  return 0;
+}
+
+size_t mesh_point_count(MeshPtr triangles){
+  return triangles->cloud.width * triangles->cloud.height;
+}
+
+int get_point_array(MeshPtr triangles, float *points){
+  // points: float (mesh_point_count, 3)
+  pcl::PointCloud<pcl::PointXYZ> cloud;
+  fromPCLPointCloud2(triangles->cloud, cloud);
+  for (size_t i = 0; i < cloud.size(); i += 1){
+    points[3 * i] = cloud[i].x;
+    points[3 * i + 1] = cloud[i].y;
+    points[3 * i + 2] = cloud[i].z;
+  }
+  return 0;
+}
+
+int get_face_array(MeshPtr triangles, int *faces){
+  // faces: int (mesh_len, 3)
+  for (size_t i = 0; i < triangles->polygons.size(); i += 1){
+    faces[3 * i] = triangles->polygons[i].vertices[0];
+    faces[3 * i + 1] = triangles->polygons[i].vertices[1];
+    faces[3 * i + 2] = triangles->polygons[i].vertices[2];
+  }
+  return 0;
+}
+
 int add_on(MeshPtr base, MeshPtr add_on_mesh){
   pcl::PointCloud<pcl::PointXYZ>::Ptr cloud (new pcl::PointCloud<pcl::PointXYZ>);
   fromPCLPointCloud2(base->cloud, *cloud);
@@ -358,3 +414,34 @@ int STL_to_Faces(MeshPtr triangles, std::vector< std::vector<int> > &data){
 int mesh_len(MeshPtr triangles){
   return triangles->polygons.size();
 }
+
+int decimate(MeshPtr triangles, size_t target_faces, float max_error){
+  // simplify the mesh in place, see mesh_decimate.cpp
+  std::vector<float> points(3 * mesh_point_count(triangles));
+  std::vector<int> faces(3 * triangles->polygons.size());
+  if (points.size()){
+    get_point_array(triangles, &points[0]);
+  }
+  if (faces.size()){
+    get_face_array(triangles, &faces[0]);
+  }
+  decimate(points, faces, target_faces, max_error);
+
+  triangles->polygons.clear();
+  set_point_array(triangles, points.size() ? &points[0] : NULL, points.size() / 3);
+  push_back_faces(triangles, faces.size() ? &faces[0] : NULL, faces.size() / 3);
+  return triangles->polygons.size();
+}
+
+int export_mesh(MeshPtr triangles, std::string file_format, std::string &out){
+  // write the mesh into out as stl, stl_ascii, obj or ply, see mesh_export.h
+  std::vector<float> points(3 * mesh_point_count(triangles));
+  std::vector<int> faces(3 * triangles->polygons.size());
+  if (points.size()){
+    get_point_array(triangles, &points[0]);
+  }
+  if (faces.size()){
+    get_face_array(triangles, &faces[0]);
+  }
+  return export_mesh(points, std::vector<uint8_t>(), faces, file_format, out);
+}
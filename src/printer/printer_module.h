@@ -1,4 +1,5 @@
 #include <vector>
+#include <string>
 
 #include <pcl/point_types.h>
 #include <pcl/PolygonMesh.h>
@@ -10,6 +11,11 @@ MeshPtr createMeshPtr();
 
 int set_point(MeshPtr triangles, std::vector< std::vector<float> > points);
 int push_backFace(MeshPtr triangles, int v0, int v1, int v2);
+int set_point_array(MeshPtr triangles, const float *points, size_t n);
+int push_back_faces(MeshPtr triangles, const int *faces, size_t m);
+size_t mesh_point_count(MeshPtr triangles);
+int get_point_array(MeshPtr triangles, float *points);
+int get_face_array(MeshPtr triangles, int *faces);
 int add_on(MeshPtr base, MeshPtr new_mesh);
 int STL_to_List(MeshPtr triangles, std::vector<std::vector< std::vector<float> > > &data);
 int apply_transform(MeshPtr triangles, float x, float y, float z, float rx, float ry, float rz, float sc_x, float sc_y, float sc_z);
@@ -17,3 +23,5 @@ int bounding_box(MeshPtr triangles, std::vector<float> &b_box);
 int bounding_box(pcl::PointCloud<pcl::PointXYZ>::Ptr cloud, std::vector<float> &b_box);
 int cut(MeshPtr input_mesh, MeshPtr out_mesh, float floor_v);
 int mesh_len(MeshPtr triangles);
+int export_mesh(MeshPtr triangles, std::string file_format, std::string &out);
+int decimate(MeshPtr triangles, size_t target_faces, float max_error);
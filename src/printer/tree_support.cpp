@@ -1,9 +1,17 @@
+#include <map>
+#include <set>
+#include <algorithm>
+
 #include "tree_support.h"
 #include <pcl/filters/voxel_grid.h>
+#include <pcl/common/time.h>
 //fake
 #include <pcl/io/pcd_io.h>
 // ref: http://hpcg.purdue.edu/bbenes/papers/Vanek14SGP.pdf
 
+#define BVH_LEAF_SIZE 4  // max triangles in a leaf of TriangleBVH
+#define BOX_EPSILON 1e-4  // relative padding of bounding boxes against rounding error
+
 float d_v3(Eigen::Vector3f &a, Eigen::Vector3f &b){
   // compute distance between two 3d vector
   return sqrt(pow(a[0] - b[0], 2) + pow(a[1] - b[1], 2) + pow(a[2] - b[2], 2));
@@ -38,17 +46,218 @@ struct cone{
 
 struct tri_data{
   // store data for each triangle in stl
-  // ok:whether it's a valid triangle
-  // tri_after: where the triangle at after transform to xy-plane
-  // tri_trans: the transform matrix
-  // L: key =
+  // ok: whether it's a valid triangle
+  // v: 3 vertices
+  // lo, hi: bounding box, slightly padded
   bool ok;
-  Eigen::Matrix3f tri_after;
-  Eigen::Affine3f tri_trans;
-  std::map<int, Eigen::Vector3f> L;
-  std::map<int, bool> in_tri;
+  Eigen::Vector3f v[3];
+  Eigen::Vector3f lo, hi;
+};
+
+struct bvh_node{
+  // node of TriangleBVH
+  // lo, hi: bounding box of all triangles under this node
+  // left, right: index of children, -1 if it's a leaf
+  // start, end: triangles of a leaf, range in TriangleBVH::order
+  Eigen::Vector3f lo, hi;
+  int left, right, start, end;
+};
+
+class TriangleBVH{
+  // bounding volume hierarchy over the valid triangles, so that cone_mesh_intersect
+  // only checks triangles near the cone instead of every triangle in mesh
+
+public:
+  TriangleBVH(std::vector<tri_data> &preprocess_tri);
+  ~TriangleBVH();
+
+  std::vector<bvh_node> nodes;  // nodes[0] is the root
+  std::vector<int> order;  // index of triangles, grouped by leaf
+
+private:
+  int build(std::vector<tri_data> &preprocess_tri, int start, int end);
+};
+
+struct center_less{
+  // compare triangles by center of bounding box along an axis
+  std::vector<tri_data> *preprocess_tri;
+  int axis;
+  center_less(std::vector<tri_data> *t, int a){
+    preprocess_tri = t;
+    axis = a;
+  }
+  bool operator()(int a, int b) const{
+    return (*preprocess_tri)[a].lo[axis] + (*preprocess_tri)[a].hi[axis] < (*preprocess_tri)[b].lo[axis] + (*preprocess_tri)[b].hi[axis];
+  }
+};
+
+TriangleBVH::TriangleBVH(std::vector<tri_data> &preprocess_tri){
+  for (size_t i = 0; i < preprocess_tri.size(); i += 1){
+    if(preprocess_tri[i].ok){
+      order.push_back(i);
+    }
+  }
+  if(order.size()){
+    nodes.reserve(2 * order.size() / BVH_LEAF_SIZE + 1);
+    build(preprocess_tri, 0, order.size());
+  }
+}
+
+TriangleBVH::~TriangleBVH(){
+}
+
+int TriangleBVH::build(std::vector<tri_data> &preprocess_tri, int start, int end){
+  // build node for order[start:end), split at the median along the longest axis
+  // return index of the node
+  int index = nodes.size();
+  nodes.push_back(bvh_node());
+  Eigen::Vector3f lo = preprocess_tri[order[start]].lo, hi = preprocess_tri[order[start]].hi;
+  for (int i = start + 1; i < end; i += 1){
+    lo = lo.cwiseMin(preprocess_tri[order[i]].lo);
+    hi = hi.cwiseMax(preprocess_tri[order[i]].hi);
+  }
+  nodes[index].lo = lo;
+  nodes[index].hi = hi;
+  nodes[index].start = start;
+  nodes[index].end = end;
+  nodes[index].left = -1;
+  nodes[index].right = -1;
+  if(end - start > BVH_LEAF_SIZE){
+    int axis;
+    (hi - lo).maxCoeff(&axis);
+    int mid = (start + end) / 2;
+    std::nth_element(order.begin() + start, order.begin() + mid, order.begin() + end, center_less(&preprocess_tri, axis));
+    int left = build(preprocess_tri, start, mid);
+    int right = build(preprocess_tri, mid, end);
+    nodes[index].left = left;
+    nodes[index].right = right;
+  }
+  return index;
+}
+
+float box_distance(const Eigen::Vector3f &p, const Eigen::Vector3f &lo, const Eigen::Vector3f &hi){
+  // distance from p to a bounding box, 0 if inside
+  return (lo - p).cwiseMax(p - hi).cwiseMax(Eigen::Vector3f(0, 0, 0)).norm();
+}
+
+bool box_in_cone(const cone &a, float tan_a, const Eigen::Vector3f &lo, const Eigen::Vector3f &hi){
+  // whether a bounding box may contain points inside a cone
+  float h = a.pos[2] - lo[2];
+  if(h < 0){
+    return false;
+  }
+  float dx = std::max(std::max(lo[0] - a.pos[0], a.pos[0] - hi[0]), 0.0f);
+  float dy = std::max(std::max(lo[1] - a.pos[1], a.pos[1] - hi[1]), 0.0f);
+  return dx * dx + dy * dy <= tan_a * h * tan_a * h;
+}
+
+class SupportGrid{
+  // uniform grid on xy-plane over the points still waiting for support,
+  // for finding the cone to intersect with in add_support
+
+public:
+  SupportGrid(pcl::PointCloud<pcl::PointXYZ>::Ptr P, float size);
+  ~SupportGrid();
+  void insert(int i);
+  void remove(int i);
+  int nearest_cone(int current, std::map<int, cone> &C, float limit, float &distance);
+
+  pcl::PointCloud<pcl::PointXYZ>::Ptr cloud;
+  float cell_size, x0, y0;
+  int nx, ny;
+  std::vector< std::vector<int> > cells;  // index of points in each cell, cells[x * ny + y]
+
+private:
+  int cell_x(float x);
+  int cell_y(float y);
 };
 
+SupportGrid::SupportGrid(pcl::PointCloud<pcl::PointXYZ>::Ptr P, float size){
+  // P[in]: grid covers points in P, points outside are put into the nearest cell
+  cloud = P;
+  cell_size = size;
+  x0 = y0 = std::numeric_limits<float>::infinity();
+  float x1 = -x0, y1 = -y0;
+  for (size_t i = 0; i < P->size(); i += 1){
+    x0 = std::min(x0, (*P)[i].x);
+    y0 = std::min(y0, (*P)[i].y);
+    x1 = std::max(x1, (*P)[i].x);
+    y1 = std::max(y1, (*P)[i].y);
+  }
+  if(P->size() == 0){
+    x0 = y0 = x1 = y1 = 0;
+  }
+  nx = (int)((x1 - x0) / cell_size) + 1;
+  ny = (int)((y1 - y0) / cell_size) + 1;
+  cells.resize(nx * ny);
+}
+
+SupportGrid::~SupportGrid(){
+}
+
+int SupportGrid::cell_x(float x){
+  return std::min(std::max((int)floor((x - x0) / cell_size), 0), nx - 1);
+}
+
+int SupportGrid::cell_y(float y){
+  return std::min(std::max((int)floor((y - y0) / cell_size), 0), ny - 1);
+}
+
+void SupportGrid::insert(int i){
+  cells[cell_x((*cloud)[i].x) * ny + cell_y((*cloud)[i].y)].push_back(i);
+}
+
+void SupportGrid::remove(int i){
+  std::vector<int> &c = cells[cell_x((*cloud)[i].x) * ny + cell_y((*cloud)[i].y)];
+  std::vector<int>::iterator it = std::find(c.begin(), c.end(), i);
+  if(it != c.end()){
+    *it = c.back();
+    c.pop_back();
+  }
+}
+
+int SupportGrid::nearest_cone(int current, std::map<int, cone> &C, float limit, float &distance){
+  // find the point whose cone intersects C[current] nearest to current point,
+  // searching cells ring by ring until the rest can't be nearer than the found one or limit
+  // ties are broken by z then index, same as scanning points in the order of sort_by_second
+  // distance[out]: distance to the intersection
+  // return index of the point, -1 if none is within limit
+  int cx = cell_x((*cloud)[current].x), cy = cell_y((*cloud)[current].y);
+  int max_r = std::max(std::max(cx, nx - 1 - cx), std::max(cy, ny - 1 - cy));
+  float tan_a = tan(C[current].theta);
+  int best = -1;
+  distance = std::numeric_limits<float>::infinity();
+  cone tmp_cone;
+  for (int r = 0; r <= max_r; r += 1){
+    // points in ring r are at least (r - 1) cells away,
+    // and the intersection is at least (horizontal distance / tan / 2) below current point
+    if(r > 0 && (r - 1) * cell_size / tan_a / 2 * (1 - BOX_EPSILON) > std::min(distance, limit)){
+      break;
+    }
+    for (int x = std::max(cx - r, 0); x <= std::min(cx + r, nx - 1); x += 1){
+      int step = (x == cx - r || x == cx + r) ? 1 : 2 * r;  // only cells on the ring
+      for (int y = cy - r; y <= cy + r; y += step){
+        if(y < 0 || y >= ny){
+          continue;
+        }
+        std::vector<int> &c = cells[x * ny + y];
+        for (size_t k = 0; k < c.size(); k += 1){
+          int j = c[k];
+          float d = cone_intersect(C[current], C[j], tmp_cone);
+          if(best == -1 || d < distance || (d == distance && ((*cloud)[j].z < (*cloud)[best].z || ((*cloud)[j].z == (*cloud)[best].z && j < best)))){
+            best = j;
+            distance = d;
+          }
+        }
+      }
+    }
+  }
+  if(distance > limit){
+    return -1;
+  }
+  return best;
+}
+
 struct tree_node{
   // a tree node structure that consist its children's index
   // left: the left-side node index
@@ -140,19 +349,6 @@ bool sort_by_second(const std::pair<int, float> a, const std::pair<int, float> b
   }
 }
 
-Eigen::Vector3f sol_2(float x1, float y1, float x2, float y2){
-  // solve the equation pass through (x1, y1), (x2, y2)
-  // ax + by + c= 0
-  // return (a, b, c)
-  return Eigen::Vector3f(y1 - y2, x2 - x1, x1 * y2 - x2 * y1);
-}
-
-float sub_in(float y, float z, Eigen::Vector3f f){
-  // substitute point into equation
-  // return ax + by + c
-  return f(0) * y + f(1) * z + f(2);
-}
-
 bool check_valid_tri(float a, float b, float c){
   // check whether a triangle is valid by checking the legth of 3 edge
   if(a + b <= c || a + c <= b || b + c <= a){
@@ -173,12 +369,19 @@ int add_support(MeshPtr input_mesh, MeshPtr out_mesh, float alpha){
   ////////////////// TODO: read paper to find out what's this /////////////////
   double m_threshold = std::numeric_limits<double>::infinity();
   //////////////////////////////////////////////////////
+  float sample_rate = 1;
+  pcl::StopWatch watch;
 
   pcl::PointCloud<pcl::PointXYZ>::Ptr P(new pcl::PointCloud<pcl::PointXYZ>);  // recording every point's xyz data
-  find_support_point(input_mesh, alpha, 1, P);
+  find_support_point(input_mesh, alpha, sample_rate, P);
+  std::cerr<< "find_support_point: " << watch.getTime() << " ms" << std::endl;
+  watch.reset();
 
   std::vector<tri_data> preprocess_tri;
   preprocess(input_mesh, preprocess_tri);
+  TriangleBVH bvh(preprocess_tri);
+  std::cerr<< "preprocess: " << watch.getTime() << " ms" << std::endl;
+  watch.reset();
 
   std::cerr<< "P size need to be supported:"<< P->size() << std::endl;
   SupportTree support_tree(P);
@@ -186,69 +389,65 @@ int add_support(MeshPtr input_mesh, MeshPtr out_mesh, float alpha){
   sort(P -> points.begin(), P -> points.end(), sort_by_z);
   std::map<int, cone> C;  // recording every cone, key = index of P
 
-  std::vector< std::pair<int, float> > P_v;  // main index list, first = index of P, second = z-coordinate
+  // main index list, first = index of P, second = z-coordinate, ordered by sort_by_second
+  typedef std::set<std::pair<int, float>, bool (*)(const std::pair<int, float>, const std::pair<int, float>)> index_set;
+  index_set P_v(sort_by_second);
+  SupportGrid grid(P, 2 * sample_rate);  // the same points as in P_v
   for (size_t i = 0; i < P -> points.size(); i += 1){
     C[i] = cone((float)P -> points[i].x, (float)P -> points[i].y, (float)P -> points[i].z, alpha);
-    P_v.push_back(std::pair<int, float>(i, P -> points[i].z));
+    P_v.insert(std::pair<int, float>(i, P -> points[i].z));
+    grid.insert(i);
   }
-  sort(P_v.begin(), P_v.end(), sort_by_second);
-  for (size_t i = 0; i < P_v.size(); i += 1){
-    support_tree.tree.push_back(tree_node(-1, -1, P_v[i].first, 1));
+  for (index_set::iterator it = P_v.begin(); it != P_v.end(); ++it){
+    support_tree.tree.push_back(tree_node(-1, -1, it->first, 1));
   }
   // std::cout<< "tree " << support_tree << std::endl;
 
-  std::vector<std::pair <int, float> > S;  // candidates for intersetino point, first:index of P_v,second: distance
-
-  std::map<int, cone> tmp_C;  // cones, key = index of P_v
   int current_point; // current index of P
   while(P_v.size() != 0){
-    current_point = P_v.back().first;  // index of P
-    P_v.pop_back();  // erase highest p, can slightly skip some if statement
-
-    S.clear();
-    tmp_C.clear();
-    // cone-cone intersection
-    for (size_t i = 0; i < P_v.size(); i += 1){
-      cone tmp_cone;
-      S.push_back(std::pair<int, double>(i, cone_intersect(C[current_point], C[P_v[i].first], tmp_cone)));
-      tmp_C[i] = tmp_cone;
-    }
+    current_point = (--P_v.end())->first;  // index of P
+    P_v.erase(--P_v.end());  // erase highest p, can slightly skip some if statement
+    grid.remove(current_point);
+
+    // candidates for intersetino point, cone-cone intersection is chosen when there're ties
+    // first: index of P(or -1 for plate, -2 for mesh), second: distance
+    std::pair<int, float> m;
 
     // cone-plate intersection
-    S.push_back(std::pair<int, double>(-1, P -> points[current_point].z));
+    m = std::pair<int, float>(-1, P -> points[current_point].z);
 
     // cone-mesh intersection, use -2 to indicate it's connected to mesh
     Eigen::Vector3f cm_point;
-    S.push_back(std::pair<int, double>(-2, cone_mesh_intersect(C[current_point], input_mesh, preprocess_tri, cm_point)));
+    float cm_d = cone_mesh_intersect(C[current_point], bvh, preprocess_tri, cm_point);
+    if(cm_d < m.second){
+      m = std::pair<int, float>(-2, cm_d);
+    }
 
-    // choose the right candidate
-    std::pair<int, float> m(S[0]);  // first: index of P_v, second: distance
-    for (size_t i = 0; i < S.size(); i += 1){
-      if(S[i].second < m.second){
-        m = S[i];
-      }
-      // std::cout<< "S:" << S[i].first << " " << S[i].second << std::endl;
+    // cone-cone intersection, only those nearer than plate and mesh
+    float cc_d;
+    int cc = grid.nearest_cone(current_point, C, m.second, cc_d);
+    if(cc != -1){
+      m = std::pair<int, float>(cc, cc_d);
     }
+
     if(m.second > m_threshold){
         // C.erase(current_point);
     }
     else{
       if(m.first >= 0){  // cone-cone
-        // tmp_C[m.first]
-        // std::cout<< "m.first " << m.first << std::endl;
-        cone c(tmp_C[m.first]);
+        cone c;
+        cone_intersect(C[current_point], C[m.first], c);
         C[P->points.size()] = c;
 
         P -> points.push_back(pcl::PointXYZ(c.pos[0], c.pos[1], c.pos[2]));
-        std::pair<int, double> new_pv(P->size() - 1, c.pos[2]);
-
-        support_tree.tree.push_back(tree_node(current_point, P_v[m.first].first, new_pv.first, support_tree.tree[current_point].height + support_tree.tree[P_v[m.first].first].height));
-        P_v.erase(P_v.begin() + m.first);
+        std::pair<int, float> new_pv(P->size() - 1, c.pos[2]);
 
-        std::vector< std::pair<int, float> >::iterator low;
+        support_tree.tree.push_back(tree_node(current_point, m.first, new_pv.first, support_tree.tree[current_point].height + support_tree.tree[m.first].height));
+        P_v.erase(std::pair<int, float>(m.first, P -> points[m.first].z));
+        grid.remove(m.first);
 
-        low = std::lower_bound (P_v.begin(), P_v.end(), new_pv, sort_by_second);
-        P_v.insert(low, new_pv);
+        P_v.insert(new_pv);
+        grid.insert(new_pv.first);
       }
       else if(m.first == -1){ // plate-cone
         // support_tree
@@ -263,108 +462,40 @@ int add_support(MeshPtr input_mesh, MeshPtr out_mesh, float alpha){
         ////////////////////////////////////////////////////////////
       }
       else{
-        std::cout<< "GG, this shouldn't  happen"<< std::endl;
+        std::cerr<< "GG, this shouldn't  happen"<< std::endl;
         assert(false);
       }
     }
   }
+  std::cerr<< "support tree: " << watch.getTime() << " ms" << std::endl;
+  watch.reset();
 
   // std::cout<< "tree " << support_tree << std::endl;
   // std::cout<< "support_tree.cloud " << support_tree.cloud -> size() << std::endl;
   genearte_strut(P, support_tree, out_mesh);
-  support_tree.out_as_js();
+  std::cerr<< "genearte_strut: " << watch.getTime() << " ms" << std::endl;
+#ifdef TREE_SUPPORT_DEBUG
+  support_tree.out_as_js();  // dump the tree to stdout for viewing in js
+#endif
   return 0;
 }
 
 int preprocess(MeshPtr input_mesh, std::vector<tri_data> &preprocess_tri){
-  // ref:http://citeseerx.ist.psu.edu/viewdoc/download?doi=10.1.1.479.8237&rep=rep1&type=pdf
-  // preprocess the triangls, compute transform matrix that can transform them to xy-plane
-  // and some other data such as the eautations for 3 edge and line that pass through vertex and perpendicular to each edge
-  // 9 lines in total
+  // collect vertices and bounding box of each triangle for cone_mesh_intersect
   pcl::PointCloud<pcl::PointXYZ>::Ptr cloud (new pcl::PointCloud<pcl::PointXYZ>);
   fromPCLPointCloud2(input_mesh->cloud, *cloud);
+  preprocess_tri.resize(input_mesh -> polygons.size());
   for (size_t i = 0; i < input_mesh -> polygons.size(); i += 1){
-  // for (size_t i = 825; i < 826; i += 1){
-    tri_data a;
-    Eigen::Matrix3f tri_before;
-    Eigen::Matrix3f tri_after;
-    tri_after.setZero();
+    tri_data &a = preprocess_tri[i];
     for (size_t j = 0; j < 3; j += 1){
-      tri_before(0, j) = (*cloud)[(input_mesh->polygons[i]).vertices[j]].x;
-      tri_before(1, j) = (*cloud)[(input_mesh->polygons[i]).vertices[j]].y;
-      tri_before(2, j) = (*cloud)[(input_mesh->polygons[i]).vertices[j]].z;
+      pcl::PointXYZ &p = (*cloud)[(input_mesh->polygons[i]).vertices[j]];
+      a.v[j] = Eigen::Vector3f(p.x, p.y, p.z);
     }
+    a.ok = check_valid_tri((a.v[0] - a.v[1]).norm(), (a.v[0] - a.v[2]).norm(), (a.v[1] - a.v[2]).norm());
 
-    float d12 = sqrt(pow(tri_before(0, 0) - tri_before(0, 1), 2) + pow(tri_before(1, 0) - tri_before(1, 1), 2) + pow(tri_before(2, 0) - tri_before(2, 1), 2));
-    float d13 = sqrt(pow(tri_before(0, 0) - tri_before(0, 2), 2) + pow(tri_before(1, 0) - tri_before(1, 2), 2) + pow(tri_before(2, 0) - tri_before(2, 2), 2));
-    float d23 = sqrt(pow(tri_before(0, 1) - tri_before(0, 2), 2) + pow(tri_before(1, 1) - tri_before(1, 2), 2) + pow(tri_before(2, 1) - tri_before(2, 2), 2));
-    a.ok = check_valid_tri(d12, d13, d23);
-    if(a.ok){
-      tri_after(2, 1) = d12;
-      tri_after(2, 2) = (pow(d13, 2) - pow(d23, 2) + pow(d12, 2)) / 2 / d12;
-      tri_after(1, 2) = sqrt(pow(d13, 2) - pow(tri_after(2, 2), 2));
-      a.tri_after = tri_after;
-
-      for (size_t i = 0; i < 3; i += 1){
-        for (size_t j = 0; j < 3; j += 1){
-          tri_after(i, j) -= tri_before(i, 0);
-        }
-      }
-      Eigen::Matrix4f tri_trans;
-      tri_trans.setIdentity();
-      tri_trans.block<3,3>(0,0) = tri_after * tri_before.inverse();
-      for (size_t j = 0; j < 3; j += 1){
-        tri_trans(j, 3) = tri_before(j, 0);
-      }
-      a.tri_trans = tri_trans;
-      tri_after = a.tri_after;
-      // std::cerr<< "tri_before " << tri_before << std::endl;
-      // std::cerr<< "a " << a.tri_trans * tri_before << std::endl;
-      // std::cerr<< "tri_after " << tri_after << std::endl;
-
-      float tmp;
-
-      a.L[13] = sol_2(tri_after(1, 0), tri_after(2, 0), tri_after(1, 2), tri_after(2, 2));
-      // std::cerr<< "a[13] " << a.L[13] << std::endl;
-      a.in_tri[13] = sub_in(tri_after(1, 1), tri_after(2, 1), a.L[13]) >= 0;
-      // std::cerr<< "t " << sub_in(tri_after(1, 1), tri_after(2, 1), a.L[13]) << std::endl;
-      // std::cerr<< "in 13 " << a.in_tri[13] << std::endl;
-
-      tmp = -sub_in(tri_after(1, 0), tri_after(2, 0) , Eigen::Vector3f(a.L[13](1), -a.L[13](0), 0));
-      a.L[111] = Eigen::Vector3f(a.L[13](1), -a.L[13](0), tmp);
-      a.in_tri[111] = sub_in(tri_after(1, 2), tri_after(2, 2), a.L[111]) >= 0;
-
-      tmp = -sub_in(tri_after(1, 2), tri_after(2, 2) , Eigen::Vector3f(a.L[13](1), -a.L[13](0), 0));
-      a.L[331] = Eigen::Vector3f(a.L[13](1), -a.L[13](0), tmp);
-      a.in_tri[331] = sub_in(tri_after(1, 0), tri_after(2, 0), a.L[331]) >= 0;
-
-
-      a.L[23] = sol_2(tri_after(1, 1), tri_after(2, 1), tri_after(1, 2), tri_after(2, 2));
-      // std::cerr<< "a[23] " << a.L[23] << std::endl;
-      a.in_tri[23] = sub_in(tri_after(1, 0), tri_after(2, 0), a.L[23]) >= 0;
-
-      tmp = -sub_in(tri_after(1, 1), tri_after(2, 1) , Eigen::Vector3f(a.L[23](1), -a.L[23](0), 0));
-      a.L[223] = Eigen::Vector3f(a.L[23](1), -a.L[23](0), tmp);
-      a.in_tri[223] = sub_in(tri_after(1, 2), tri_after(2, 2), a.L[223]) >= 0;
-
-      tmp = -sub_in(tri_after(1, 2), tri_after(2, 2) , Eigen::Vector3f(a.L[23](1), -a.L[23](0), 0));
-      a.L[332] = Eigen::Vector3f(a.L[23](1), -a.L[23](0), tmp);
-      a.in_tri[332] = sub_in(tri_after(1, 1), tri_after(2, 1), a.L[332]) >= 0;
-
-
-      a.L[12] = sol_2(tri_after(1, 0), tri_after(2, 0), tri_after(1, 1), tri_after(2, 1));
-      // std::cerr<< "a[12] " << a.L[12] << std::endl;
-      a.in_tri[12] = sub_in(tri_after(1, 2), tri_after(2, 2), a.L[12]) >= 0;
-
-      tmp = -sub_in(tri_after(1, 0), tri_after(2, 0) , Eigen::Vector3f(a.L[12](1), -a.L[12](0), 0));
-      a.L[112] = Eigen::Vector3f(a.L[12](1), -a.L[12](0), tmp);
-      a.in_tri[112] = sub_in(tri_after(1, 1), tri_after(2, 1), a.L[112]) >= 0;
-
-      tmp = -sub_in(tri_after(1, 1), tri_after(2, 1) , Eigen::Vector3f(a.L[12](1), -a.L[12](0), 0));
-      a.L[221] = Eigen::Vector3f(a.L[12](1), -a.L[12](0), tmp);
-      a.in_tri[221] = sub_in(tri_after(1, 0), tri_after(2, 0), a.L[221]) >= 0;
-    }
-    preprocess_tri.push_back(a);
+    Eigen::Vector3f pad = (a.v[0].cwiseAbs().cwiseMax(a.v[1].cwiseAbs()).cwiseMax(a.v[2].cwiseAbs()) + Eigen::Vector3f(1, 1, 1)) * BOX_EPSILON;
+    a.lo = a.v[0].cwiseMin(a.v[1]).cwiseMin(a.v[2]) - pad;
+    a.hi = a.v[0].cwiseMax(a.v[1]).cwiseMax(a.v[2]) + pad;
   }
   return 0;
 }
@@ -448,112 +579,94 @@ int find_support_point(MeshPtr triangles, float alpha, float sample_rate, pcl::P
   return 0;
 }
 
-double cone_mesh_intersect(cone a, MeshPtr triangles, std::vector<tri_data> &preprocess_tri, Eigen::Vector3f &p){
+Eigen::Vector3f closest_on_tri(const Eigen::Vector3f &p, const Eigen::Vector3f &a, const Eigen::Vector3f &b, const Eigen::Vector3f &c){
+  // nearest point to p on triangle abc
+  // ref: Real-Time Collision Detection, Christer Ericson, 5.1.5
+  Eigen::Vector3f ab = b - a, ac = c - a, ap = p - a;
+  float d1 = ab.dot(ap), d2 = ac.dot(ap);
+  if(d1 <= 0 && d2 <= 0){  // vertex a
+    return a;
+  }
+  Eigen::Vector3f bp = p - b;
+  float d3 = ab.dot(bp), d4 = ac.dot(bp);
+  if(d3 >= 0 && d4 <= d3){  // vertex b
+    return b;
+  }
+  float vc = d1 * d4 - d3 * d2;
+  if(vc <= 0 && d1 >= 0 && d3 <= 0){  // edge ab
+    return a + ab * (d1 / (d1 - d3));
+  }
+  Eigen::Vector3f cp = p - c;
+  float d5 = ab.dot(cp), d6 = ac.dot(cp);
+  if(d6 >= 0 && d5 <= d6){  // vertex c
+    return c;
+  }
+  float vb = d5 * d2 - d1 * d6;
+  if(vb <= 0 && d2 >= 0 && d6 <= 0){  // edge ac
+    return a + ac * (d2 / (d2 - d6));
+  }
+  float va = d3 * d6 - d5 * d4;
+  if(va <= 0 && d4 - d3 >= 0 && d5 - d6 >= 0){  // edge bc
+    return b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)));
+  }
+  float denom = 1 / (va + vb + vc);  // inside the triangle
+  return a + ab * (vb * denom) + ac * (vc * denom);
+}
+
+double cone_mesh_intersect(cone a, TriangleBVH &bvh, std::vector<tri_data> &preprocess_tri, Eigen::Vector3f &p){
   // intersect a cone with a mesh
   // by finding the nearst point on each triangle
   // and check whether it's inside the cone
+  // triangles are visited through bvh, skipping boxes outside the cone or farther than the nearest found
   // return the distance
   float tan_a = tan(a.theta);
-  pcl::PointCloud<pcl::PointXYZ>::Ptr cloud (new pcl::PointCloud<pcl::PointXYZ>);
-  fromPCLPointCloud2(triangles->cloud, *cloud);
 
   float m = std::numeric_limits<float>::infinity();
-  std::vector<int> main_list(3);
-  main_list[0] = 12;
-  main_list[1] = 13;
-  main_list[2] = 23;
+  int m_index = -1;  // triangle of the nearest point, the first one when there're ties
 
   float d;
   Eigen::Vector3f tmp_p;
-  int index, tmp_sum;
-  for (size_t i = 0; i < triangles->polygons.size(); i += 1){
-    if(!preprocess_tri[i].ok){
+  std::vector<int> stack;
+  if(bvh.nodes.size()){
+    stack.push_back(0);
+  }
+  while(stack.size()){
+    bvh_node &node = bvh.nodes[stack.back()];
+    stack.pop_back();
+    if(!box_in_cone(a, tan_a, node.lo, node.hi) || box_distance(a.pos, node.lo, node.hi) > m){
       continue;
     }
-    Eigen::Vector3f p_trans = preprocess_tri[i].tri_trans * a.pos;
-    // Eigen::Vector3f p_yz(0, p_trans(1), p_trans(2));
-    std::vector<int> record;
-    for (size_t j = 0; j < 3; j += 1){
-      if (bool(sub_in(p_trans(1), p_trans(2), preprocess_tri[i].L[main_list[j]]) >= 0) == preprocess_tri[i].in_tri[main_list[j]]){
-        record.push_back(main_list[j]);
-      }
-    }
-    if (record.size() == 3){  // in the triangle
-      d = std::abs(p_trans(0));
-      tmp_p = Eigen::Vector3f(0, p_trans(1), p_trans(2));
-    }
-    else if(record.size() == 2){ // nearst to another line
-      tmp_sum = record[0] + record[1];
-      if(tmp_sum == 12 + 13){
-        index = 23;
-      }
-      else if(tmp_sum == 12 + 23){
-        index = 13;
-      }
-      else if(tmp_sum == 13 + 23){
-        index = 12;
-      }
-      float c_n = (preprocess_tri[i].L[index](1) * p_trans(1)+ preprocess_tri[i].L[index](0) * p_trans(2)) * -1;
-      float a_sq_plus_b_sq = pow(preprocess_tri[i].L[index](0), 2) + pow(preprocess_tri[i].L[index](1), 2);
-      tmp_p = Eigen::Vector3f(0,
-        (-preprocess_tri[i].L[index](0) * preprocess_tri[i].L[index](2) - preprocess_tri[i].L[index](1) * c_n) / a_sq_plus_b_sq,
-        (preprocess_tri[i].L[index](0) * c_n - preprocess_tri[i].L[index](1) * preprocess_tri[i].L[index](2)) / a_sq_plus_b_sq);
-      d = d_v3(tmp_p, p_trans);
-    }
-    else if(record.size() == 1){// nearst to another point
-      if(record[0] == 12){
-        index = 3 - 1;
-      }
-      else if(record[0] == 13){
-        index = 2 - 1;
-      }
-      else if(record[0] == 23){
-        index = 1 - 1;
+    if(node.left == -1){
+      for (int k = node.start; k < node.end; k += 1){
+        int i = bvh.order[k];
+        tmp_p = closest_on_tri(a.pos, preprocess_tri[i].v[0], preprocess_tri[i].v[1], preprocess_tri[i].v[2]);
+        d = d_v3(tmp_p, a.pos);
+
+        //check whether it's in the cone
+        float h = a.pos[2] - tmp_p(2);
+        if(h >= 0){
+          if(tan_a * h >= sqrt(pow(tmp_p[0] - a.pos[0], 2) + pow(tmp_p[1] - a.pos[1], 2))){
+            if(d < m || (d == m && i < m_index)){
+              m = d;
+              m_index = i;
+              p = tmp_p;
+            }
+          }
+        }
       }
-      tmp_p = Eigen::Vector3f(preprocess_tri[i].tri_after(0, index), preprocess_tri[i].tri_after(1, index), preprocess_tri[i].tri_after(2, index));
-      d = d_v3(tmp_p, p_trans);
-      // line_point
     }
     else{
-      // d+=1;
-      std::cerr<< "i " << i << " "<< record.size() << std::endl;
-      std::cerr<< "p_trans " << p_trans << std::endl;
-      std::cerr<< "1 f\n " << preprocess_tri[i].L[main_list[0]] << std::endl;
-      std::cerr<< "2 f\n " << preprocess_tri[i].L[main_list[1]] << std::endl;
-      std::cerr<< "3 f\n " << preprocess_tri[i].L[main_list[2]] << std::endl;
-
-      std::cerr<< "n 1\n " << sub_in(p_trans(1), p_trans(2), preprocess_tri[i].L[main_list[0]]) << std::endl;
-      std::cerr<< "n 2\n " << bool(sub_in(p_trans(1), p_trans(2), preprocess_tri[i].L[main_list[1]]) >=0) << std::endl;
-      std::cerr<< "n 3\n " << sub_in(p_trans(1), p_trans(2), preprocess_tri[i].L[main_list[2]]) << std::endl;
-
-      std::cerr<< " a1\n " << preprocess_tri[i].in_tri[main_list[0]] << std::endl;
-      std::cerr<< " a2\n " << preprocess_tri[i].in_tri[main_list[1]] << std::endl;
-      std::cerr<< " a3\n " << preprocess_tri[i].in_tri[main_list[2]] << std::endl;
-      if (bool(sub_in(p_trans(1), p_trans(2), preprocess_tri[i].L[main_list[1]]) >=0) == preprocess_tri[i].in_tri[main_list[1]])
-      {
-          std::cerr<< "ok " << std::endl;
+      // visit the nearer child first
+      if(box_distance(a.pos, bvh.nodes[node.left].lo, bvh.nodes[node.left].hi) < box_distance(a.pos, bvh.nodes[node.right].lo, bvh.nodes[node.right].hi)){
+        stack.push_back(node.right);
+        stack.push_back(node.left);
       }
-      exit(1);
-    }
-    tmp_p = preprocess_tri[i].tri_trans.inverse() * tmp_p;
-
-    //check whether it's in the cone
-    float h = a.pos[2] - tmp_p(2);
-    if(h >= 0){
-      if(tan_a * h >= sqrt(pow(tmp_p[0] - a.pos[0], 2) + pow(tmp_p[1] - a.pos[1], 2))){
-        if(d < m){
-          m = d;
-          p = tmp_p;
-          // std::cerr<< "i " << i << " "<< record.size() << std::endl;
-        }
+      else{
+        stack.push_back(node.left);
+        stack.push_back(node.right);
       }
     }
-
   }
-  // std::cerr<< "m " << m << std::endl;
-  // std::cerr<< "tmp_p " << tmp_p << std::endl;
-  // std::cerr<< "p " << p << std::endl;
-
   return m;
 }
 
@@ -1,5 +1,6 @@
 #include <iostream>
 #include <limits>
+#include <cmath>
 
 #include <pcl/io/pcd_io.h>
 #include <pcl/filters/statistical_outlier_removal.h>
@@ -14,6 +15,7 @@
 #include <pcl/surface/gp3.h>
 
 #include "scan_module.h"
+#include "../utils/mesh_export.h"
 
 PointCloudXYZRGBPtr createPointCloudXYZRGB() {
   pcl::PointCloud<pcl::PointXYZRGB>::Ptr cloud (
@@ -45,6 +47,41 @@ int get_item(PointCloudXYZRGBPtr cloud, int key, std::vector<float> &point){
 size_t get_w(PointCloudXYZRGBPtr cloud){
   return (*cloud).size();
 }
+
+int push_back_points(PointCloudXYZRGBPtr cloud, const float *points, size_t n, float color_scale){
+  // points: float (n, 6) of x, y, z, r, g, b, colors are multiplied by color_scale and rounded into [0, 255]
+  cloud->reserve(cloud->size() + n);
+  for (size_t i = 0; i < n; i += 1){
+    const float *q = points + 6 * i;
+    uint32_t c[3];
+    for (int j = 0; j < 3; j += 1){
+      double v = nearbyint((double)q[3 + j] * color_scale);
+      c[j] = v < 0 ? 0 : (v > 255 ? 255 : (uint32_t)v);
+    }
+    pcl::PointXYZRGB p;
+    p.x = q[0];
+    p.y = q[1];
+    p.z = q[2];
+    p.rgb = ((c[0] << 16) | (c[1] << 8) | c[2]);
+    cloud->push_back(p);
+  }
+  return 0;
+}
+
+int get_points(PointCloudXYZRGBPtr cloud, float *points){
+  // points: float (get_w, 6) of x, y, z, r, g, b, same as get_item
+  for (size_t i = 0; i < cloud->size(); i += 1){
+    const pcl::PointXYZRGB &p = (*cloud)[i];
+    float *q = points + 6 * i;
+    q[0] = p.x;
+    q[1] = p.y;
+    q[2] = p.z;
+    q[3] = (uint32_t(p.rgb) >> 16) & 0x0000ff;
+    q[4] = (uint32_t(p.rgb) >> 8) & 0x0000ff;
+    q[5] = (uint32_t(p.rgb)) & 0x0000ff;
+  }
+  return 0;
+}
 void push_backPoint(PointCloudXYZRGBPtr cloud, float x, float y, float z, uint32_t r, uint32_t g, uint32_t b){
   pcl::PointXYZRGB p;
   p.x = x;
@@ -295,6 +332,29 @@ int STL_to_Faces(MeshPtr triangles, std::vector< std::vector<int> > &data){
   return 0;
 }
 
+int export_mesh(MeshPtr triangles, std::string file_format, std::string &out){
+  // write the mesh into out as stl, stl_ascii, obj or ply(with point colors), see mesh_export.h
+  pcl::PointCloud<pcl::PointXYZRGB> cloud;
+  fromPCLPointCloud2(triangles->cloud, cloud);
+  std::vector<float> points(3 * cloud.size());
+  std::vector<uint8_t> colors(3 * cloud.size());
+  for (size_t i = 0; i < cloud.size(); i += 1){
+    points[3 * i] = cloud[i].x;
+    points[3 * i + 1] = cloud[i].y;
+    points[3 * i + 2] = cloud[i].z;
+    colors[3 * i] = cloud[i].r;
+    colors[3 * i + 1] = cloud[i].g;
+    colors[3 * i + 2] = cloud[i].b;
+  }
+  std::vector<int> faces(3 * triangles->polygons.size());
+  for (size_t i = 0; i < triangles->polygons.size(); i += 1){
+    faces[3 * i] = triangles->polygons[i].vertices[0];
+    faces[3 * i + 1] = triangles->polygons[i].vertices[1];
+    faces[3 * i + 2] = triangles->polygons[i].vertices[2];
+  }
+  return export_mesh(points, colors, faces, file_format, out);
+}
+
 int bounding_box(PointCloudXYZRGBPtr cloud, std::vector<float> &b_box){
   float minx = std::numeric_limits<double>::infinity(), miny = std::numeric_limits<double>::infinity(), minz = std::numeric_limits<double>::infinity();
   float maxx = -1 * std::numeric_limits<double>::infinity(), maxy = -1 * std::numeric_limits<double>::infinity(), maxz = -1 * std::numeric_limits<double>::infinity();
@@ -1,4 +1,5 @@
 #include <vector>
+#include <string>
 
 #include <pcl/point_cloud.h>
 #include <pcl/point_types.h>
@@ -16,6 +17,8 @@ int loadPointCloudXYZRGB(const char* file, PointCloudXYZRGBPtr cloud);
 void dumpPointCloudXYZRGB(const char* file, PointCloudXYZRGBPtr cloud);
 int get_item(PointCloudXYZRGBPtr cloud, int key, std::vector<float> &point);
 size_t get_w(PointCloudXYZRGBPtr cloud);
+int push_back_points(PointCloudXYZRGBPtr cloud, const float *points, size_t n, float color_scale);
+int get_points(PointCloudXYZRGBPtr cloud, float *points);
 
 int SOR(PointCloudXYZRGBPtr cloud, int neighbors, float threshold);
 int Euclidean_Cluster(PointCloudXYZRGBPtr cloud, float thres_dist, std::vector< std::vector<int> > &output);
@@ -58,6 +61,7 @@ int POS(PointXYZRGBNormalPtr cloud_with_normals, MeshPtr triangles, PointCloudXY
 int GPT(PointXYZRGBNormalPtr cloud_with_normals, MeshPtr triangles, PointCloudXYZRGBPtr cloud);
 int STL_to_List(MeshPtr triangles, std::vector<std::vector< std::vector<float> > > &data);
 int STL_to_Faces(MeshPtr triangles, std::vector< std::vector<int> > &data);
+int export_mesh(MeshPtr triangles, std::string file_format, std::string &out);
 int apply_transform(PointCloudXYZRGBPtr cloud, NormalPtr normals, PointXYZRGBNormalPtr both, float x, float y, float z, float rx, float ry, float rz);
 
 int clone(PointCloudXYZRGBPtr obj, PointCloudXYZRGBPtr obj2);
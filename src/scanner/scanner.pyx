@@ -1,6 +1,9 @@
 import cython
 import sys
 from libcpp.vector cimport vector
+from libcpp.string cimport string
+
+import numpy as np
 
 
 cdef extern from "scan_module.h":
@@ -21,6 +24,8 @@ cdef extern from "scan_module.h":
     void push_backPoint(PointCloudXYZRGBPtr cloud, float x, float y, float z, cython.uint r, cython.uint g, cython.uint b)
     int get_item(PointCloudXYZRGBPtr cloud, int key, vector[float] point)
     int get_w(PointCloudXYZRGBPtr cloud)
+    int push_back_points(PointCloudXYZRGBPtr cloud, const float *points, size_t n, float color_scale)
+    int get_points(PointCloudXYZRGBPtr cloud, float *points)
     int apply_transform(PointCloudXYZRGBPtr cloud, NormalPtr normals, PointXYZRGBNormalPtr both, float x, float y, float z, float rx, float ry, float rz)
 
     int clone(PointCloudXYZRGBPtr obj, PointCloudXYZRGBPtr obj2)
@@ -48,6 +53,7 @@ cdef extern from "scan_module.h":
     int GPT(PointXYZRGBNormalPtr cloud_with_normals, MeshPtr triangles, PointCloudXYZRGBPtr cloud)
     int STL_to_Faces(MeshPtr, vector[vector [int]] &viewp)
     int STL_to_List(MeshPtr triangles, vector[vector[vector [float]]] &data)
+    int export_mesh(MeshPtr triangles, string file_format, string &out)
     int cut(PointCloudXYZRGBPtr input, PointCloudXYZRGBPtr output, int mode, int direction, float value)
 
 cdef class PointCloudXYZRGBObj:
@@ -107,6 +113,46 @@ cdef class PointCloudXYZRGBObj:
     cpdef push_backPoint(self, float x, float y, float z, r, g, b):
         push_backPoint(self.obj, x, y, z, r, g, b)
 
+    def push_back_array(self, const float[:, ::1] points, float color_scale=1):
+        """
+        append points at once
+        points[in]: float32 (n, 6) of x, y, z, r, g, b
+        color_scale[in]: colors are multiplied by it and rounded into [0, 255], eg. 255 for colors in [0, 1]
+        """
+        assert points.shape[1] == 6, 'points should be (n, 6), got %s' % (points.shape[1], )
+        if points.shape[0]:
+            push_back_points(self.obj, &points[0, 0], points.shape[0], color_scale)
+
+    @staticmethod
+    def from_array(points, float color_scale=1):
+        """
+        build a point cloud from array without converting it into lists
+        points[in]: (n, 6) of x, y, z, r, g, b, array or anything numpy can convert
+        """
+        pc = PointCloudXYZRGBObj()
+        pc.push_back_array(np.require(np.asarray(points, np.float32).reshape(-1, 6), np.float32, ['C', 'A']), color_scale)
+        return pc
+
+    @staticmethod
+    def from_buffer(buffer_data):
+        """
+        build a point cloud from uploaded points
+        buffer_data[in]: little endian float32 x, y, z, r, g, b of each point, colors in [0, 1]
+        """
+        assert len(buffer_data) % 24 == 0, "wrong buffer size %d (can't devide by 24)" % (len(buffer_data) % 24)
+        return PointCloudXYZRGBObj.from_array(np.frombuffer(buffer_data, '<f4'), 255)
+
+    def to_array(self):
+        """
+        return float32 (n, 6) of x, y, z, r, g, b, same as get_item of each point
+        points are copied, the array stays valid after the cloud changes
+        """
+        points = np.empty((len(self), 6), np.float32)
+        cdef float[:, ::1] points_view = points
+        if points.shape[0]:
+            get_points(self.obj, &points_view[0, 0])
+        return points
+
     cpdef get_item(self, key):
         cdef vector[float] point = [0., 0., 0., 0., 0., 0.]
         assert key < len(self), 'get index:%d out of range:%d' % (key, len(self))
@@ -157,6 +203,17 @@ cdef class PointCloudXYZRGBObj:
         STL_to_List(self.meshobj, data)
         return data
 
+    def export_mesh(self, file_format='stl'):
+        """
+        write the mesh(built by to_mesh) as a whole file in c++
+        file_format[in]: 'stl'(binary), 'stl_ascii', 'obj' or 'ply'(with point colors)
+        return bytes
+        """
+        cdef string out
+        if export_mesh(self.meshobj, file_format.encode(), out) == -1:
+            raise ValueError('unknown format: %s' % file_format)
+        return out
+
 
 
 # reg part
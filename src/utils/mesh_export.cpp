@@ -0,0 +1,133 @@
+#include <stdio.h>
+#include <string.h>
+#include <math.h>
+#include "mesh_export.h"
+
+#define STL_HEADER "FLUX 3d printer: flux3dp.com, 2015"
+
+static void face_normal(const float *a, const float *b, const float *c, float *n){
+  // unit normal(right hand) of triangle abc, 0 if it's degenerate
+  float e1[3] = {b[0] - a[0], b[1] - a[1], b[2] - a[2]};
+  float e2[3] = {c[0] - a[0], c[1] - a[1], c[2] - a[2]};
+  n[0] = e1[1] * e2[2] - e1[2] * e2[1];
+  n[1] = e1[2] * e2[0] - e1[0] * e2[2];
+  n[2] = e1[0] * e2[1] - e1[1] * e2[0];
+  float l = sqrt(n[0] * n[0] + n[1] * n[1] + n[2] * n[2]);
+  if (l != 0){
+    n[0] /= l;
+    n[1] /= l;
+    n[2] /= l;
+  }
+}
+
+int export_mesh(const std::vector<float> &points, const std::vector<uint8_t> &colors, const std::vector<int> &faces, const std::string &file_format, std::string &out){
+  if (file_format == "stl"){
+    return write_stl_binary(points, faces, out);
+  }
+  else if (file_format == "stl_ascii"){
+    return write_stl_ascii(points, faces, out);
+  }
+  else if (file_format == "obj"){
+    return write_obj(points, faces, out);
+  }
+  else if (file_format == "ply"){
+    return write_ply(points, colors, faces, out);
+  }
+  return -1;
+}
+
+int write_stl_binary(const std::vector<float> &points, const std::vector<int> &faces, std::string &out){
+  // 80 bytes header, uint32 face count, then 50 bytes for each face:
+  // normal, 3 vertices in float32 and a uint16 attribute
+  // numbers are written in native byte order(little endian on supported platforms)
+  uint32_t m = faces.size() / 3;
+  out.assign(84 + 50 * (size_t)m, '\0');
+  char *p = &out[0];
+  memset(p, ' ', 80);
+  memcpy(p, STL_HEADER, strlen(STL_HEADER));
+  memcpy(p + 80, &m, 4);
+  p += 84;
+
+  float facet[12];
+  for (size_t i = 0; i < m; i += 1){
+    const float *v[3] = {&points[3 * faces[3 * i]], &points[3 * faces[3 * i + 1]], &points[3 * faces[3 * i + 2]]};
+    face_normal(v[0], v[1], v[2], facet);
+    for (int j = 0; j < 3; j += 1){
+      memcpy(facet + 3 + 3 * j, v[j], 3 * sizeof(float));
+    }
+    memcpy(p, facet, sizeof(facet));  // attribute is left 0
+    p += 50;
+  }
+  return 0;
+}
+
+int write_stl_ascii(const std::vector<float> &points, const std::vector<int> &faces, std::string &out){
+  char buf[256];
+  size_t m = faces.size() / 3;
+  out = "solid ascii\n";
+  out.reserve(m * 256 + 32);
+  float n[3];
+  for (size_t i = 0; i < m; i += 1){
+    const float *v[3] = {&points[3 * faces[3 * i]], &points[3 * faces[3 * i + 1]], &points[3 * faces[3 * i + 2]]};
+    face_normal(v[0], v[1], v[2], n);
+    snprintf(buf, sizeof(buf), " facet normal %f %f %f\n  outer loop\n", n[0], n[1], n[2]);
+    out += buf;
+    for (int j = 0; j < 3; j += 1){
+      snprintf(buf, sizeof(buf), "   vertex %.9g %.9g %.9g\n", v[j][0], v[j][1], v[j][2]);
+      out += buf;
+    }
+    out += "  endloop\n endfacet\n";
+  }
+  out += "endsolid\n";
+  return 0;
+}
+
+int write_obj(const std::vector<float> &points, const std::vector<int> &faces, std::string &out){
+  char buf[128];
+  out = "# " STL_HEADER "\n";
+  out.reserve(points.size() * 14 + faces.size() * 8 + 64);
+  for (size_t i = 0; i < points.size(); i += 3){
+    snprintf(buf, sizeof(buf), "v %.9g %.9g %.9g\n", points[i], points[i + 1], points[i + 2]);
+    out += buf;
+  }
+  for (size_t i = 0; i < faces.size(); i += 3){
+    // index start from 1
+    snprintf(buf, sizeof(buf), "f %d %d %d\n", faces[i] + 1, faces[i + 1] + 1, faces[i + 2] + 1);
+    out += buf;
+  }
+  return 0;
+}
+
+int write_ply(const std::vector<float> &points, const std::vector<uint8_t> &colors, const std::vector<int> &faces, std::string &out){
+  // binary little endian ply, with vertex colors if there are
+  char buf[64];
+  size_t n = points.size() / 3, m = faces.size() / 3;
+  bool has_color = colors.size() == 3 * n && n;
+  out = "ply\nformat binary_little_endian 1.0\ncomment " STL_HEADER "\n";
+  snprintf(buf, sizeof(buf), "element vertex %lu\n", (unsigned long)n);
+  out += buf;
+  out += "property float x\nproperty float y\nproperty float z\n";
+  if (has_color){
+    out += "property uchar red\nproperty uchar green\nproperty uchar blue\n";
+  }
+  snprintf(buf, sizeof(buf), "element face %lu\n", (unsigned long)m);
+  out += buf;
+  out += "property list uchar int vertex_indices\nend_header\n";
+
+  size_t header = out.size(), vertex_size = has_color ? 15 : 12;
+  out.resize(header + n * vertex_size + m * 13);
+  char *p = &out[header];
+  for (size_t i = 0; i < n; i += 1){
+    memcpy(p, &points[3 * i], 12);
+    if (has_color){
+      memcpy(p + 12, &colors[3 * i], 3);
+    }
+    p += vertex_size;
+  }
+  for (size_t i = 0; i < m; i += 1){
+    p[0] = 3;
+    memcpy(p + 1, &faces[3 * i], 12);
+    p += 13;
+  }
+  return 0;
+}
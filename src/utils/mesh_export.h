@@ -0,0 +1,14 @@
+#include <vector>
+#include <string>
+#include <stdint.h>
+
+// write a triangle mesh into out as a whole file
+// points: x, y, z of each point, faces: 3 point index of each face
+// colors: r, g, b of each point, or empty(only used by ply)
+// file_format: "stl"(binary), "stl_ascii", "obj" or "ply"(binary)
+// return -1 if file_format is unknown
+int export_mesh(const std::vector<float> &points, const std::vector<uint8_t> &colors, const std::vector<int> &faces, const std::string &file_format, std::string &out);
+int write_stl_binary(const std::vector<float> &points, const std::vector<int> &faces, std::string &out);
+int write_stl_ascii(const std::vector<float> &points, const std::vector<int> &faces, std::string &out);
+int write_obj(const std::vector<float> &points, const std::vector<int> &faces, std::string &out);
+int write_ply(const std::vector<float> &points, const std::vector<uint8_t> &colors, const std::vector<int> &faces, std::string &out);
@@ -7,6 +7,7 @@ from libcpp.string cimport string
 
 cdef extern from "utils_module.h":
     string path_to_js(vector[vector[vector [float]]] output)
+    string path_array_to_js(const float *xyz, const unsigned char *types, const long long *offsets, size_t layer_count)
 
 
 cdef class Tools:
@@ -15,3 +16,14 @@ cdef class Tools:
 
     cpdef path_to_js(self, path):
         return path_to_js(path)
+
+    cpdef path_array_to_js(self, const float[:, ::1] xyz, const unsigned char[::1] types, const long long[::1] offsets):
+        """
+        same as path_to_js, but path is given in flat arrays(see fluxclient.fcode.fcode_base.PathStore)
+        xyz[in]: points, float32 (n, 3)
+        types[in]: point type of each point, uint8 (n,)
+        offsets[in]: index of first point of each layer, and end of the last layer, int64 (layers + 1,)
+        """
+        if xyz.shape[0] == 0:
+            return path_array_to_js(NULL, NULL, &offsets[0], offsets.shape[0] - 1)
+        return path_array_to_js(&xyz[0, 0], &types[0], &offsets[0], offsets.shape[0] - 1)
@@ -20,3 +20,23 @@ std::string path_to_js(std::vector< std::vector< std::vector<float> > > path){
   c_string += "]";
   return c_string;
 }
+
+std::string path_array_to_js(const float *xyz, const unsigned char *types, const long long *offsets, size_t layer_count){
+  // same output as path_to_js, from a flat path: layer i is point offsets[i] to offsets[i + 1]
+  char buf[50];
+  std::string c_string("[");
+  c_string.reserve((offsets[layer_count] - offsets[0]) * 32 + 2);
+  for (size_t layer = 0; layer < layer_count; layer += 1){
+    c_string += "[";
+      for (long long point = offsets[layer]; point < offsets[layer + 1]; point += 1){
+        sprintf(buf, "[%.2f,%.2f,%.2f,%d]", xyz[point * 3], xyz[point * 3 + 1], xyz[point * 3 + 2], (int)types[point]);
+        c_string += buf;
+        c_string += ",";
+      }
+      c_string.erase(c_string.end() - 1);
+    c_string += "],";
+  }
+  c_string.erase(c_string.end() - 1);
+  c_string += "]";
+  return c_string;
+}
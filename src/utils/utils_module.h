@@ -1,3 +1,4 @@
 #include <vector>
 #include <string>
 std::string path_to_js(std::vector< std::vector< std::vector<float> > > output);
+std::string path_array_to_js(const float *xyz, const unsigned char *types, const long long *offsets, size_t layer_count);
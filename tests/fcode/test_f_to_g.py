@@ -0,0 +1,56 @@
+from io import BytesIO
+import unittest
+import struct
+
+from fluxclient.fcode.g_to_f import GcodeToFcode
+from fluxclient.fcode.f_to_g import FcodeToGcode, validate_fcode
+from tests.fcode.test_g_to_f import GCODE
+
+
+class Stream(BytesIO):
+    """a socket like stream"""
+    def seekable(self):
+        return False
+
+
+class ValidateFcodeTest(unittest.TestCase):
+    def setUp(self):
+        conv = GcodeToFcode()
+        conv.md['HEAD_TYPE'] = 'EXTRUDER'
+        conv.image = b'fake png'
+        output = BytesIO()
+        conv.process(iter(GCODE.splitlines(True)), output)
+        self.fcode = output.getvalue()
+
+    def test_validate(self):
+        for stream in (BytesIO, Stream):
+            result, md = validate_fcode(stream(self.fcode), chunk_size=7)
+            self.assertEqual(result, FcodeToGcode().upload_content(self.fcode))
+            self.assertEqual(result, 'ok')
+            self.assertIsInstance(md['MAX_R'], float)
+            self.assertIsInstance(md['TIME_COST'], float)
+
+            broken = bytearray(self.fcode)
+            broken[20] ^= 1  # in script
+            self.assertEqual(validate_fcode(stream(bytes(broken)))[0], 'broken')
+            self.assertEqual(validate_fcode(stream(bytes(broken)), check_crc=False)[0], 'ok')
+            self.assertEqual(validate_fcode(stream(self.fcode[:-1]))[0], 'broken')
+
+    def test_bad_sizes(self):
+        script_size = struct.unpack('<I', self.fcode[8:12])[0]
+        meta_at = 16 + script_size
+        for stream in (BytesIO, Stream):
+            # header only, claiming a huge script or metadata
+            self.assertEqual(validate_fcode(stream(b'FCx0001\n' + b'\xf0\xff\xff\xff' * 2))[0], 'broken')
+            self.assertEqual(validate_fcode(stream(b'FCx0001\n' + b'\x00' * 8 + b'\xf0\xff\xff\xff' + b'\x00' * 4))[0], 'broken')
+            oversized = self.fcode[:meta_at] + b'\xf0\xff\xff\xff' + self.fcode[meta_at + 4:]
+            self.assertEqual(validate_fcode(stream(oversized))[0], 'broken')
+            self.assertEqual(validate_fcode(stream(self.fcode[:meta_at + 10]))[0], 'broken')  # truncated metadata
+
+    def test_out_of_bound(self):
+        conv = GcodeToFcode()
+        output = BytesIO()
+        conv.process(iter(['G1 X100 Y0 Z10 F3000\n']), output)
+        fcode = output.getvalue()
+        self.assertEqual(validate_fcode(BytesIO(fcode))[0], 'out_of_bound')
+        self.assertEqual(FcodeToGcode().upload_content(fcode), 'out_of_bound')
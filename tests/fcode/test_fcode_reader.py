@@ -0,0 +1,49 @@
+from io import StringIO
+import tempfile
+import unittest
+
+import numpy as np
+
+from fluxclient.fcode.g_to_f import GcodeToFcode
+from fluxclient.fcode.f_to_g import FcodeToGcode
+from fluxclient.fcode.fcode_reader import FcodeReader
+from tests.fcode.test_g_to_f import GCODE
+
+
+class FcodeReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.fcode = tempfile.NamedTemporaryFile()
+        conv = GcodeToFcode()
+        conv.md['HEAD_TYPE'] = 'EXTRUDER'
+        conv.image = b'fake png'
+        conv.process(iter(GCODE.splitlines(True)), self.fcode)
+        conv.T.join()
+        self.fcode.flush()
+
+    def tearDown(self):
+        self.fcode.close()
+
+    def test_read(self):
+        with open(self.fcode.name, 'rb') as f:
+            buf = f.read()
+        f_to_g = FcodeToGcode(buf)
+        gcode = StringIO()
+        f_to_g.f_to_g(gcode)
+        g1 = [line.split() for line in gcode.getvalue().splitlines() if line.startswith('G1')]
+
+        with FcodeReader(self.fcode.name) as reader:
+            self.assertTrue(reader.check())
+            self.assertEqual(reader.get_metadata(), f_to_g.get_metadata())
+            self.assertEqual(reader.get_img(), b'fake png')
+
+            moves = reader.get_moves()
+            self.assertEqual(len(moves), len(g1))
+            for move, words in zip(moves, g1):
+                for word in words[1:]:
+                    axis = word[0] if word[0] != 'E' else 'E1'
+                    self.assertAlmostEqual(float(move[axis]), float(word[1:]), places=3)
+
+            self.assertEqual(reader.layer_count(), 2)
+            self.assertEqual(sum(len(m) for m in reader.iter_layers()), len(moves))
+            z = reader.get_moves(1)['Z']
+            self.assertEqual(z[~np.isnan(z)][0], np.float32(0.5))
@@ -0,0 +1,170 @@
+from copy import deepcopy
+from io import BytesIO
+import pickle
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from fluxclient.fcode.g_to_f import GcodeToFcode, arc, split_layers
+from fluxclient.fcode.fcode_base import FcodeBase, PathStore
+from fluxclient.utils._utils import Tools
+
+GCODE = """;Generated
+M107
+M104 S200
+G28 ; home all axes
+G1 Z5 F5000 ; lift nozzle
+M109 S200
+G21
+G90
+M82
+G92 E0
+G1 Z0.300 F7800.000 ; move to next layer (0)
+G1 X10.5 Y-3.25 ; move to first perimeter point
+G1 X12.000 Y-2.000 E0.51234 ; perimeter
+G1 X14.000 Y-2.000 E0.91234 ; perimeter
+G1 E-1.00000 F2400.00000 ; retract
+G1 F1800
+G1 X-20 Y20 E3.1 ; infill
+M106 S128
+G91
+G1 X1 Y-1 E0.5
+G1 Z0.2 ; lift
+G90
+G2 X-18 Y22 I1 J1 E3.5
+G1 Z0.500 F7800.000 ; move to next layer (1)
+G92 E0
+G1 X30 Y30 E1.2 ; support material
+G4 P100
+G1 X1.5.5 Y2
+G1X3Y4
+  G0 X5 Y6
+G1 X7 Y8 X9 ; dup
+G1 X40 Y30 E2.4 ; skirt
+M104 S0
+G28 X0
+M84
+"""
+
+
+def script_of(fcode):
+    """fcode until script crc, metadata has the converting time in it"""
+    return fcode[:16 + struct.unpack('<I', fcode[8:12])[0]]
+
+
+class GcodeToFcodeTest(unittest.TestCase):
+    def convert(self, lines, block_lines=None):
+        conv = GcodeToFcode()
+        conv.md['HEAD_TYPE'] = 'EXTRUDER'
+        output = BytesIO()
+        if block_lines is None:  # reference: one line at a time
+            output.write(conv.header())
+            output.write(b'\x00\x00\x00\x00')
+            conv.script_length = 0
+            comment_list = []
+            for line in lines:
+                conv.process_line(line, output, comment_list)
+            conv.finish(output, comment_list)
+        else:
+            self.assertIsNone(conv.process(iter(lines), output, block_lines))
+        conv.T.join()
+        conv.md.pop('CREATED_AT')
+        return script_of(output.getvalue()), conv.md, conv.path.to_list()
+
+    def test_block_conversion(self):
+        lines = GCODE.splitlines(True)
+        # a run long enough to be vectorized
+        moves = ['G1 X%d Y%.1f E%.2f%s\n' % (i, -i / 2, 4 + i / 10, ' ; infill' if i % 7 else '') for i in range(40)]
+        lines = (lines[:25] + moves + lines[25:]) * 3
+        script, md, path = self.convert(lines)
+        for block_lines in (1, 5, 1000):
+            self.assertEqual(self.convert(lines, block_lines), (script, md, path))
+
+    def test_unseekable_output(self):
+        class Sink(BytesIO):
+            def seekable(self):
+                return False
+
+            def seek(self, *args):
+                raise OSError('not seekable')
+
+        lines = GCODE.splitlines(True)
+        script, md, path = self.convert(lines, 1000)
+        conv = GcodeToFcode()
+        conv.md['HEAD_TYPE'] = 'EXTRUDER'
+        output = Sink()
+        self.assertIsNone(conv.process(iter(lines), output))
+        conv.T.join()
+        conv.md.pop('CREATED_AT')
+        self.assertEqual((script_of(output.getvalue()), conv.md), (script, md))
+
+    def test_path_store(self):
+        conv = GcodeToFcode()
+        conv.process(iter(GCODE.splitlines(True)), BytesIO())
+        conv.T.join()
+        path = conv.path.to_list()
+        self.assertEqual(conv.path_js, Tools().path_to_js(path).decode())
+        self.assertEqual(conv.get_path('list'), path)
+        self.assertIs(conv.get_path('store'), conv.path)
+
+        trimmed = pickle.loads(pickle.dumps(conv.path.trim_ends()))
+        path = FcodeBase.trim_ends(deepcopy(path))
+        self.assertEqual(trimmed.to_list(), path)
+        self.assertEqual(trimmed.to_js(), Tools().path_to_js(path).decode())
+
+    def test_binary_path(self):
+        conv = GcodeToFcode()
+        conv.process(iter(GCODE.splitlines(True)), BytesIO())
+        path = conv.path.trim_ends()
+
+        self.assertEqual(PathStore.from_binary(path.to_binary(quantize=False)).to_list(), path.to_list())
+        quantized = PathStore.from_binary(path.to_binary())
+        for layer, origin in zip(quantized.to_list(), path.to_list()):
+            self.assertEqual(len(layer), len(origin))
+            for p, q in zip(layer, origin):
+                self.assertEqual(p[3], q[3])
+                for a, b in zip(p[:3], q[:3]):
+                    self.assertAlmostEqual(a, b, places=2)
+
+        decimated = PathStore.from_binary(path.to_binary(tolerance=5.))
+        self.assertEqual(len(decimated), len(path))
+        self.assertLess(len(decimated.types), len(quantized.types))
+
+    def test_arc_tolerance(self):
+        small = arc([0.5, 0, 0], [0, 0.5, 0], [0, 0, 0], clock=False, tolerance=0.01)
+        large = arc([75, 0, 0], [0, 75, 1], [0, 0, 0], clock=False, tolerance=0.01)
+        self.assertLess(len(small), 10)
+        self.assertGreater(len(large), 4 * len(small))
+        self.assertEqual(large[-1].tolist(), [75 * np.cos(np.pi / 2), 75., 1.])
+        for points, r in ((small, 0.5), (large, 75)):
+            mid = (points[1:, :2] + points[:-1, :2]) / 2  # farthest point of a chord from the arc
+            self.assertLessEqual((r - np.hypot(mid[:, 0], mid[:, 1])).max(), 0.01)
+        self.assertEqual(len(arc([1, 0, 0], [0, 1, 0], [0, 0, 0], sample_n=100)), 101)
+
+    def process_file(self, lines, chunk_size):
+        with tempfile.NamedTemporaryFile('w', suffix='.gcode') as f:
+            f.writelines(lines)
+            f.flush()
+            conv = GcodeToFcode()
+            conv.md['HEAD_TYPE'] = 'EXTRUDER'
+            output = BytesIO()
+            self.assertIsNone(conv.process_file(f.name, output, processes=2, chunk_size=chunk_size))
+            conv.T.join()
+            conv.md.pop('CREATED_AT')
+        return script_of(output.getvalue()), conv.md, conv.path.to_list()
+
+    def test_process_file(self):
+        lines = GCODE.splitlines(True) * 20
+        with tempfile.NamedTemporaryFile('w', suffix='.gcode') as f:
+            f.writelines(lines)
+            f.flush()
+            self.assertGreater(len(split_layers(f.name, 1000)), 10)
+        self.assertEqual(self.process_file(lines, 1000), self.convert(lines, 1000))
+
+    def test_process_file_fallback(self):
+        # moves of tool 3 go line by line, their text is not sent back by workers and has to be read again
+        moves = ['G1 X%d Y%d ; travel\n' % (i, -i) for i in range(40)]
+        lines = GCODE.splitlines(True) * 5 + ['M104 T3 S200\n'] + moves + ['M104 T0 S200\n'] + moves
+        self.assertEqual(self.process_file(lines, 1000), self.convert(lines, 1000))
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+from io import BytesIO, StringIO
+
+from fluxclient.fcode.f_to_g import validate_fcode
+from fluxclient.laser.tools import Circle, Grid
+
+
+class TestTools:
+    def test_circle_fcode(self):
+        m_circle = Circle()
+        fcode, m_GcodeToFcode = m_circle.fcode_generate()
+        result, md = validate_fcode(BytesIO(fcode))
+        assert result != 'broken'
+        assert md['MAX_R'] >= m_circle.radius
+
+    def test_grid_gcode(self):
+        m_grid = Grid()
+        gcode = m_grid.gcode_generate()
+        stream = StringIO()
+        m_grid.export_to_stream(stream)
+        assert stream.getvalue() == gcode
+        assert gcode.endswith('\n')
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+from io import BytesIO
+from math import pi
+
+import numpy as np
+
+from fluxclient.printer import mesh_tools
+
+
+class TestMeshTools:
+    def test_transform(self):
+        points = np.array([[0, 0, 0], [2, 0, 0], [0, 4, 0]], np.float32)
+        result = mesh_tools.transform(points, [10, 0, 1, 0, 0, pi / 2, 1, 1, 2])
+        assert np.allclose(result, [[12, -1, 1], [12, 1, 1], [8, -1, 1]], atol=1e-6)
+
+    def test_merge_cut(self):
+        points = np.array([[0, 0, 1], [1, 0, 1], [0, 1, 1]], np.float32)
+        faces = np.array([[0, 1, 2]])
+        lower = points - [0, 0, 1.5]
+        lower[0, 2] = 1
+        points, faces = mesh_tools.merge([(points, faces), (lower, faces)])
+        assert faces.tolist() == [[0, 1, 2], [3, 4, 5]]
+
+        points, faces = mesh_tools.cut(points, faces, 0)
+        assert len(faces) == 2
+        assert faces[0].tolist() == [0, 1, 2]
+        assert (points[faces[1]][:, 2] >= 0).all()
+
+        points[5, 2] = 0.5  # one vertex under
+        points, faces = mesh_tools.cut(points[:6], np.array([[3, 4, 5]]), 0)
+        assert len(faces) == 3
+
+    def test_write_stl(self):
+        points = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], np.float32)
+        output = BytesIO()
+        mesh_tools.write_stl(points, np.array([[0, 1, 2]]), output)
+        facets = np.frombuffer(output.getvalue(), mesh_tools.STL_FACET, offset=84)
+        assert len(facets) == 1
+        assert facets['normal'].tolist() == [[0, 0, 1]]
+        assert (facets['vertex'][0] == points).all()
@@ -8,7 +8,11 @@ import unittest
 import random
 import string
 
+import numpy as np
+
 from fluxclient.printer.stl_slicer import StlSlicer
+from fluxclient.printer.mesh_cache import MeshCache
+from fluxclient.printer import ascii_mesh
 
 
 @pytest.fixture(scope="module", params=["tests/printer/data/cube_ascii.stl", "tests/printer/data/cube.stl"])
@@ -49,6 +53,30 @@ class TestPrinter:
     def test_read_obj(self, obj_binary):
         StlSlicer.read_obj(obj_binary)
 
+    def test_read_ascii_chunks(self, stl_binary, obj_binary):
+        # parsing chunk by chunk gives the same mesh as a whole
+        points, faces = StlSlicer.read_stl(stl_binary)
+        points_obj, faces_obj = StlSlicer.read_obj(obj_binary)
+        if StlSlicer.ascii_or_binary(stl_binary, '<'):
+            normals, vertices = ascii_mesh.read_ascii_stl(stl_binary)
+            bounds = ascii_mesh.chunk_bounds(stl_binary, b'endfacet', 100)
+            assert len(bounds) > 1
+            chunks = [ascii_mesh.parse_stl_chunk(stl_binary, start, end) for start, end in bounds]
+            assert (np.concatenate([c[0] for c in chunks]) == normals).all()
+            assert (np.concatenate([c[1] for c in chunks]) == vertices).all()
+            assert len(vertices) == len(faces)
+
+        bounds = ascii_mesh.chunk_bounds(obj_binary, b'\n', 100)
+        chunks = [ascii_mesh.parse_obj_chunk(obj_binary, start, end) for start, end in bounds]
+        assert (np.concatenate([c[0] for c in chunks]) == points_obj).all()
+        assert (np.concatenate([c[1] for c in chunks]) - 1 == faces_obj).all()
+
+        # lines numpy can't parse at once
+        obj = b'v 0 0 0\nv 1 0 0\n  v 0 1 0 \nf 1/1 2//2 3 4\nf -3 -2 -1\n'
+        points_obj, faces_obj = StlSlicer.read_obj(obj)
+        assert points_obj.tolist() == [[0, 0, 0], [1, 0, 0], [0, 1, 0]]
+        assert faces_obj.tolist() == [[0, 1, 2], [0, 1, 2]]
+
     def test_upload(self, stl_binary):
         _stl_slicer = StlSlicer('')
         assert _stl_slicer.upload('tmp', b'') is False
@@ -66,6 +94,41 @@ class TestPrinter:
         _stl_slicer.duplicate('tmp', 'tmp2')
         assert 'tmp2' in _stl_slicer.models
 
+    def test_upload_cache(self, stl_binary, obj_binary, tmpdir):
+        _stl_slicer = StlSlicer('')
+        _stl_slicer.mesh_cache = MeshCache(budget=0, spill_dir=str(tmpdir))
+        _stl_slicer.upload('tmp', stl_binary)
+        _stl_slicer.upload('tmp2', stl_binary)
+        assert _stl_slicer.models['tmp'] is _stl_slicer.models['tmp2']
+
+        _stl_slicer.upload('tmp3', obj_binary, 'obj')  # pushes the stl one out to disk
+        assert len(tmpdir.listdir()) == 1
+        _stl_slicer.upload('tmp4', stl_binary)
+        assert (_stl_slicer.models['tmp4'].points == _stl_slicer.models['tmp'].points).all()
+        assert (_stl_slicer.models['tmp4'].faces == _stl_slicer.models['tmp'].faces).all()
+
+    def test_decimate(self, obj_binary):
+        _stl_slicer = StlSlicer('')
+        cache = _stl_slicer.mesh_cache = MeshCache()
+        _stl_slicer.upload('tmp', obj_binary, 'obj')
+        _stl_slicer.set('tmp', [0, 0, 100, 0, 0, 0, 1, 1, 1])
+        entry = _stl_slicer.models['tmp']
+        target = len(entry.faces) // 2
+
+        _stl_slicer.config = _stl_slicer.config.updated({'flux_decimate': str(target), 'resolution': '1000'})
+        points, faces = _stl_slicer.merge_models(['tmp'])
+        assert 0 < len(faces) <= target
+        assert entry.decimate(target, 1000.) is entry.decimate(target, 1000.)
+        assert entry._mesh is None  # only the decimated arrays are kept
+        assert cache.size == entry.counted == entry.nbytes  # counted by merge_models
+        cache.budget = 0
+        cache.put('other', np.zeros((0, 3)), np.zeros((0, 3), np.int32))
+        assert cache.size == 0
+
+        _stl_slicer.config = _stl_slicer.config.updated({'flux_decimate': '0'})
+        points, faces = _stl_slicer.merge_models(['tmp'])
+        assert len(faces) == len(entry.faces)
+
     def test_upload_image(self, img_buf):
         _stl_slicer = StlSlicer('')
         _stl_slicer.upload_image(img_buf)
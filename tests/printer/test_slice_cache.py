@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import os
+
+from fluxclient.fcode.fcode_base import PathStore
+from fluxclient.printer.slice_cache import SliceCache, slice_digest
+
+
+class TestSliceCache:
+    def test_digest(self):
+        key = slice_digest('slic3r', [('mesh', [0, 0, 0, 0, 0, 0, 1, 1, 1])], {'layer_height': '0.2'})
+        assert key == slice_digest('slic3r', [('mesh', (0., 0, 0, 0, 0, 0, 1, 1, 1))], {'layer_height': ' 0.2 '})
+        assert key != slice_digest('slic3r', [('mesh', [0, 0, 1, 0, 0, 0, 1, 1, 1])], {'layer_height': '0.2'})
+        assert key != slice_digest('slic3r', [('mesh', [0, 0, 0, 0, 0, 0, 1, 1, 1])], {'layer_height': '0.3'})
+
+    def test_put_get(self, tmpdir):
+        cache = SliceCache(str(tmpdir.join('cache')))
+        gcode = tmpdir.join('a.gcode')
+        gcode.write('G1 X1 Y1\n')
+        path = PathStore([0, 0, 0], 1)
+        path.append([1, 2, 3], 2)
+
+        assert cache.get('a', '-g') is None
+        cache.put('a', str(gcode), b'fcode', [1.5, 2.], path, ['warning'])
+        output, metadata, cached_path, warnings = cache.get('a', '-g')
+        assert output == b'G1 X1 Y1\n'
+        assert metadata == [1.5, 2.] and warnings == ['warning']
+        assert cached_path.to_list() == path.to_list()
+        assert cache.get('a', '-f')[0] == b'fcode'
+
+        os.utime(str(tmpdir.join('cache', 'a.json')), (0, 0))  # make it the oldest one
+        cache.budget = 200  # one result
+        cache.put('b', str(gcode), b'fcode', [0., 0.], None)
+        assert cache.get('a', '-f') is None
+        assert cache.get('b', '-f')[2] is None
+
+    def test_private(self, tmpdir):
+        gcode = tmpdir.join('a.gcode')
+        gcode.write('G1 X1 Y1\n')
+        cache = SliceCache(str(tmpdir.join('cache')))
+        cache.put('a', str(gcode), b'fcode', [0., 0.], None)
+        assert os.stat(cache.cache_dir).st_mode & 0o777 == 0o700
+
+        shared = tmpdir.mkdir('shared')
+        shared.chmod(0o777)
+        planted = SliceCache(str(shared))
+        for ext in ('.json', '.gcode', '.fc', '.path'):
+            tmpdir.join('cache', 'a' + ext).copy(shared.join('a' + ext))
+        assert planted.get('a', '-g') is None
+        planted.put('b', str(gcode), b'fcode', [0., 0.], None)
+        assert not shared.join('b.fc').exists()
+
+    def test_atomic(self, tmpdir):
+        cache = SliceCache(str(tmpdir.join('cache')))
+        gcode = tmpdir.join('a.gcode')
+        gcode.write('G1 X1 Y1\n')
+        cache.put('a', str(gcode), b'fcode', [0., 0.], None)
+        assert sorted(os.listdir(cache.cache_dir)) == ['a.fc', 'a.gcode', 'a.json', 'a.path']
+
+        tmpdir.join('cache', 'a.fc').write(b'fcode of another put', 'wb')
+        assert cache.get('a', '-f') is None
+        assert cache.get('a', '-g')[0] == b'G1 X1 Y1\n'
+
+        tmpdir.join('cache', 'b.fc.tmp').write(b'left by a failed put' * 10, 'wb')
+        cache.budget = 200  # one result
+        cache.put('c', str(gcode), b'fcode', [0., 0.], None)
+        assert not tmpdir.join('cache', 'b.fc.tmp').exists()
+        assert cache.get('c', '-f')[0] == b'fcode'
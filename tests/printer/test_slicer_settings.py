@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import os
+
+import pytest
+
+from fluxclient.printer import ini_string
+from fluxclient.printer.slicer_settings import SlicerSettings, IniCache, parse_setting_lines
+
+
+def write_ini(file_path, content, delete=None):
+    with open(file_path, 'w') as f:
+        for key in content:
+            if not (delete and any(j in key for j in delete)):
+                f.write('%s=%s\n' % (key, content[key]))
+
+
+class TestSlicerSettings:
+    def test_settings(self):
+        settings = SlicerSettings.parse(ini_string.split('\n'))
+        assert settings['layer_height'] == '0.2' and settings.getfloat('fill_density') == 20.
+        with pytest.raises(TypeError):
+            settings['layer_height'] = '0.3'
+
+        new = settings.updated({'layer_height': '0.3'})
+        assert settings['layer_height'] == '0.2' and new['layer_height'] == '0.3'
+        assert new.digest != settings.digest
+        assert new.updated({'layer_height': '0.2'}).digest == settings.digest
+        assert settings.updated({'layer_height': '0.2'}) is settings
+
+        assert settings.check('layer_height', 'default') == 'ok'
+        assert settings.check('no_such_key', '1') == 'key not exist: no_such_key'
+        assert settings.check('layer_height', '9') != 'ok'
+        assert settings.check('fill_pattern', 'line') == 'ok'
+
+    def test_parse_setting_lines(self):
+        pairs, bad_lines = parse_setting_lines('a = 1 # comment\n\nb=2\nsyntax error')
+        assert pairs == ((1, 'a', '1'), (3, 'b', '2'))
+        assert bad_lines == ((4, 'syntax error: syntax error'),)
+
+    def test_ini_cache(self, tmpdir):
+        cache = IniCache(str(tmpdir.join('cache')), max_files=1)
+        settings = SlicerSettings({'layer_height': '0.2', 'flux_raft': '1'})
+        path = cache.get(settings, write_ini, ('flux_',))
+        with open(path) as f:
+            assert f.read() == 'layer_height=0.2\n'
+        os.utime(path, (0, 0))
+        assert cache.get(SlicerSettings(settings), write_ini, ('flux_',)) == path
+        assert os.path.getmtime(path) > 0  # marked as used
+
+        other = cache.get(settings, write_ini)
+        assert other != path and os.path.isfile(other)
+        assert len(tmpdir.join('cache').listdir()) == 1
+
+    def test_ini_cache_private(self, tmpdir):
+        settings = SlicerSettings({'layer_height': '0.2'})
+        path = IniCache(str(tmpdir.join('cache'))).get(settings, write_ini)
+        assert os.stat(str(tmpdir.join('cache'))).st_mode & 0o777 == 0o700
+        with open(path, 'w') as f:
+            f.write('post_process=evil\n')
+        path = IniCache(str(tmpdir.join('cache'))).get(settings, write_ini)  # not written by this one
+        with open(path) as f:
+            assert f.read() == 'layer_height=0.2\n'
+
+        shared = tmpdir.mkdir('shared')
+        shared.chmod(0o777)
+        path = IniCache(str(shared)).get(settings, write_ini)
+        assert not path.startswith(str(shared)) and os.stat(os.path.dirname(path)).st_mode & 0o077 == 0
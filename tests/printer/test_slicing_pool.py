@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+from threading import Event
+
+from fluxclient.printer.slicing_pool import SlicingPool
+
+
+def wait_then_complete(job, started, release):
+    started.set()
+    release.wait(5)
+    if job.cancelled:
+        return
+    job.emit('complete', length=0, time=0., filament_length=0., result=[b'', [0., 0.], None])
+
+
+class TestSlicingPool:
+    def test_replace(self):
+        pool = SlicingPool(1)
+        started, release = Event(), Event()
+        events = []
+        old = pool.submit('scene', wait_then_complete, (started, release))
+        assert started.wait(5)
+        pending = pool.submit('scene', wait_then_complete, (Event(), release))
+        new = pool.submit('scene', wait_then_complete, (Event(), release), callback=lambda job, event: events.append(event))
+        release.set()
+        new.future.result(5)
+
+        assert old.cancelled and old.get_events() == []
+        assert pending.future.cancelled()
+        assert [e['slice_status'] for e in new.get_events()] == ['complete']
+        assert events[0]['job'] == new.id
+        assert pool.jobs == {}
+        pool.shutdown()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import numpy as np
+
+from fluxclient.scanner.freeless import freeless
+from fluxclient.scanner.scan_settings import ScanSetting
+
+
+class TestFreeless:
+    def test_sub_process(self):
+        settings = ScanSetting()
+        settings.img_width, settings.img_height = 40, 5
+        settings.MINLaserRange, settings.MAXLaserRange = 2, 6
+        settings.LaserRangeMergeDistance = 3
+        fs = freeless(settings.laserX_L, settings.laserZ_L, settings)
+
+        img1 = np.zeros((5, 40, 3), np.uint8)
+        img2 = img1.copy()
+        img2[0, 10:14] = 100  # center 11.5 -> 12
+        img2[1, 10:13] = 100  # merged with the next one into [10, 18)
+        img2[1, 15:18] = [[50] * 3, [100] * 3, [100] * 3]
+        img2[2, 0:10] = 100  # too wide
+        img2[2, 30:33] = 100
+        img2[3, 5:8] = 100  # nearest to the previous row is chosen
+        img2[3, 28:31] = 100
+        img2[4, 37:] = 100  # reaching the edge
+        assert fs.subProcess(img1, img2, settings.img_height) == [[0, 12], [1, 13], [2, 31], [3, 29]]
+        assert fs.firstRowLaserCol == 10
+
+    def test_img_to_points(self):
+        settings = ScanSetting()
+        fs = freeless(settings.laserX_R, settings.laserZ_R, settings)
+        img = np.arange(480 * 640 * 3).astype(np.uint8).reshape(480, 640, 3)
+        indices = [[240, 300], [100, 330], [200, 645], [479, 0], [0, 639]]
+
+        for _ in range(2):
+            points = fs.img_to_points(img, None, indices, 100, 'R', 10)
+            expected = []
+            for y, x in indices:
+                f, point = fs.intersectLaserPlane(fs.calculateCameraRay(x, y))
+                p = point[0]
+                if f and p[0] ** 2 + p[2] ** 2 < 70 ** 2 and -0.5 <= p[1] < 90:
+                    b, g, r = img[y, x - 10].tolist()
+                    expected.append([p[2], -p[0], p[1], r, g, b, 100, x, y])  # rotated by -90 degree
+            assert len(points) == len(expected) > 0
+            for p, q in zip(points, expected):
+                assert np.allclose(p[:3], q[:3]) and p[3:] == q[3:]
+            settings.cameraY += 1  # ray table is computed again
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+import os
+
+from fluxclient.scanner.image_to_pc import image_to_pc, points_to_cloud
+from fluxclient.scanner.scan_settings import ScanSetting
+
+DATA = os.path.join(os.path.dirname(__file__), 'data', 'inso')
+
+
+class TestImageToPc:
+    def test_feed_async(self):
+        settings = ScanSetting()
+        steps = sorted(int(name[:3]) for name in os.listdir(DATA) if name.endswith('_O.png'))
+        images = [[open(os.path.join(DATA, '%03d_%s.png' % (i, j)), 'rb').read() for j in 'OLR'] for i in steps]
+
+        sync, pipelined = image_to_pc(400, settings), image_to_pc(400, settings)
+        expected = [sync.feed(*buffers, step=i, l_cab=0, r_cab=0) for i, buffers in zip(steps, images)]
+        futures = [pipelined.feed_async(*buffers, step=i, l_cab=0, r_cab=0) for i, buffers in zip(steps, images)]
+        for f, (points_L, points_R) in zip(futures, expected):
+            assert f.result() == [b''.join(points_L), b''.join(points_R)]
+
+        pipelined.wait()
+        assert pipelined.points_L == sync.points_L and pipelined.points_R == sync.points_R
+        assert sum(len(p) for p in sync.points_L + sync.points_R) > 0
+
+    def test_merge(self):
+        m = image_to_pc(400, ScanSetting())
+        m.clouds_R = [points_to_cloud([[0, 0, 0, 200, 200, 200, 67, 0, 1], [1, 1, 1, 100, 100, 100, 10, 0, 2]])]
+        m.clouds_L = [points_to_cloud([[2, 2, 2, 0, 0, 0, 0, 0, 1],  # right is brighter, left ones are moved 67 steps
+                                       [3, 3, 3, 50, 50, 50, 0, 0, 1],  # blended again
+                                       [4, 4, 4, 10, 20, 30, 343, 0, 2]]),
+                      points_to_cloud([[5, 5, 5, 1, 2, 3, 5, 0, 2]])]
+        m.merge()
+        assert m.points_M == [[0, 0, 0, 75, 75, 75, 67, 0, 1],
+                              [1, 1, 1, 55, 60, 65, 10, 0, 2],
+                              [5, 5, 5, 1, 2, 3, 5, 0, 2]]
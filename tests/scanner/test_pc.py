@@ -84,3 +84,18 @@ class scan_toolTest(unittest.TestCase):
             tmp = tools.normalize(i)
             for k in range(3):
                 self.assertAlmostEqual(tmp[k], j[k])
+
+    def test_write_stl(self):
+        from io import BytesIO
+        buf = BytesIO()
+        tools.write_stl([[[0, 0, 0], [2, 0, 0], [0, 2, 0]], [[0, 0, 0], [1, 1, 1], [2, 2, 2]]], buf)
+        data = buf.getvalue()
+        self.assertEqual(len(data), 84 + 50 * 2)
+        self.assertEqual(struct.unpack('@I', data[80:84]), (2,))
+        self.assertEqual(struct.unpack('@12f', data[84:132]), (0, 0, 1, 0, 0, 0, 2, 0, 0, 0, 2, 0))
+        self.assertEqual(struct.unpack('@3f', data[134:146]), (0, 0, 0))  # degenerate
+
+        tri = [[0.1, 0.2, 0.3], [1.7, -0.3, 0.9], [-2.2, 0.4, 1.3]]  # normal from float64 points, as normal()
+        buf = BytesIO()
+        tools.write_stl([tri], buf)
+        self.assertEqual(buf.getvalue()[84:96], struct.pack('@3f', *tools.normalize(tools.normal(tri))))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import numpy as np
+import pytest
+
+_scanner = pytest.importorskip('fluxclient.scanner._scanner')  # needs pcl to build
+
+from fluxclient.scanner.pc_process import PcProcess
+from fluxclient.scanner.scan_settings import ScanSetting
+
+
+class TestPointCloudArray:
+    def test_from_buffer(self):
+        points = np.array([[1, 2, 3, 1, 0.5, 0], [-1.5, 0, 2, 0.2, 0.4, 1]], '<f4')
+        pc = _scanner.PointCloudXYZRGBObj.from_buffer(points.tobytes())
+        assert len(pc) == 2
+        assert pc.get_item(0) == [1, 2, 3, 255, 128, 0] and pc.get_item(1) == [-1.5, 0, 2, 51, 102, 255]
+        assert pc.to_array().tolist() == [pc.get_item(0), pc.get_item(1)]
+
+        pc.push_back_array(np.array([[0, 0, 0, 300, -1, 7.6]], np.float32))
+        assert pc.get_item(2) == [0, 0, 0, 255, 0, 8]
+
+    def test_upload_dump(self):
+        points = np.random.RandomState(0).uniform(-10, 10, (100, 6)).astype('<f4')
+        points[:, 3:] = np.arange(300).reshape(100, 3) % 256 / np.float64(255)
+        m = PcProcess(ScanSetting())
+        m.upload('a', points[:60].tobytes(), points[60:].tobytes(), 60, 40)
+        assert m.dump('a') == (60, 40, points.tobytes())
+
+        m.apply_transform('a', 0, 0, 0, 0, 0, 0, 'b')
+        assert [len(pc) for pc in m.clouds['b']] == [60, 40]